@@ -11,7 +11,7 @@ import dataclasses
 from funcy import lmap, lfilter
 import fire
 import os
-
+from unitsyncer.columnar import read_records
 
 plt.style.use("_mpl-gallery")
 plt.rcParams["pdf.fonttype"] = 42
@@ -71,12 +71,22 @@ def main(
     alpha: float = 1,
     fontsize: int = 18,
 ):
-
-    with open(input_dataset_path, "r") as fp:
-        lines = fp.readlines()
-
-    with Pool(nproc) as p:
-        objs = p.map(json.loads, lines)
+    """
+    Args:
+        input_dataset_path (str): jsonl dataset, or a Parquet file or directory
+            written by `main.py --output_format=parquet`
+    """
+    if input_dataset_path.endswith(".parquet") or os.path.isdir(input_dataset_path):
+        # only the columns used by the analysis are read
+        objs = read_records(
+            input_dataset_path, columns=["test_id", "test", "code", "lang"]
+        )
+    else:
+        with open(input_dataset_path, "r") as fp:
+            lines = fp.readlines()
+
+        with Pool(nproc) as p:
+            objs = p.map(json.loads, lines)
 
     langs = ["python", "java", "go", "cpp", "js"]
 
@@ -4,7 +4,7 @@ from tree_sitter import Language, Parser, Tree
 from tree_sitter import Node
 from returns.maybe import Maybe, Nothing, Some
 from unitsyncer.common import UNITSYNCER_HOME
-from typing import Optional, Tuple
+from typing import Iterator, Optional, Tuple
 
 ASTLoc = tuple[int, int]
 
@@ -117,3 +117,30 @@ def flatten_postorder(
     if node_type is None or root.type == node_type:
         nodes.append(root)
     return nodes
+
+
+def iter_preorder(root: Node, node_type: Optional[str] = None) -> Iterator[Node]:
+    """iterate over the descendants of root in preorder without recursion
+
+    Args:
+        root (Node): root of tree, not included in the output
+        node_type (str | None): type of node to yield, if None yield all Node
+
+    Yields:
+        Node: descendants of root, in the order of ASTUtil.get_all_nodes_of_type
+    """
+    cursor = root.walk()
+    if not cursor.goto_first_child():
+        return
+    depth = 1
+    while True:
+        node = cursor.node
+        if node_type is None or node.type == node_type:
+            yield node
+        if cursor.goto_first_child():
+            depth += 1
+            continue
+        while not cursor.goto_next_sibling():
+            if depth == 1 or not cursor.goto_parent():
+                return
+            depth -= 1
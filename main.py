@@ -1,8 +1,29 @@
 """main script for UniTSyncer backend"""
+
 from tqdm import tqdm
-from unitsyncer.sync import Synchronizer, LSPSynchronizer
-from unitsyncer.rust_syncer import RustSynchronizer
-from unitsyncer.sansio_lsp_syncer import SansioLSPSynchronizer
+from unitsyncer.sync import Synchronizer, FocalCall, SourceResult
+from unitsyncer.server_pool import SynchronizerPool, new_synchronizer, worker_pool
+from unitsyncer.async_syncer import AsyncLSPSynchronizer
+from unitsyncer.journal import ResultJournal, start_over
+from unitsyncer.columnar import jsonl_to_parquet, require_pyarrow
+from unitsyncer import (
+    metrics,
+    definition_cache,
+    server_cache,
+    health,
+    profiles,
+    locality,
+    readiness,
+)
+from unitsyncer.workspace import java_module_of
+from unitsyncer.scheduler import (
+    CostLog,
+    WorkUnit,
+    plan,
+    run_timed,
+    scan_focal_files,
+)
+from unitsyncer.watchdog import Deadline, TimeoutLog, repo_deadline, share_deadlines
 from pylspclient.lsp_structs import LANGUAGE_IDENTIFIER, Location, Position, Range
 from returns.maybe import Maybe, Nothing, Some
 from returns.result import Result, Success, Failure
@@ -10,27 +31,40 @@ from unitsyncer.util import parallel_starmap as starmap, path2uri, convert_to_se
 from unitsyncer.common import CORES
 from unitsyncer.extract_def import get_def_header
 import math
+import asyncio
+import contextvars
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
 from unitsyncer.source_code import get_function_code
 import json
-import jsonlines
 import os
 from pathos.multiprocessing import ProcessPool
 import logging
 import fire
 from itertools import groupby
-import pathlib
+from collections import Counter
+from typing import Callable, Optional
+
+# number of focal objects looked up between two journal writes
+CHECKPOINT_EVERY = 64
 
 
 def id2path(func_id: str) -> str:
     return func_id.split("::")[0]
 
 
-def java_workdir_dict(objs: list[dict]) -> dict[str, list[dict]]:
+def java_workdir_dict(
+    objs: list[dict], repos_root: Optional[str] = None
+) -> dict[str, list[dict]]:
     """split a list of test ids into a dict of workdir to file path
     this solves the LSP TimeoutError for JAVA with too much subdirectories
 
     Args:
         objs (list[dict]): [focal_ids parsed into dict]
+        repos_root (str | None): if given, a test goes to the innermost Maven or
+            Gradle module containing it, else to the path before "/test"
 
     Returns:
         dict[str, list[dict]]: {workdir: [corresponding focal objects, ...], ...}
@@ -39,21 +73,31 @@ def java_workdir_dict(objs: list[dict]) -> dict[str, list[dict]]:
     for obj in objs:
         test_id = obj["test_id"]
         file_path = id2path(test_id)
-        workdir = file_path.split("/test")[0]
+        fallback = file_path.split("/test")[0]
+        if repos_root is None:
+            workdir = fallback
+        else:
+            workdir = java_module_of(repos_root, file_path).value_or(fallback)
         if workdir not in workdir_dict:
             workdir_dict[workdir] = []
         workdir_dict[workdir].append(obj)
     return workdir_dict
 
 
-def focal2result(syncer: Synchronizer, repos_root, obj):
+def prepare_focal(langID: str, repos_root, obj) -> tuple[dict, FocalCall]:
+    """build the result skeleton of a focal object and the call to look up
+
+    Args:
+        langID (str): language of the focal object as in LANGUAGE_IDENTIFIER
+
+    Returns:
+        tuple[dict, FocalCall]: ({test_id, test}, (focal_id, file_path, line, col))
+    """
     p = id2path(obj["test_id"])
     file_path = os.path.join(repos_root, p)
     src_lineno, src_col_offset = obj["focal_loc"]
     test_lineno, test_col_offset = obj["test_loc"]
 
-    langID = syncer.langID  # pylint: disable=invalid-name
-
     # only python ast is 1-indexed, tree-sitter and LSP are 0-indexed
     match langID:
         case LANGUAGE_IDENTIFIER.PYTHON:
@@ -71,20 +115,21 @@ def focal2result(syncer: Synchronizer, repos_root, obj):
                 Position(test_lineno, test_col_offset + 1),
             ),
         )
-        test, _, _ = get_function_code(fake_loc, syncer.langID).unwrap()
+        test, _, _ = get_function_code(fake_loc, langID).unwrap()
 
     result = {
         "test_id": obj["test_id"],
         "test": test,
     }
+    return result, (obj["focal_id"], file_path, src_lineno, src_col_offset)
+
 
+def finish_focal(
+    result: dict, obj, source: SourceResult, repos_root: str, langID: str
+) -> dict:
+    """fill the source code of the focal function into the result skeleton"""
     # todo: conform return format when Failure
-    match syncer.get_source_of_call(
-        obj["focal_id"],
-        file_path,
-        src_lineno,
-        src_col_offset,
-    ):
+    match source:
         case Success((code, docstring, code_id)):
             result["code_id"] = (
                 obj["focal_id"]
@@ -93,7 +138,7 @@ def focal2result(syncer: Synchronizer, repos_root, obj):
             )
             result["code"] = code
             result["docstring"] = docstring
-            result["test_header"] = get_def_header(test, langID)
+            result["test_header"] = get_def_header(result["test"], langID)
         case Failure(e):
             logging.debug(e)
             result["error"] = e
@@ -101,93 +146,463 @@ def focal2result(syncer: Synchronizer, repos_root, obj):
     return result
 
 
-def process_one_focal_file(
-    focal_file="./data/focal/ageitgey-face_recognition.jsonl",
-    repos_root="data/repos",
-    language="python",
-    skip_processed=True,
-) -> tuple[int, int]:
-    with open(focal_file) as f:
-        objs = [json.loads(line) for line in f.readlines()]
+def focals2results(
+    lookup: Callable[[list[FocalCall]], list[SourceResult]],
+    langID: str,
+    repos_root,
+    objs: list[dict],
+) -> list[dict]:
+    """look up the focal functions of objs in one pipelined batch
 
-    if len(objs) == 0:
-        return 0, 0
+    Args:
+        lookup (Callable[[list[FocalCall]], list[SourceResult]]): e.g.
+            get_sources_of_calls of a synchronizer, only called with the calls
+            missing from the definition cache
+    """
+    prepared = [prepare_focal(langID, repos_root, obj) for obj in objs]
+    sources = definition_cache.cached_lookup(
+        langID, [call for _, call in prepared], lookup
+    )
+    return [
+        finish_focal(result, obj, source, repos_root, langID)
+        for (result, _), obj, source in zip(prepared, objs, sources)
+    ]
 
-    n_focal = len(objs)
+
+def focal2result(syncer: Synchronizer, repos_root, obj):
+    return focals2results(
+        syncer.get_sources_of_calls, syncer.langID, repos_root, [obj]
+    )[0]
+
+
+def focal_workdirs(
+    objs: list[dict], language: str, repos_root: Optional[str] = None
+) -> dict[str, list[dict]]:
+    """group focal objects by the workdir their language server is started in"""
     match language:
         case LANGUAGE_IDENTIFIER.JAVA:
-            wd = java_workdir_dict(objs)
+            return java_workdir_dict(objs, repos_root)
         case _:
             first_test_id = objs[0]["test_id"]
             workdir = "/".join(id2path(first_test_id).split("/")[:2])
-            wd = {
-                workdir: objs,
-            }
+            return {workdir: objs}
+
 
-    success_results = []
-    failure_results = []
+def load_workdirs(
+    focal_file: str,
+    language: str,
+    repos_root: str,
+    workdirs: Optional[list[str]] = None,
+) -> dict[str, list[dict]]:
+    """focal objects of a focal file grouped by workdir
+
+    Args:
+        workdirs (list[str] | None): keep only these workdirs, all if None
+    """
+    with open(focal_file) as f:
+        objs = [json.loads(line) for line in f.readlines()]
+    if len(objs) == 0:
+        return {}
+    wd = focal_workdirs(objs, language, repos_root)
+    if workdirs is None:
+        return wd
+    return {workdir: wd[workdir] for workdir in workdirs if workdir in wd}
+
+
+def repo_name(focal_file: str) -> str:
+    return os.path.basename(focal_file).removesuffix(".jsonl")
+
+
+def metrics_file(focal_file: str) -> str:
+    """stage latencies are collected next to the output files"""
+    return os.path.join(os.path.dirname(source_files(focal_file)[0]), "metrics.jsonl")
+
+
+def timeouts_file(focal_file: str) -> str:
+    """repos that ran out of time are logged next to the output files"""
+    return os.path.join(os.path.dirname(source_files(focal_file)[0]), "timeouts.jsonl")
+
+
+def source_files(focal_file: str) -> tuple[str, str]:
+    """success and failure output files of a focal file"""
     source_file = focal_file.replace("focal", "source")
     success_file = source_file.replace(".jsonl", ".success.jsonl")
     failure_file = source_file.replace(".jsonl", ".failure.jsonl")
+    return success_file, failure_file
 
-    # check if this file is already processed
-    if skip_processed and os.path.exists(success_file) and os.path.exists(failure_file):
-        with open(success_file, "rb") as f:
-            n_succ = sum(1 for _ in f)
-        with open(failure_file, "rb") as f:
-            n_fail = sum(1 for _ in f)
 
-        if language == LANGUAGE_IDENTIFIER.JAVA:
-            return n_focal, n_succ
-        if n_succ + n_fail >= n_focal:
-            return n_focal, n_succ
+def process_one_focal_file(
+    focal_file="./data/focal/ageitgey-face_recognition.jsonl",
+    repos_root="data/repos",
+    language="python",
+    skip_processed=True,
+    pool: Optional[SynchronizerPool] = None,
+    max_inflight=8,
+    workdirs: Optional[list[str]] = None,
+    workspaces_per_repo=1,
+    deadline: Optional[float] = None,
+) -> tuple[int, int]:
+    """
+    Args:
+        skip_processed (bool): resume from the results already in the output
+            files, otherwise start them over; the units of a split repo share
+            the files, so for those the caller starts them over, see start_over
+        workdirs (list[str] | None): only process the focal objects of these
+            workdirs, used by the scheduler to split big repos
+        workspaces_per_repo (int): number of workdirs processed in parallel,
+            each with its own language server; pool is not used if above 1
+        deadline (float | None): seconds allowed to the repo, shared by the
+            units it is split into, see watchdog.repo_deadline; its servers are
+            killed when they pass and the results so far are kept
+    """
+    repos_root = os.path.abspath(repos_root)
+    wd = load_workdirs(focal_file, language, repos_root, workdirs)
+    objs = [obj for workdir_objs in wd.values() for obj in workdir_objs]
 
-    pathlib.Path(success_file).touch()
-    pathlib.Path(failure_file).touch()
+    if len(objs) == 0:
+        return 0, 0
 
+    n_focal = len(objs)
+    success_file, failure_file = source_files(focal_file)
+    if not skip_processed and workdirs is None:
+        start_over(success_file, failure_file)
     logging.debug(f"number of workdir_dict: {len(wd.keys())}")
-    repos_root = os.path.abspath(repos_root)
-    for workdir, workdir_objs in wd.items():
-        succ = []
-        fail = []
+    parallel = workspaces_per_repo > 1 and len(wd) > 1
+    if parallel:
+        pool = None
+    watchdog = Deadline(
+        repo_deadline(repo_name(focal_file), deadline), repo_name(focal_file)
+    )
+
+    def process_workdir(workdir: str, workdir_objs: list[dict]):
         full_workdir = os.path.join(repos_root, workdir)
         logging.debug(f"workdir: {full_workdir}")
-        syncer: Synchronizer
-
-        match language:
-            case LANGUAGE_IDENTIFIER.RUST:
-                syncer = RustSynchronizer(full_workdir, language)
-            case LANGUAGE_IDENTIFIER.GO:
-                syncer = SansioLSPSynchronizer(full_workdir, language)
-            case _:
-                syncer = LSPSynchronizer(full_workdir, language)
+        syncer: Optional[Synchronizer] = None
+
+        def lookup(calls: list[FocalCall]) -> list[SourceResult]:
+            # the server is only started once a call misses the definition cache
+            nonlocal syncer
+            if syncer is None:
+                with metrics.timer("initialize"):
+                    if pool is None:
+                        syncer = new_synchronizer(full_workdir, language, max_inflight)
+                        syncer.initialize(timeout=60)
+                    else:
+                        syncer = pool.acquire(full_workdir, language)
+                watchdog.watch(syncer)
+            return syncer.get_sources_of_calls(calls)
 
         try:
-            syncer.initialize(timeout=60)
-
-            for obj in workdir_objs:
-                result = focal2result(syncer, repos_root, obj)
-                if "error" in result:
-                    fail.append(result)
+            # lookups the server may have answered before it finished indexing
+            deferred: list[dict] = []
+            # journal results chunk by chunk to avoid losing data
+            for chunk, finished in locality.chunks(workdir_objs, CHECKPOINT_EVERY):
+                if watchdog.expired:
+                    break
+                results = focals2results(lookup, language, repos_root, chunk)
+                # lookups cut short by the watchdog are left for the next run
+                if watchdog.expired:
+                    break
+                if readiness.defers(language):
+                    deferred += [
+                        obj
+                        for obj, result in zip(chunk, results)
+                        if readiness.is_premature(result)
+                    ]
+                    results = [r for r in results if not readiness.is_premature(r)]
+                journal.write_all(results)
+                if syncer is not None:
+                    syncer.release([os.path.join(repos_root, f) for f in finished])
+
+            for chunk, _ in locality.chunks(deferred, CHECKPOINT_EVERY):
+                if watchdog.expired:
+                    break
+                results = focals2results(lookup, language, repos_root, chunk)
+                if watchdog.expired:
+                    break
+                journal.write_all(readiness.record_retry(results))
+
+            if syncer is not None:
+                if watchdog.expired and pool is not None:
+                    # the server was killed, it must not serve the next repo
+                    pool.discard(language)
+                elif pool is None:
+                    syncer.stop()
                 else:
-                    succ.append(result)
+                    watchdog.unwatch(syncer)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logging.debug(e)
+            if pool is None:
+                if syncer is not None:
+                    syncer.stop()
+            else:
+                pool.discard(language)
+
+    with (
+        metrics.scope(repo_name(focal_file), language),
+        ResultJournal(success_file, failure_file, resume=skip_processed) as journal,
+        watchdog,
+    ):
+        # resume at the first focal object without a result
+        todo = [
+            (workdir, [o for o in workdir_objs if o["test_id"] not in journal])
+            for workdir, workdir_objs in wd.items()
+        ]
+        todo = [(workdir, pending) for workdir, pending in todo if pending]
+
+        if parallel:
+            with ThreadPoolExecutor(workspaces_per_repo) as executor:
+                # each thread runs in its own copy of the metrics scope
+                contexts = [contextvars.copy_context() for _ in todo]
+                list(
+                    executor.map(
+                        lambda ctx, t: ctx.run(process_workdir, *t), contexts, todo
+                    )
+                )
+        else:
+            for t in todo:
+                process_workdir(*t)
+
+    if watchdog.expired:
+        TimeoutLog(timeouts_file(focal_file)).record(
+            repo_name(focal_file),
+            language,
+            list(wd.keys()),
+            watchdog.elapsed,
+            sum(obj["test_id"] in journal for obj in objs),
+            n_focal,
+        )
+    metrics.flush(metrics_file(focal_file))
+    return n_focal, sum(obj["test_id"] in journal.succeeded for obj in objs)
+
+
+async def process_one_focal_file_async(
+    focal_file: str,
+    repos_root: str,
+    language: str,
+    skip_processed=True,
+    max_inflight=8,
+    workdirs: Optional[list[str]] = None,
+    workspaces_per_repo=1,
+    deadline: Optional[float] = None,
+) -> tuple[int, int]:
+    """process_one_focal_file with an AsyncLSPSynchronizer per workdir"""
+    if language == LANGUAGE_IDENTIFIER.RUST:
+        # RustSynchronizer answers from its own index, not from a server
+        return await asyncio.to_thread(
+            process_one_focal_file,
+            focal_file,
+            repos_root,
+            language,
+            skip_processed,
+            max_inflight=max_inflight,
+            workdirs=workdirs,
+            deadline=deadline,
+        )
+
+    repos_root = os.path.abspath(repos_root)
+    wd = load_workdirs(focal_file, language, repos_root, workdirs)
+    objs = [obj for workdir_objs in wd.values() for obj in workdir_objs]
+
+    if len(objs) == 0:
+        return 0, 0
+
+    n_focal = len(objs)
+    success_file, failure_file = source_files(focal_file)
+    if not skip_processed and workdirs is None:
+        start_over(success_file, failure_file)
+    slots = asyncio.Semaphore(max(workspaces_per_repo, 1))
 
-            syncer.stop()
+    async def process_workdir(workdir: str, workdir_objs: list[dict]):
+        full_workdir = os.path.join(repos_root, workdir)
+        logging.debug(f"workdir: {full_workdir}")
+        syncer = AsyncLSPSynchronizer(full_workdir, language, max_inflight)
+
+        async def lookup(calls: list[FocalCall]) -> list[SourceResult]:
+            # the server is only started once a call misses the definition cache
+            if syncer.lsp_proc is None:
+                with metrics.timer("initialize"):
+                    await syncer.initialize(timeout=60)
+            return await syncer.get_sources_of_calls(calls)
+
+        async def focals2results_async(chunk: list[dict]) -> list[dict]:
+            # reading and parsing the test files would block the event loop
+            prepared = await asyncio.to_thread(
+                lambda: [prepare_focal(language, repos_root, obj) for obj in chunk]
+            )
+            sources = await definition_cache.cached_lookup_async(
+                language, [call for _, call in prepared], lookup
+            )
+            return await asyncio.to_thread(
+                lambda: [
+                    finish_focal(result, obj, source, repos_root, language)
+                    for (result, _), obj, source in zip(prepared, chunk, sources)
+                ]
+            )
+
+        try:
+            # lookups the server may have answered before it finished indexing
+            deferred: list[dict] = []
+            for chunk, finished in locality.chunks(workdir_objs, CHECKPOINT_EVERY):
+                results = await focals2results_async(chunk)
+                if readiness.defers(language):
+                    deferred += [
+                        obj
+                        for obj, result in zip(chunk, results)
+                        if readiness.is_premature(result)
+                    ]
+                    results = [r for r in results if not readiness.is_premature(r)]
+                journal.write_all(results)
+                syncer.release([os.path.join(repos_root, f) for f in finished])
+
+            for chunk, _ in locality.chunks(deferred, CHECKPOINT_EVERY):
+                results = await focals2results_async(chunk)
+                journal.write_all(readiness.record_retry(results))
         except Exception as e:  # pylint: disable=broad-exception-caught
             logging.debug(e)
-            syncer.stop()
-            continue
+        finally:
+            await syncer.stop()
+
+    async def bounded(workdir: str, workdir_objs: list[dict]):
+        async with slots:
+            await process_workdir(workdir, workdir_objs)
+
+    start = time.perf_counter()
+    timed_out = False
+    with (
+        metrics.scope(repo_name(focal_file), language),
+        ResultJournal(success_file, failure_file, resume=skip_processed) as journal,
+    ):
+        try:
+            # on expiry the workdirs are cancelled, their servers killed in stop()
+            await asyncio.wait_for(
+                asyncio.gather(
+                    *(
+                        bounded(workdir, pending)
+                        for workdir, workdir_objs in wd.items()
+                        if (
+                            pending := [
+                                o for o in workdir_objs if o["test_id"] not in journal
+                            ]
+                        )
+                    )
+                ),
+                timeout=repo_deadline(repo_name(focal_file), deadline),
+            )
+        except asyncio.TimeoutError:
+            timed_out = True
+            logging.warning(f"{repo_name(focal_file)} timed out after {deadline}s")
+
+    if timed_out:
+        TimeoutLog(timeouts_file(focal_file)).record(
+            repo_name(focal_file),
+            language,
+            list(wd.keys()),
+            time.perf_counter() - start,
+            sum(obj["test_id"] in journal for obj in objs),
+            n_focal,
+        )
+    metrics.flush(metrics_file(focal_file))
+    return n_focal, sum(obj["test_id"] in journal.succeeded for obj in objs)
 
-        # append to source file in loop to avoid losing data
-        with jsonlines.open(success_file, "a") as f:
-            f.write_all(succ)
-        with jsonlines.open(failure_file, "a") as f:
-            f.write_all(fail)
 
-        success_results.extend(succ)
-        failure_results.extend(fail)
+def process_stats() -> Counter[str]:
+    """server health, readiness and cache counters of the current process"""
+    return health.STATS + readiness.STATS + locality.cache_stats()
 
-    return n_focal, len(success_results)
+
+def process_units_async(
+    units: list[WorkUnit],
+    repos_root: str,
+    language: str,
+    max_inflight: int,
+    repos_per_worker: int,
+    workspaces_per_repo: int = 1,
+    deadline: Optional[float] = None,
+) -> tuple[list[tuple[WorkUnit, tuple[int, int], float]], Counter[str]]:
+    """process units on one event loop, with up to repos_per_worker servers alive
+
+    Returns:
+        tuple[list[tuple[WorkUnit, tuple[int, int], float]], Counter[str]]: unit,
+            (n_focal, n_code) and seconds spent on it once started, and the
+            process_stats of all units, which share the caches of the worker
+    """
+    stats_before = process_stats()
+
+    async def run_all():
+        slots = asyncio.Semaphore(repos_per_worker)
+
+        async def run_one(unit: WorkUnit):
+            async with slots:
+                start = time.perf_counter()
+                result = await process_one_focal_file_async(
+                    unit.focal_file,
+                    repos_root,
+                    language,
+                    max_inflight=max_inflight,
+                    workdirs=unit.workdirs,
+                    workspaces_per_repo=workspaces_per_repo,
+                    deadline=deadline,
+                )
+                return unit, result, time.perf_counter() - start
+
+        return await asyncio.gather(*map(run_one, units))
+
+    timed_results = asyncio.run(run_all())
+    return timed_results, process_stats() - stats_before
+
+
+def process_with_worker_pool(
+    focal_file: str,
+    repos_root: str,
+    language: str,
+    reuse_servers: bool,
+    recycle_after: int,
+    max_server_rss: int,
+    max_inflight: int,
+    workdirs: Optional[list[str]] = None,
+    workspaces_per_repo: int = 1,
+    deadline: Optional[float] = None,
+) -> tuple[int, int, Counter[str]]:
+    """run process_one_focal_file on the server pool of the current worker
+
+    Returns:
+        tuple[int, int, Counter[str]]: n_focal, n_code and pool stats and
+            process_stats of this file
+    """
+    stats_before = process_stats()
+    if not reuse_servers:
+        return (
+            *process_one_focal_file(
+                focal_file,
+                repos_root,
+                language,
+                max_inflight=max_inflight,
+                workdirs=workdirs,
+                workspaces_per_repo=workspaces_per_repo,
+                deadline=deadline,
+            ),
+            process_stats() - stats_before,
+        )
+
+    pool = worker_pool(
+        max_repos=recycle_after, max_rss_mb=max_server_rss, max_inflight=max_inflight
+    )
+    before = pool.stats.copy()
+    n_focal, n_code = process_one_focal_file(
+        focal_file,
+        repos_root=repos_root,
+        language=language,
+        pool=pool,
+        workdirs=workdirs,
+        workspaces_per_repo=workspaces_per_repo,
+        deadline=deadline,
+    )
+    return (
+        n_focal,
+        n_code,
+        (pool.stats - before) + (process_stats() - stats_before),
+    )
 
 
 def main(
@@ -197,41 +612,191 @@ def main(
     jobs=CORES,
     debug=False,
     timeout="30m",
+    reuse_servers=True,
+    recycle_after=20,
+    max_server_rss=4096,
+    max_inflight=8,
+    backend="threads",
+    repos_per_worker=4,
+    workspaces_per_repo=1,
+    cache_definitions=True,
+    output_format="jsonl",
+    server_cache_gb=20.0,
+    profile="full",
+    order_focals=True,
+    skip_processed=True,
 ):
+    """
+    Args:
+        timeout (str): deadline of each repo, e.g. "30m", counted from the start
+            of its first unit when the scheduler splits it; its language
+            servers are killed when it passes and the repo is logged to
+            data/source/timeouts.jsonl with the results so far kept
+        backend (str): "threads" runs one language server per worker process,
+            "async" drives repos_per_worker servers from the event loop of each worker
+        workspaces_per_repo (int): number of workdirs of one repo, e.g. Java
+            modules, processed in parallel within a worker
+        cache_definitions (bool): memoize lookups in definition_cache.CACHE_PATH,
+            so call sites already resolved by a previous run skip the server
+        output_format (str): "jsonl" only writes the per-repo jsonl files,
+            "parquet" also collects the successes of the run into
+            data/source/parquet/<language>.parquet, which needs pyarrow
+        max_server_rss (int): MB of a language server process tree, a server
+            above it is recycled between repos, or killed and restarted with its
+            lost lookups replayed when sampled above it during a repo; the kernel
+            enforces health.HARD_LIMIT_FACTOR times it where possible
+        server_cache_gb (float): language servers keep their per-repo indexes
+            in server_cache.SERVER_CACHE, the least recently used are removed
+            before the run to fit this size, 0 starts servers without caches
+        profile (str): "full" starts servers with their default settings,
+            "definition" advertises only what go-to-definition needs and turns
+            off their linters, diagnostics and formatting, see profiles.py
+        order_focals (bool): look up the focal objects of a workdir grouped by
+            test file and sorted by their likely definition file, closing each
+            test file once done, see locality.py; False keeps the order of the
+            focal file. Cache hit rates are in the summary, per-repo times in
+            data/source/schedule.jsonl
+        skip_processed (bool): resume from the results already in the output
+            files; False empties them before any work is dispatched
+    """
     logging.basicConfig(level=logging.DEBUG if debug else logging.INFO)
-    all_focal_files = []
+    if output_format == "parquet":
+        require_pyarrow()
+    deadline = convert_to_seconds(timeout)
+    health.configure(max_server_rss)
+    profiles.configure(profile)
+    locality.configure(order_focals)
+    if not cache_definitions:
+        definition_cache.configure(None)
+    if server_cache_gb > 0:
+        server_cache.configure(server_cache.SERVER_CACHE, repos_root)
+        server_cache.prune(int(server_cache_gb * 2**30))
+    else:
+        server_cache.configure(None)
     if os.path.isdir(focal_path):
-        focal_dir = focal_path
-        for root, _, files in os.walk(os.path.abspath(focal_dir)):
-            for file in files:
-                if file.endswith(".jsonl"):
-                    all_focal_files.append(os.path.join(root, file))
+        focal_sizes = scan_focal_files(os.path.abspath(focal_path))
     elif os.path.isfile(focal_path):
-        all_focal_files.append(focal_path)
+        focal_sizes = {focal_path: os.path.getsize(focal_path)}
     else:
         logging.error(f"{focal_path} is not a valid file or directory")
         exit(1)
+    all_focal_files = list(focal_sizes)
 
     logging.info(f"Processing {len(all_focal_files)} focal files")
     os.makedirs("./data/source", exist_ok=True)
 
-    # starting jobs / 2 since each job will spawn 2 processes (main and LSP)
-    with ProcessPool(math.ceil(jobs / 2)) as pool:
-        rnt = list(
-            tqdm(
-                pool.imap(
-                    lambda f: process_one_focal_file(
-                        f, repos_root=repos_root, language=language
+    if backend == "async":
+        # each worker drives repos_per_worker language servers
+        n_workers = max(1, jobs // (repos_per_worker + 1))
+    else:
+        # starting jobs / 2 since each job will spawn 2 processes (main and LSP)
+        n_workers = math.ceil(jobs / 2)
+
+    # longest first, big repos are split by workdir so idle workers can steal them
+    units = plan(
+        focal_sizes, lambda f: load_workdirs(f, language, repos_root), n_workers
+    )
+    cost_log = CostLog("./data/source/schedule.jsonl")
+    if not skip_processed:
+        # once for all units, they append to the same files
+        for focal_file in all_focal_files:
+            start_over(*source_files(focal_file))
+
+    rnt: list[tuple[int, int]] = []
+    stats: Counter[str] = Counter()
+    # the units of a split repo share its deadline, see watchdog.RepoClock
+    clock_dir = tempfile.mkdtemp(prefix="unitsyncer-clock-")
+    share_deadlines(clock_dir)
+    with ProcessPool(n_workers) as pool:
+        if backend == "async":
+            chunk_size = repos_per_worker * 4
+            done_chunks = pool.uimap(
+                lambda chunk: process_units_async(
+                    chunk,
+                    repos_root,
+                    language,
+                    max_inflight,
+                    repos_per_worker,
+                    workspaces_per_repo,
+                    deadline,
+                ),
+                [units[i : i + chunk_size] for i in range(0, len(units), chunk_size)],
+            )
+            with tqdm(total=len(units)) as progress:
+                for timed_results, chunk_stats in done_chunks:
+                    for unit, result, elapsed in timed_results:
+                        cost_log.record(unit, elapsed)
+                        rnt.append(result)
+                    stats += chunk_stats
+                    progress.update(len(timed_results))
+            reuse_servers = False
+        else:
+            done_units = pool.uimap(
+                lambda unit: run_timed(
+                    lambda u: process_with_worker_pool(
+                        u.focal_file,
+                        repos_root,
+                        language,
+                        reuse_servers,
+                        recycle_after,
+                        max_server_rss,
+                        max_inflight,
+                        u.workdirs,
+                        workspaces_per_repo,
+                        deadline,
                     ),
-                    all_focal_files,
+                    unit,
                 ),
-                total=len(all_focal_files),
+                units,
             )
-        )
+            for unit, (n_focal, n_code, unit_stats), elapsed in tqdm(
+                done_units, total=len(units)
+            ):
+                cost_log.record(unit, elapsed)
+                rnt.append((n_focal, n_code))
+                stats += unit_stats
+    shutil.rmtree(clock_dir, ignore_errors=True)
     nfocal, ncode = zip(*rnt)
     logging.info(
         f"Processed {sum(ncode)} have source code in {sum(nfocal)} focal functions"
     )
+    if output_format == "parquet":
+        parquet_file = f"./data/source/parquet/{language}.parquet"
+        os.makedirs(os.path.dirname(parquet_file), exist_ok=True)
+        n_rows = jsonl_to_parquet(
+            (
+                (source_files(f)[0], repo_name(f), language)
+                for f in sorted(all_focal_files)
+            ),
+            parquet_file,
+        )
+        logging.info(f"Wrote {n_rows} records to {parquet_file}")
+    if reuse_servers:
+        logging.info(
+            f"Started {stats['cold_starts']} language servers, "
+            f"avoided {stats['cold_starts_avoided']} cold starts, "
+            f"recycled {stats['recycled']} servers"
+        )
+    if stats["documents_opened"] or stats["parse_misses"]:
+        logging.info(
+            f"Found the test file already open for "
+            f"{locality.hit_rate(stats, 'documents', 'opened'):.0%} of lookups, "
+            f"parse cache hit rate "
+            f"{locality.hit_rate(stats, 'parse', 'misses'):.0%}"
+        )
+    if stats["retried"]:
+        logging.info(
+            f"Held {stats['held_batches']} batches until their server finished "
+            f"indexing, retried {stats['retried']} lookups without a definition "
+            f"at the end of their workdir, recovered {stats['recovered']} "
+            f"({stats['recovered'] / stats['retried']:.0%})"
+        )
+    if stats["restarts"]:
+        logging.info(
+            f"Restarted {stats['restarts']} crashed language servers, "
+            f"{stats['rss_kills']} of them above {max_server_rss}MB, "
+            f"replayed {stats['replayed']} lookups"
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,111 @@
+"""benchmark per-request latency of the synchronizer backends on a focal file
+
+python3 scripts/bench_lsp_latency.py data/focal/<repo>.jsonl --language=go
+python3 scripts/bench_lsp_latency.py data/focal/<repo>.jsonl --profile=full,definition
+"""
+import json
+import os
+import time
+import fire
+import numpy as np
+from main import id2path, prepare_focal
+from unitsyncer import profiles
+from unitsyncer.sync import LSPSynchronizer, Synchronizer
+from unitsyncer.sansio_lsp_syncer import SansioLSPSynchronizer
+
+
+def latency_summary(name: str, latencies: list[float]) -> str:
+    ms = np.array(latencies) * 1000
+    return (
+        f"{name:>12}: n={len(ms)} mean={ms.mean():.1f}ms "
+        f"p50={np.percentile(ms, 50):.1f}ms p95={np.percentile(ms, 95):.1f}ms "
+        f"max={ms.max():.1f}ms"
+    )
+
+
+def main(
+    focal_file: str,
+    repos_root: str = "data/repos",
+    language: str = "python",
+    backend: str = "sansio",
+    rounds: int = 3,
+    batch: bool = False,
+    max_inflight: int = 8,
+    profile: str | tuple = "full",
+):
+    """
+    Args:
+        backend (str): "sansio" for SansioLSPSynchronizer, "pylspclient" for LSPSynchronizer
+        rounds (int): number of passes over the focal objects, after one warm-up pass
+        batch (bool): also time get_sources_of_calls with max_inflight requests in flight
+        profile (str | tuple): server profiles to compare, e.g. "full,definition",
+            each is benchmarked with a fresh server and checked against the first
+    """
+    names = profile.split(",") if isinstance(profile, str) else list(profile)
+    with open(focal_file) as f:
+        objs = [json.loads(line) for line in f]
+    repos_root = os.path.abspath(repos_root)
+    workdir = "/".join(id2path(objs[0]["test_id"]).split("/")[:2])
+    full_workdir = os.path.join(repos_root, workdir)
+    calls = [prepare_focal(language, repos_root, obj)[1] for obj in objs]
+
+    baseline = None
+    for name in names:
+        print(f"profile {name}")
+        results = bench_profile(
+            name, full_workdir, calls, language, backend, rounds, batch, max_inflight
+        )
+        if baseline is None:
+            baseline = results
+        elif results != baseline:
+            n_diff = sum(a != b for a, b in zip(results, baseline))
+            print(f"{'':>12}  {n_diff} of {len(calls)} results differ from {names[0]}")
+
+
+def bench_profile(
+    name: str,
+    full_workdir: str,
+    calls: list,
+    language: str,
+    backend: str,
+    rounds: int,
+    batch: bool,
+    max_inflight: int,
+) -> list:
+    """time one profile on a fresh server, return its results of calls"""
+    profiles.configure(name)
+    syncer: Synchronizer
+    match backend:
+        case "sansio":
+            syncer = SansioLSPSynchronizer(full_workdir, language, max_inflight)
+        case _:
+            syncer = LSPSynchronizer(full_workdir, language, max_inflight)
+
+    start = time.perf_counter()
+    syncer.initialize(timeout=60)
+    print(f"{'initialize':>12}: {time.perf_counter() - start:.2f}s")
+
+    results = syncer.get_sources_of_calls(calls)  # warm up
+
+    latencies = []
+    for _ in range(rounds):
+        for call in calls:
+            start = time.perf_counter()
+            syncer.get_source_of_call(*call)
+            latencies.append(time.perf_counter() - start)
+    print(latency_summary("sequential", latencies))
+
+    if batch:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            syncer.get_sources_of_calls(calls)
+        total = time.perf_counter() - start
+        n_calls = rounds * len(calls)
+        print(f"{'batched':>12}: n={n_calls} {total / n_calls * 1000:.1f}ms per call")
+
+    syncer.stop()
+    return results
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,97 @@
+"""memory used by the function index of RustSynchronizer in its representations
+
+python3 scripts/rust_index_memory.py data/repos/<owner-repo>/<owner-repo-sha>
+"""
+import gc
+import os
+import tempfile
+import multiprocessing as mp
+import fire
+from tree_sitter import Parser
+from frontend.parser import RUST_LANGUAGE
+from frontend.parser.ast_util import ASTUtil
+from unitsyncer.rust_syncer import (
+    RustSynchronizer,
+    rust_files,
+    cached_functions,
+)
+from unitsyncer.util import proc_tree_rss
+
+
+def node_pairs(workspace_dir: str, cache_dir: str):
+    """(name, tree-sitter node) pairs, which keep the tree of every file alive"""
+    parser = Parser()
+    parser.set_language(RUST_LANGUAGE)
+    file_func_map = {}
+    for file_path in rust_files(workspace_dir):
+        with open(file_path, errors="replace") as f:
+            ast_util = ASTUtil(f.read())
+        tree = parser.parse(bytes(ast_util.src, "utf8"))
+        nodes = ast_util.get_all_nodes_of_type(tree.root_node, "function_item")
+        file_func_map[file_path] = [
+            (ast_util.get_name(node).value_or(""), node) for node in nodes
+        ]
+    return file_func_map
+
+
+def records(workspace_dir: str, cache_dir: str):
+    """one tuple of name, qualname and positions per function, without indexes"""
+    return {
+        file_path: cached_functions(file_path, cache_dir)
+        for file_path in rust_files(workspace_dir)
+    }
+
+
+def compact(workspace_dir: str, cache_dir: str):
+    """FunctionTable with its name and qualified indexes"""
+    syncer = RustSynchronizer(workspace_dir, cache_dir=cache_dir)
+    syncer.initialize()
+    return syncer
+
+
+def compact_cold(workspace_dir: str, cache_dir: str):
+    """FunctionTable built by parsing every file, as on the first run"""
+    with tempfile.TemporaryDirectory() as cold_cache_dir:
+        return compact(workspace_dir, cold_cache_dir)
+
+
+BUILDERS = {
+    "nodes": node_pairs,
+    "records": records,
+    "compact": compact,
+    "cold": compact_cold,
+}
+
+
+def measure(name: str, workspace_dir: str, cache_dir: str, queue):
+    gc.collect()
+    before = proc_tree_rss(os.getpid())
+    index = BUILDERS[name](workspace_dir, cache_dir)
+    gc.collect()
+    queue.put(proc_tree_rss(os.getpid()) - before)
+    del index
+
+
+def main(workspace_dir: str):
+    """print the resident memory added by building each representation
+
+    Each one is built in a fresh process. Records and compact are loaded from
+    a warm function cache, so that the memory freed after parsing is not
+    counted; cold is compact from an empty cache, with every file parsed.
+    """
+    ctx = mp.get_context("spawn")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        RustSynchronizer(workspace_dir, cache_dir=cache_dir).initialize()
+        for name in BUILDERS:
+            queue = ctx.Queue()
+            proc = ctx.Process(
+                target=measure, args=(name, workspace_dir, cache_dir, queue)
+            )
+            proc.start()
+            delta = queue.get()
+            proc.join()
+            print(f"{name:>8}: {delta / 2**20:.1f} MB")
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,172 @@
+import unittest
+import asyncio
+import os
+import sys
+import logging
+import tempfile
+import time
+from unittest import mock
+from returns.result import Success, Failure
+from unitsyncer import async_syncer, definition_cache, health, server_cache
+from unitsyncer.async_syncer import AsyncLSPSynchronizer
+from unitsyncer.util import path2uri
+
+# answers definition requests in reverse order of arrival once two are pending,
+# so the synchronizer has to route responses by id
+FAKE_SERVER = r"""
+import json, os, sys
+
+def read():
+    size = None
+    while (line := sys.stdin.buffer.readline().decode().strip()):
+        size = int(line.split(": ")[1])
+    return json.loads(sys.stdin.buffer.read(size)) if size else None
+
+def write(msg):
+    body = json.dumps(msg).encode()
+    sys.stdout.buffer.write(b"Content-Length: %d\r\n\r\n" % len(body) + body)
+    sys.stdout.buffer.flush()
+
+pending = []
+# with a marker file, the first definition request gets a header without size
+marker = sys.argv[2] if len(sys.argv) > 2 else None
+while (msg := read()) is not None:
+    match msg.get("method"):
+        case "textDocument/definition" if marker and not os.path.exists(marker):
+            open(marker, "w").close()
+            sys.stdout.buffer.write(b"Content-Type: garbage\r\n\r\n")
+            sys.stdout.buffer.flush()
+        case "initialize":
+            write({"jsonrpc": "2.0", "id": msg["id"], "result": {"capabilities": {}}})
+            write({"jsonrpc": "2.0", "id": "cfg", "method": "workspace/configuration",
+                   "params": {"items": [{}, {}]}})
+        case "textDocument/definition":
+            pending.append(msg)
+            if len(pending) == 2:
+                for req in reversed(pending):
+                    line = req["params"]["position"]["line"]
+                    uri = sys.argv[1] if line >= 0 else sys.argv[1] + ".missing"
+                    pos = {"line": abs(line), "character": 4}
+                    loc = {"uri": uri, "range": {"start": pos, "end": pos}}
+                    write({"jsonrpc": "2.0", "id": req["id"], "result": [loc]})
+                pending = []
+        case "shutdown":
+            write({"jsonrpc": "2.0", "id": msg["id"], "result": None})
+        case "exit":
+            break
+"""
+
+
+class TestAsyncLSPSynchronizer(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        # keep the user's definition and server caches out of the test
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.addCleanup(definition_cache.configure, definition_cache.CACHE_PATH)
+        self.addCleanup(server_cache.configure, server_cache.SERVER_CACHE)
+        definition_cache.configure(os.path.join(cache_dir.name, "definitions.sqlite"))
+        server_cache.configure(os.path.join(cache_dir.name, "servers"))
+        self.path = os.path.join(self.tmp_dir.name, "add.py")
+        with open(self.path, "w") as f:
+            f.write(
+                "def add(x, y):\n    return x + y\n\ndef sub(x, y):\n    return x - y\n"
+            )
+
+        self.fake_cmd = [sys.executable, "-c", FAKE_SERVER, path2uri(self.path)]
+        patcher = mock.patch.object(
+            async_syncer, "get_lsp_cmd", lambda _: self.fake_cmd
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    async def resolve(self, calls):
+        syncer = AsyncLSPSynchronizer(self.tmp_dir.name, "python")
+        await syncer.initialize()
+        results = await syncer.get_sources_of_calls(calls)
+        await syncer.stop()
+        self.assertIsNotNone(syncer.lsp_proc.returncode)
+        return results
+
+    def test_concurrent_requests(self):
+        calls = [("add", self.path, 0, 0), ("sub", self.path, 3, 0)]
+        match asyncio.run(self.resolve(calls)):
+            case [Success((add, _, _)), Success((sub, _, _))]:
+                self.assertIn("x + y", add)
+                self.assertIn("x - y", sub)
+            case results:
+                self.fail(results)
+
+    def test_failure_is_per_call(self):
+        calls = [("add", self.path, 0, 0), ("missing", self.path, -3, 0)]
+        match asyncio.run(self.resolve(calls)):
+            case [Success(_), Failure(e)]:
+                self.assertIn("Source code not found", e)
+            case results:
+                self.fail(results)
+
+    def test_extraction_does_not_block_loop(self):
+        ticks = 0
+        during_extraction = []
+
+        def slow_extraction(*_):
+            before = ticks
+            time.sleep(0.3)
+            during_extraction.append(ticks - before)
+            return Success(("def add(x, y): ...", None, None))
+
+        async def run():
+            nonlocal ticks
+
+            async def tick():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            ticker = asyncio.create_task(tick())
+            results = await self.resolve(
+                [("add", self.path, 0, 0), ("sub", self.path, 3, 0)]
+            )
+            ticker.cancel()
+            return results
+
+        with mock.patch.object(async_syncer, "source_of_definition", slow_extraction):
+            self.assertIsInstance(asyncio.run(run())[0], Success)
+        self.assertGreater(during_extraction[0], 5)
+
+    def test_restart_and_replay(self):
+        stats = health.STATS.copy()
+
+        async def run():
+            syncer = AsyncLSPSynchronizer(self.tmp_dir.name, "python")
+            await syncer.initialize()
+            first_pid = syncer.server_pid
+            # as the HealthMonitor does from its thread
+            syncer.recycle()
+            await syncer.lsp_proc.wait()
+            results = await syncer.get_sources_of_calls(
+                [("add", self.path, 0, 0), ("sub", self.path, 3, 0)]
+            )
+            self.assertNotEqual(syncer.server_pid, first_pid)
+            await syncer.stop()
+            return results
+
+        self.assertTrue(all(isinstance(r, Success) for r in asyncio.run(run())))
+        self.assertEqual(health.STATS["restarts"] - stats["restarts"], 1)
+        self.assertEqual(health.STATS["replayed"] - stats["replayed"], 2)
+
+    def test_restart_after_bad_header(self):
+        # the server keeps running after its garbled message
+        self.fake_cmd.append(os.path.join(self.tmp_dir.name, "garbled"))
+        calls = [("add", self.path, 0, 0), ("sub", self.path, 3, 0)]
+        results = asyncio.run(asyncio.wait_for(self.resolve(calls), timeout=10))
+        self.assertTrue(all(isinstance(r, Success) for r in results))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+import os
+import json
+import logging
+import tempfile
+import importlib.util
+from unitsyncer.columnar import jsonl_to_parquet, read_records
+
+
+@unittest.skipUnless(importlib.util.find_spec("pyarrow"), "pyarrow is not installed")
+class TestColumnar(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.out = os.path.join(self.tmp_dir.name, "all.parquet")
+        self.sources = []
+        for repo, lang in (("a", "python"), ("b", "go"), ("c", "python")):
+            path = os.path.join(self.tmp_dir.name, f"{repo}.success.jsonl")
+            with open(path, "w") as f:
+                for i in range(3):
+                    record = {"test_id": f"{repo}/{i}", "test": "t", "code": "c"}
+                    f.write(json.dumps(record) + "\n")
+                f.write(json.dumps({"test_id": f"{repo}/err", "error": "e"}) + "\n")
+                f.write('{"test_id": "partial')
+            self.sources.append((path, repo, lang))
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_round_trip(self):
+        n_rows = jsonl_to_parquet(self.sources, self.out, row_group_size=4)
+        self.assertEqual(n_rows, 9)
+        self.assertFalse(os.path.exists(f"{self.out}.tmp"))
+
+        import pyarrow.parquet as pq  # pylint: disable=import-outside-toplevel
+
+        meta = pq.ParquetFile(self.out).metadata
+        self.assertEqual(meta.num_row_groups, 3)
+        self.assertEqual(meta.row_group(0).column(0).compression, "ZSTD")
+
+        records = read_records(self.out)
+        self.assertEqual(records[0]["test_id"], "a/0")
+        self.assertEqual(records[0]["docstring"], None)
+
+    def test_filter_columns(self):
+        jsonl_to_parquet(self.sources, self.out, row_group_size=4)
+        records = read_records(self.out, columns=["repo", "test_id"], langs=["go"])
+        self.assertEqual(
+            records, [{"repo": "b", "test_id": f"b/{i}"} for i in range(3)]
+        )
+
+    def test_javascript_round_trip(self):
+        path, _, _ = self.sources[1]
+        jsonl_to_parquet([(path, "b", "javascript")], self.out)
+        # the evaluation matches the dataset name of the language
+        records = read_records(self.out, columns=["lang"], langs=["js"])
+        self.assertEqual(records, [{"lang": "js"}] * 3)
+        self.assertEqual(len(read_records(self.out, langs=["javascript"])), 3)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
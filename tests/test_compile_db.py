@@ -0,0 +1,95 @@
+import unittest
+import os
+import shutil
+import logging
+import tempfile
+import subprocess
+from unittest import mock
+from unitsyncer import server_cache
+from unitsyncer.compile_db import compile_db_dir
+
+
+class TestCompileDB(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.workspace = os.path.join(self.tmp_dir.name, "repos", "r", "r-1")
+        layout = {
+            "src/a.cpp": "#include <pkg/a.h>\nint f() { return g(); }\n",
+            "src/include/pkg/a.h": "int g();\n",
+        }
+        for path, content in layout.items():
+            full_path = os.path.join(self.workspace, path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, "w") as f:
+                f.write(content)
+        self.server_cache = server_cache.SERVER_CACHE
+        self.repos_root = server_cache.REPOS_ROOT
+        server_cache.configure(
+            os.path.join(self.tmp_dir.name, "servers"),
+            os.path.join(self.tmp_dir.name, "repos"),
+        )
+
+    def tearDown(self):
+        server_cache.configure(self.server_cache, self.repos_root)
+        self.tmp_dir.cleanup()
+
+    def add_cmake(self):
+        with open(os.path.join(self.workspace, "CMakeLists.txt"), "w") as f:
+            f.write(
+                "cmake_minimum_required(VERSION 3.10)\n"
+                "project(r CXX)\n"
+                "add_library(r src/a.cpp)\n"
+                "target_include_directories(r PUBLIC src/include)\n"
+            )
+
+    def test_compile_flags_fallback(self):
+        db_dir = compile_db_dir(self.workspace)
+        with open(os.path.join(db_dir, "compile_flags.txt")) as f:
+            flags = f.read().split()
+        self.assertIn(f"-I{self.workspace}/src/include", flags)
+        self.assertFalse(db_dir.startswith(self.workspace))
+
+    def test_own_compile_commands(self):
+        db = '[{"directory": "%s", "file": "src/a.cpp", "command": "c++ -c src/a.cpp"}]'
+        with open(os.path.join(self.workspace, "compile_commands.json"), "w") as f:
+            f.write(db % self.workspace)
+        # copied into the server cache, where clangd then writes its index
+        db_dir = compile_db_dir(self.workspace)
+        self.assertTrue(db_dir.startswith(server_cache.SERVER_CACHE))
+        with open(os.path.join(db_dir, "compile_commands.json")) as f:
+            self.assertEqual(f.read(), db % self.workspace)
+        (repo_dir,) = server_cache.cache_usage()
+        self.assertTrue(db_dir.startswith(repo_dir))
+
+        server_cache.configure(None)
+        self.assertIsNone(compile_db_dir(self.workspace))
+
+    def test_cmake_timeout(self):
+        self.add_cmake()
+        timeout = subprocess.TimeoutExpired("cmake", 0)
+        with mock.patch("subprocess.run", side_effect=timeout), mock.patch(
+            "shutil.which", return_value="/usr/bin/cmake"
+        ):
+            db_dir = compile_db_dir(self.workspace, timeout=0)
+        self.assertTrue(os.path.exists(os.path.join(db_dir, "compile_flags.txt")))
+
+    @unittest.skipUnless(shutil.which("cmake") and shutil.which("c++"), "no cmake")
+    def test_cmake_out_of_tree(self):
+        self.add_cmake()
+        before = sorted(os.listdir(self.workspace))
+        db_dir = compile_db_dir(self.workspace)
+        self.assertTrue(os.path.exists(os.path.join(db_dir, "compile_commands.json")))
+        self.assertEqual(sorted(os.listdir(self.workspace)), before)
+
+        # cached until the CMake files change
+        with mock.patch("subprocess.run") as run:
+            self.assertEqual(compile_db_dir(self.workspace), db_dir)
+            run.assert_not_called()
+        with open(os.path.join(self.workspace, "CMakeLists.txt"), "a") as f:
+            f.write("# changed\n")
+        self.assertNotEqual(compile_db_dir(self.workspace), db_dir)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,161 @@
+import unittest
+import os
+import sys
+import logging
+import tempfile
+from unittest import mock
+from returns.maybe import Nothing
+from returns.result import Success, Failure
+from unitsyncer import definition_cache, server_cache, sansio_lsp_syncer
+from unitsyncer.definition_cache import DefinitionCache, cached_lookup
+from unitsyncer.sansio_lsp_syncer import SansioLSPSynchronizer
+from unitsyncer.util import path2uri
+
+# answers every definition request with the line of the call in sys.argv[1]
+FAKE_SERVER = r"""
+import json, sys
+
+def read():
+    size = None
+    while (line := sys.stdin.buffer.readline().decode().strip()):
+        if line.startswith("Content-Length: "):
+            size = int(line.split(": ")[1])
+    return json.loads(sys.stdin.buffer.read(size)) if size else None
+
+def write(msg):
+    body = json.dumps(msg).encode()
+    sys.stdout.buffer.write(b"Content-Length: %d\r\n\r\n" % len(body) + body)
+    sys.stdout.buffer.flush()
+
+while (msg := read()) is not None:
+    match msg.get("method"):
+        case "initialize":
+            write({"jsonrpc": "2.0", "id": msg["id"], "result": {"capabilities": {}}})
+        case "textDocument/definition":
+            pos = {"line": msg["params"]["position"]["line"], "character": 4}
+            loc = {"uri": sys.argv[1], "range": {"start": pos, "end": pos}}
+            write({"jsonrpc": "2.0", "id": msg["id"], "result": [loc]})
+        case "shutdown":
+            write({"jsonrpc": "2.0", "id": msg["id"], "result": None})
+        case "exit":
+            break
+"""
+
+
+class TestDefinitionCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmp_dir.name, "cache", "definitions.sqlite")
+        self.test_file = os.path.join(self.tmp_dir.name, "test_a.py")
+        with open(self.test_file, "w") as f:
+            f.write("def test_a():\n    assert f(1) == g(2)\n")
+        self.cache_path = definition_cache.CACHE_PATH
+        definition_cache.configure(self.db)
+        self.calls = [
+            ("f", self.test_file, 1, 11),
+            ("g", self.test_file, 1, 19),
+        ]
+        self.looked_up: list = []
+
+    def tearDown(self):
+        definition_cache.configure(self.cache_path)
+        self.tmp_dir.cleanup()
+
+    def lookup(self, calls):
+        self.looked_up.extend(calls)
+        return [
+            (
+                Success((f"def {name}(x): pass", None, None))
+                if name == "f"
+                else Failure("No definition found")
+            )
+            for name, *_ in calls
+        ]
+
+    def test_only_misses_are_looked_up(self):
+        first = cached_lookup("python", self.calls, self.lookup)
+        self.assertEqual(self.looked_up, self.calls)
+
+        # failures are retried, successes come from the cache
+        self.looked_up.clear()
+        second = cached_lookup("python", self.calls, self.lookup)
+        self.assertEqual(self.looked_up, self.calls[1:])
+        self.assertEqual(first, second)
+
+    def test_changed_file_misses(self):
+        cached_lookup("python", self.calls[:1], self.lookup)
+        with open(self.test_file, "a") as f:
+            f.write("\n")
+        self.looked_up.clear()
+        cached_lookup("python", self.calls[:1], self.lookup)
+        self.assertEqual(self.looked_up, self.calls[:1])
+
+    def test_definition_layer(self):
+        store = DefinitionCache(self.db)
+        n_extract = 0
+
+        def extract():
+            nonlocal n_extract
+            n_extract += 1
+            return Success(("def f(x): pass", "doc", None))
+
+        for _ in range(3):
+            self.assertEqual(
+                store.definition(self.test_file, "python", 0, 4, extract),
+                Success(("def f(x): pass", "doc", None)),
+            )
+        self.assertEqual(n_extract, 1)
+        store.close()
+
+
+class TestSansioDefinitionCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        real_dir = os.path.join(self.tmp_dir.name, "real")
+        os.makedirs(real_dir)
+        # the server answers with the real path of a workspace opened by a link
+        self.workspace = os.path.join(self.tmp_dir.name, "link")
+        os.symlink(real_dir, self.workspace)
+        self.real_path = os.path.join(real_dir, "add.py")
+        with open(self.real_path, "w") as f:
+            f.write("def add(x, y):\n    return x + y\n")
+
+        self.cache_path = definition_cache.CACHE_PATH
+        definition_cache.configure(os.path.join(self.tmp_dir.name, "defs.sqlite"))
+        self.server_cache = server_cache.SERVER_CACHE
+        server_cache.configure(None)
+        fake_cmd = [sys.executable, "-c", FAKE_SERVER, path2uri(self.real_path)]
+        patcher = mock.patch.object(
+            sansio_lsp_syncer, "get_lsp_cmd", lambda _: fake_cmd
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        definition_cache.configure(self.cache_path)
+        server_cache.configure(self.server_cache)
+        self.tmp_dir.cleanup()
+
+    def test_definitions_are_cached(self):
+        syncer = SansioLSPSynchronizer(self.workspace, "python")
+        syncer.initialize(timeout=10)
+        call = ("add", os.path.join(self.workspace, "add.py"), 0, 4)
+        try:
+            (first,) = syncer.get_sources_of_calls([call])
+            # extraction is not needed once the definition is cached
+            with mock.patch("unitsyncer.sync.get_function_code", return_value=Nothing):
+                (second,) = syncer.get_sources_of_calls([call])
+        finally:
+            syncer.stop()
+
+        match first:
+            case Success((code, _, _)):
+                self.assertIn("return x + y", code)
+            case _:
+                self.fail(first)
+        self.assertEqual(first, second)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
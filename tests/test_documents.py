@@ -0,0 +1,65 @@
+import unittest
+import os
+import logging
+import tempfile
+from unitsyncer.documents import OpenDocuments
+from unitsyncer.util import path2uri
+
+
+class TestOpenDocuments(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.paths = []
+        for name in ("a.py", "b.py", "c.py"):
+            path = os.path.join(self.tmp_dir.name, name)
+            with open(path, "w") as f:
+                f.write("def f():\n\treturn 1\n")
+            self.paths.append(path)
+
+        self.opened: list[tuple[str, str]] = []
+        self.closed: list[str] = []
+        self.docs = OpenDocuments(
+            lambda uri, text: self.opened.append((uri, text)),
+            self.closed.append,
+            capacity=2,
+        )
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_open_once(self):
+        a = self.paths[0]
+        for _ in range(5):
+            self.assertEqual(self.docs.open(a), path2uri(a))
+
+        self.assertEqual(self.opened, [(path2uri(a), "def f():\n    return 1\n")])
+        self.assertEqual(self.docs.stats["hits"], 4)
+
+    def test_lru_eviction(self):
+        a, b, c = self.paths
+        self.docs.open(a)
+        self.docs.open(b)
+        self.docs.open(a)  # a is now the most recently used
+        self.docs.open(c)
+
+        self.assertEqual(self.closed, [path2uri(b)])
+        self.assertIn(path2uri(a), self.docs)
+        self.assertNotIn(path2uri(b), self.docs)
+
+        # b has been closed, so it is sent again
+        self.docs.open(b)
+        self.assertEqual(len(self.opened), 4)
+
+    def test_close_all(self):
+        a, b, _ = self.paths
+        self.docs.open(a)
+        self.docs.open(b)
+        self.docs.close_all()
+
+        self.assertEqual(self.closed, [path2uri(a), path2uri(b)])
+        self.assertNotIn(path2uri(a), self.docs)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
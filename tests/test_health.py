@@ -0,0 +1,110 @@
+import unittest
+import os
+import logging
+import tempfile
+import subprocess
+import importlib.util
+from returns.result import Success, Failure
+from unitsyncer import health, definition_cache, server_cache
+from unitsyncer.health import HealthMonitor, limit_memory, replay_lost
+from unitsyncer.sync import LSPSynchronizer, Synchronizer
+
+
+class FakeSynchronizer(Synchronizer):
+    def __init__(self, pid: int) -> None:
+        super().__init__("/repos/a", "python")
+        self.pid = pid
+        self.recycled = 0
+
+    @property
+    def server_pid(self):
+        return self.pid
+
+    def recycle(self):
+        self.recycled += 1
+
+
+class TestHealth(unittest.TestCase):
+    def setUp(self):
+        self.proc = subprocess.Popen(["sleep", "60"])
+        # keep the user's definition and server caches out of the test
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.addCleanup(definition_cache.configure, definition_cache.CACHE_PATH)
+        self.addCleanup(server_cache.configure, server_cache.SERVER_CACHE)
+        definition_cache.configure(os.path.join(cache_dir.name, "definitions.sqlite"))
+        server_cache.configure(os.path.join(cache_dir.name, "servers"))
+        self.max_rss_mb = health.MAX_RSS_MB
+        self.stats = health.STATS.copy()
+
+    def tearDown(self):
+        self.proc.kill()
+        self.proc.wait()
+        health.configure(self.max_rss_mb)
+        health.STATS.clear()
+        health.STATS.update(self.stats)
+
+    def test_replay_only_after_crash(self):
+        calls = [("f", "a.py", 0, 0), ("g", "a.py", 1, 0)]
+        results = [Success(("f", None, None)), Failure("language server stopped")]
+        restarts = []
+
+        def lookup(batch):
+            return [Success((name, None, None)) for name, *_ in batch]
+
+        self.assertEqual(
+            replay_lost(calls, results, lambda: False, restarts.append, lookup),
+            results,
+        )
+        replayed = replay_lost(
+            calls, results, lambda: True, lambda: restarts.append(1), lookup
+        )
+        self.assertEqual(replayed, lookup(calls))
+        self.assertEqual(restarts, [1])
+
+    def test_recycle_above_max_rss(self):
+        syncer = FakeSynchronizer(self.proc.pid)
+        monitor = HealthMonitor(syncer)
+        health.configure(None)
+        monitor.sample()
+        self.assertEqual(syncer.recycled, 0)
+        self.assertGreater(monitor.peak_rss_mb, 0)
+
+        health.configure(0)
+        monitor.sample()
+        self.assertEqual(syncer.recycled, 1)
+
+    def test_rlimit(self):
+        health.configure(100)
+        self.assertEqual(limit_memory(self.proc.pid, "python"), "rlimit")
+        self.assertIsNone(limit_memory(self.proc.pid, "java"))
+        with open(f"/proc/{self.proc.pid}/limits") as f:
+            limits = next(line for line in f if line.startswith("Max address space"))
+        self.assertEqual(int(limits.split()[3]), 150 * 2**20)
+
+    @unittest.skipUnless(importlib.util.find_spec("pylsp"), "pylsp is not installed")
+    def test_restart_and_replay(self):
+        with tempfile.TemporaryDirectory() as workspace:
+            with open(os.path.join(workspace, "a.py"), "w") as f:
+                f.write("def f():\n    pass\n\n\nf()\n")
+            cache_path = definition_cache.CACHE_PATH
+            definition_cache.configure(None)
+            syncer = LSPSynchronizer(workspace, "python")
+            try:
+                syncer.initialize(timeout=60)
+                first_pid = syncer.server_pid
+                syncer.recycle()
+                results = syncer.get_sources_of_calls(
+                    [("f", os.path.join(workspace, "a.py"), 4, 0)]
+                )
+                self.assertEqual(results[0].unwrap()[0], "def f():\n    pass")
+                self.assertNotEqual(syncer.server_pid, first_pid)
+                self.assertEqual(health.STATS["replayed"] - self.stats["replayed"], 1)
+            finally:
+                syncer.stop()
+                definition_cache.configure(cache_path)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,89 @@
+import unittest
+import os
+import json
+import logging
+import tempfile
+from unitsyncer.journal import ResultJournal, recover_jsonl, start_over
+
+
+class TestResultJournal(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.success_file = os.path.join(self.tmp_dir.name, "repo.success.jsonl")
+        self.failure_file = os.path.join(self.tmp_dir.name, "repo.failure.jsonl")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def journal(self, **kwargs) -> ResultJournal:
+        return ResultJournal(self.success_file, self.failure_file, **kwargs)
+
+    def test_resume(self):
+        with self.journal() as journal:
+            journal.write({"test_id": "a", "code": "def a(): pass"})
+            journal.write({"test_id": "b", "error": "No definition found"})
+
+        with self.journal() as journal:
+            self.assertIn("a", journal)
+            self.assertIn("b", journal)
+            self.assertNotIn("c", journal)
+            self.assertEqual(journal.n_success, 1)
+            journal.write({"test_id": "c", "code": "def c(): pass"})
+            self.assertEqual(journal.n_success, 2)
+
+        self.assertEqual(len(recover_jsonl(self.success_file)), 2)
+
+    def test_truncate_partial_record(self):
+        with open(self.success_file, "w") as f:
+            f.write(json.dumps({"test_id": "a"}) + "\n" + '{"test_id": "b", "co')
+
+        with self.journal() as journal:
+            self.assertIn("a", journal)
+            self.assertNotIn("b", journal)
+            journal.write({"test_id": "b", "code": "def b(): pass"})
+
+        self.assertEqual(
+            [r["test_id"] for r in recover_jsonl(self.success_file)], ["a", "b"]
+        )
+
+    def test_sync_batching(self):
+        journal = self.journal(sync_every=2, sync_interval=3600)
+        journal.write({"test_id": "a", "code": ""})
+        self.assertEqual(journal.n_unsynced, 1)
+        self.assertEqual(os.path.getsize(self.success_file), 0)
+
+        journal.write({"test_id": "b", "code": ""})
+        self.assertEqual(journal.n_unsynced, 0)
+        self.assertEqual(len(recover_jsonl(self.success_file)), 2)
+        journal.close()
+
+    def test_shared_files(self):
+        first = self.journal(sync_every=1)
+        second = self.journal(sync_every=1)
+        for i in range(10):
+            (first if i % 2 else second).write({"test_id": str(i), "code": ""})
+        first.close()
+        second.close()
+
+        records = recover_jsonl(self.success_file)
+        self.assertEqual(sorted(int(r["test_id"]) for r in records), list(range(10)))
+
+    def test_no_resume(self):
+        with self.journal() as journal:
+            journal.write({"test_id": "a", "code": ""})
+
+        start_over(self.success_file, self.failure_file)
+        self.assertEqual(recover_jsonl(self.success_file), [])
+        # units of a split focal file share the files and keep each other's results
+        for test_id in "bc":
+            with self.journal(resume=False) as journal:
+                self.assertNotIn("a", journal)
+                journal.write({"test_id": test_id, "code": ""})
+        self.assertEqual(
+            [r["test_id"] for r in recover_jsonl(self.success_file)], ["b", "c"]
+        )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
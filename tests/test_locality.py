@@ -0,0 +1,76 @@
+import unittest
+import logging
+from unitsyncer import locality
+from unitsyncer.locality import chunks, definition_hint, order
+
+
+def focal(test_file: str, focal_id: str, line: int = 0) -> dict:
+    return {
+        "test_id": f"repo/workdir/{test_file}::test_{focal_id}_{line}",
+        "focal_id": focal_id,
+        "focal_loc": [line, 0],
+    }
+
+
+class TestLocality(unittest.TestCase):
+    def tearDown(self):
+        locality.configure(True)
+
+    def test_definition_hint(self):
+        self.assertEqual(definition_hint("src.add.add"), "src.add")
+        self.assertEqual(
+            definition_hint("src/add.py::Person::greet"), "src/add.py::Person"
+        )
+        self.assertEqual(definition_hint("parse"), "")
+
+    def test_order(self):
+        objs = [
+            focal("t2.py", "b.g"),
+            focal("t1.py", "c.h"),
+            focal("t2.py", "a.f", 3),
+            focal("t1.py", "c.h", 1),
+            focal("t2.py", "a.f", 1),
+        ]
+        groups = order(objs)
+        # t2.py mostly calls into `a`, which sorts before `c`
+        self.assertEqual(
+            [locality.test_file(g[0]) for g in groups],
+            ["repo/workdir/t2.py", "repo/workdir/t1.py"],
+        )
+        self.assertEqual(
+            [(o["focal_id"], o["focal_loc"][0]) for o in groups[0]],
+            [("a.f", 1), ("a.f", 3), ("b.g", 0)],
+        )
+
+    def test_chunks_keep_files_together(self):
+        objs = [focal(f"t{i % 3}.py", "m.f", i) for i in range(9)]
+        result = list(chunks(objs, 4))
+        self.assertEqual([len(chunk) for chunk, _ in result], [3, 3, 3])
+        self.assertEqual(sum(len(finished) for _, finished in result), 3)
+        for chunk, finished in result:
+            self.assertEqual({locality.test_file(o) for o in chunk}, set(finished))
+
+    def test_chunks_split_big_file(self):
+        objs = [focal("big.py", "m.f", i) for i in range(5)] + [
+            focal("small.py", "n.f")
+        ]
+        result = list(chunks(objs, 2))
+        self.assertEqual([len(chunk) for chunk, _ in result], [2, 2, 2])
+        self.assertEqual(
+            [finished for _, finished in result],
+            [[], [], ["repo/workdir/big.py", "repo/workdir/small.py"]],
+        )
+
+    def test_disabled(self):
+        locality.configure(False)
+        objs = [focal(f"t{i % 2}.py", "m.f", i) for i in range(5)]
+        result = list(chunks(objs, 2))
+        self.assertEqual(
+            [chunk for chunk, _ in result], [objs[0:2], objs[2:4], objs[4:]]
+        )
+        self.assertTrue(all(finished == [] for _, finished in result))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
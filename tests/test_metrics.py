@@ -0,0 +1,78 @@
+import unittest
+import os
+import logging
+import tempfile
+import threading
+from unitsyncer import metrics
+from unitsyncer.metrics import Histogram, MetricsRecorder
+
+
+class TestHistogram(unittest.TestCase):
+    def test_percentile(self):
+        hist = Histogram()
+        for ms in range(1, 101):
+            hist.add(ms / 1000)
+
+        self.assertEqual(hist.count, 100)
+        self.assertAlmostEqual(hist.total, 5.05)
+        # buckets are about 19% wide
+        self.assertAlmostEqual(hist.percentile(50), 0.050, delta=0.050 * 0.2)
+        self.assertAlmostEqual(hist.percentile(99), 0.099, delta=0.099 * 0.2)
+        self.assertEqual(hist.percentile(100), 0.1)
+        self.assertEqual(hist.percentile(0), 0.001)
+
+    def test_round_trip(self):
+        hist = Histogram()
+        for s in (1e-7, 0.002, 3.0):
+            hist.add(s)
+        copy = Histogram.from_dict(hist.to_dict())
+        copy.merge(hist)
+
+        self.assertEqual(copy.count, 6)
+        self.assertEqual(copy.buckets[0], 2)
+        self.assertEqual(copy.percentile(50), hist.percentile(50))
+
+
+class TestMetricsRecorder(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "metrics.jsonl")
+        metrics.RECORDER.histograms.clear()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_scope_and_flush(self):
+        with metrics.scope("repo", "python"):
+            with metrics.timer("open_file"):
+                pass
+            metrics.record("definition", 0.01)
+        metrics.flush(self.path)
+
+        merged = metrics.load(self.path, by_repo=True)
+        self.assertEqual(
+            set(merged),
+            {("repo", "python", "open_file"), ("repo", "python", "definition")},
+        )
+        self.assertEqual(metrics.RECORDER.histograms, {})
+
+    def test_thread_safe(self):
+        recorder = MetricsRecorder()
+
+        def work():
+            for _ in range(1000):
+                recorder.record("definition", 0.001)
+
+        threads = [threading.Thread(target=work) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        recorder.flush(self.path)
+        self.assertEqual(metrics.load(self.path)[("", "definition")].count, 4000)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,56 @@
+import unittest
+import os
+import logging
+from unitsyncer.notifications import NotificationRouter
+from unitsyncer.util import ReadPipe
+
+
+class TestNotificationRouter(unittest.TestCase):
+    def test_policy(self):
+        router = NotificationRouter(ring_size=4)
+        for i in range(10):
+            router.route("textDocument/publishDiagnostics", {"diagnostics": [i]})
+            router.route("telemetry/event", {"i": i})
+            router.route("$/progress", {"i": i})
+
+        self.assertEqual(router.counts["textDocument/publishDiagnostics"], 10)
+        self.assertNotIn("telemetry/event", router.counts)
+        # only the last kept notifications are remembered
+        self.assertEqual([params["i"] for _, params in router.recent], [6, 7, 8, 9])
+
+    def test_handlers(self):
+        router = NotificationRouter()
+        seen = []
+        router.on("telemetry/event", seen.append)
+        router.route("telemetry/event", 1)
+        router.route("window/logMessage", 2)
+        self.assertEqual(seen, [1])
+
+    def test_pylspclient_callbacks(self):
+        router = NotificationRouter()
+        callbacks = router.callbacks()
+        self.assertIn("any/method", callbacks)
+        callbacks["any/method"]({"x": 1})
+        self.assertEqual(list(router.recent), [("any/method", {"x": 1})])
+
+
+class TestReadPipe(unittest.TestCase):
+    def test_keeps_tail(self):
+        read_fd, write_fd = os.pipe()
+        with os.fdopen(read_fd, "rb") as pipe:
+            reader = ReadPipe(pipe, tail_chunks=2)
+            reader.start()
+            with os.fdopen(write_fd, "wb") as writer:
+                for _ in range(100):
+                    writer.write(b"x" * 4096)
+                    writer.flush()
+                writer.write(b"last line\n")
+            reader.join(timeout=5)
+        self.assertFalse(reader.is_alive())
+        self.assertLessEqual(len(reader.tail), 2)
+        self.assertTrue(reader.text().endswith("last line\n"))
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,136 @@
+import unittest
+import os
+import logging
+import tempfile
+from returns.maybe import Nothing
+from unitsyncer.parse_cache import ParseCache, ParsedFile
+from frontend.parser.ast_util import iter_preorder
+
+
+class TestParseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "add.py")
+        self.write(self.path, "def add(x, y):\n    return x + y\n")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    @staticmethod
+    def write(path: str, code: str):
+        with open(path, "w") as f:
+            f.write(code)
+
+    def test_hit_and_miss(self):
+        cache = ParseCache()
+        first = cache.get(self.path, "python").unwrap()
+        second = cache.get(self.path, "python").unwrap()
+
+        self.assertIs(first, second)
+        self.assertIsNotNone(first.py_tree)
+        self.assertEqual(cache.stats["misses"], 1)
+        self.assertEqual(cache.stats["hits"], 1)
+
+    def test_invalidate_on_change(self):
+        cache = ParseCache()
+        first = cache.get(self.path, "python").unwrap()
+        self.write(self.path, "def sub(x, y):\n    return x - y\n\n")
+        second = cache.get(self.path, "python").unwrap()
+
+        self.assertIsNot(first, second)
+        self.assertIn("sub", second.code)
+        self.assertEqual(cache.stats["misses"], 2)
+        self.assertEqual(len(cache.entries), 1)
+
+    def test_tree_sitter_replaces_tabs(self):
+        path = os.path.join(self.tmp_dir.name, "add.go")
+        self.write(path, "func add(x int) int {\n\treturn x\n}\n")
+        parsed = ParseCache().get(path, "go").unwrap()
+
+        self.assertNotIn("\t", parsed.code)
+        self.assertIsNotNone(parsed.ts_tree)
+
+    def test_eviction(self):
+        other = os.path.join(self.tmp_dir.name, "sub.py")
+        self.write(other, "def sub(x, y):\n    return x - y\n")
+        # room for one of the two files
+        cache = ParseCache(max_bytes=ParseCache().get(other, "python").unwrap().size)
+        cache.get(self.path, "python")
+        cache.get(other, "python")
+
+        self.assertEqual(cache.stats["evictions"], 1)
+        self.assertEqual(list(cache.entries.keys()), [(other, "python")])
+        self.assertLessEqual(cache.n_bytes, cache.max_bytes)
+
+    def test_bound_counts_trees(self):
+        paths = []
+        for i in range(10):
+            paths.append(os.path.join(self.tmp_dir.name, f"f{i}.go"))
+            self.write(paths[-1], f"func f{i}(x int) int {{\n\treturn x\n}}\n")
+        code_size = len(ParseCache().get(paths[0], "go").unwrap().code)
+        # room for the text of all files, but for the trees of only three
+        cache = ParseCache(max_bytes=code_size * 80)
+        for path in paths:
+            cache.get(path, "go")
+
+        self.assertLessEqual(cache.n_bytes, cache.max_bytes)
+        self.assertEqual(len(cache.entries), 3)
+        self.assertEqual(
+            cache.n_bytes, sum(parsed.size for _, parsed in cache.entries.values())
+        )
+        self.assertGreater(cache.n_bytes, code_size * len(cache.entries))
+
+    def test_missing_file(self):
+        cache = ParseCache()
+        self.assertEqual(cache.get(self.path + ".missing", "python"), Nothing)
+        self.assertEqual(cache.get(self.path, "haskell"), Nothing)
+
+
+class TestDefinitionIndex(unittest.TestCase):
+    java_code = """class A {
+    @Test
+    @Deprecated
+    public void a() {
+        Runnable r = new Runnable() {
+            public void run() {}
+        };
+    }
+
+    int b() { return 1; }
+}
+"""
+
+    def test_iter_preorder(self):
+        parsed = ParsedFile("A.java", self.java_code, "java")
+        root = parsed.ts_tree.root_node
+        for node_type in (None, "method_declaration", "identifier"):
+            self.assertEqual(
+                list(iter_preorder(root, node_type)),
+                parsed.ast_util.get_all_nodes_of_type(root, node_type),
+            )
+
+    def test_at_line(self):
+        parsed = ParsedFile("A.java", self.java_code, "java")
+        index = parsed.def_index("method_declaration")
+
+        self.assertEqual(index.at_line(5).unwrap().start_point, (5, 12))
+        self.assertEqual(index.at_line(9).unwrap().start_point, (9, 4))
+        self.assertEqual(index.at_line(4), Nothing)
+        self.assertIs(parsed.def_index("method_declaration"), index)
+
+    def test_first_reaching(self):
+        parsed = ParsedFile("A.java", self.java_code, "java")
+        index = parsed.def_index(
+            "method_declaration", lambda n: n.start_point[0] + 2 * (n.start_point[0] == 1)
+        )
+
+        # a() starts at its annotation on line 1 and is reached up to line 3
+        self.assertEqual(index.first_reaching(0).unwrap().start_point, (1, 4))
+        self.assertEqual(index.first_reaching(3).unwrap().start_point, (1, 4))
+        self.assertEqual(index.first_reaching(4).unwrap().start_point, (5, 12))
+        self.assertEqual(index.first_reaching(10), Nothing)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+import logging
+from pylspclient.lsp_structs import LANGUAGE_IDENTIFIER
+from unitsyncer import profiles
+from unitsyncer.common import CAPABILITIES
+from unitsyncer.profiles import merge
+
+
+class TestProfiles(unittest.TestCase):
+    def setUp(self):
+        self.profile = profiles.PROFILE
+
+    def tearDown(self):
+        profiles.configure(self.profile)
+
+    def test_unknown_profile(self):
+        with self.assertRaises(ValueError):
+            profiles.configure("minimal")
+
+    def test_full_keeps_defaults(self):
+        profiles.configure("full")
+        python = LANGUAGE_IDENTIFIER.PYTHON
+        self.assertEqual(profiles.capabilities(), CAPABILITIES)
+        self.assertIsNone(profiles.settings(python))
+        self.assertEqual(profiles.configuration(python, ["pylsp"]), [None])
+        self.assertEqual(profiles.server_args(LANGUAGE_IDENTIFIER.CPP), [])
+        base = {"usePlaceholders": True}
+        self.assertIs(profiles.init_options(LANGUAGE_IDENTIFIER.GO, base), base)
+
+    def test_definition(self):
+        profiles.configure("definition")
+        capabilities = profiles.capabilities()
+        self.assertEqual(
+            set(capabilities["textDocument"]), {"synchronization", "definition"}
+        )
+
+        plugins = profiles.settings(LANGUAGE_IDENTIFIER.PYTHON)["pylsp"]["plugins"]
+        self.assertNotIn("jedi_definition", plugins)
+        self.assertFalse(plugins["pylint"]["enabled"])
+        go = profiles.configuration(LANGUAGE_IDENTIFIER.GO, ["gopls", None])
+        self.assertFalse(go[0]["staticcheck"])
+        self.assertIsNone(go[1])
+        self.assertIn(
+            "--clang-tidy=false", profiles.server_args(LANGUAGE_IDENTIFIER.CPP)
+        )
+
+    def test_init_options_merged(self):
+        profiles.configure("definition")
+        base = {"usePlaceholders": True}
+        options = profiles.init_options(LANGUAGE_IDENTIFIER.GO, base)
+        self.assertTrue(options["usePlaceholders"])
+        self.assertFalse(options["staticcheck"])
+        self.assertIsNone(profiles.init_options(LANGUAGE_IDENTIFIER.RUST))
+        self.assertIsNone(profiles.init_options(LANGUAGE_IDENTIFIER.PYTHON))
+
+    def test_merge(self):
+        base = {"a": {"b": 1, "c": 2}, "d": 3}
+        merged = merge(base, {"a": {"c": 4}, "e": 5})
+        self.assertEqual(merged, {"a": {"b": 1, "c": 4}, "d": 3, "e": 5})
+        self.assertEqual(base["a"]["c"], 2)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,95 @@
+import unittest
+import asyncio
+import logging
+import threading
+import time
+import sansio_lsp_client as lsp
+from pylspclient.lsp_structs import LANGUAGE_IDENTIFIER
+from unitsyncer import readiness
+from unitsyncer.readiness import IndexingTracker, is_premature, record_retry
+
+
+def progress(kind: str, token: str = "index") -> dict:
+    return {"token": token, "value": {"kind": kind}}
+
+
+class TestIndexingTracker(unittest.TestCase):
+    def test_holds_until_progress_ends(self):
+        tracker = IndexingTracker(LANGUAGE_IDENTIFIER.GO, timeout=5)
+        tracker.on_progress(progress("begin"))
+        tracker.on_progress(progress("begin", "other"))
+        tracker.on_progress(progress("end"))
+        self.assertFalse(tracker.ready())
+
+        threading.Timer(0.2, tracker.on_progress, [progress("end", "other")]).start()
+        waited = tracker.wait()
+        self.assertGreaterEqual(waited, 0.15)
+        self.assertLess(waited, 2)
+
+    def test_sansio_events(self):
+        tracker = IndexingTracker(LANGUAGE_IDENTIFIER.GO, timeout=5)
+        begin = lsp.WorkDoneProgressBegin.parse_obj(
+            {"token": "t", "value": {"kind": "begin", "title": "Indexing"}}
+        )
+        tracker.on_progress(begin)
+        self.assertFalse(tracker.ready())
+        tracker.on_progress(
+            lsp.WorkDoneProgressEnd.parse_obj({"token": "t", "value": {"kind": "end"}})
+        )
+        self.assertTrue(tracker.ready())
+
+    def test_quiet_server(self):
+        go = IndexingTracker(LANGUAGE_IDENTIFIER.GO, timeout=5, quiet=0.2)
+        self.assertFalse(go.ready())
+        self.assertGreaterEqual(go.wait(), 0.15)
+        # servers that do not index are not held unless they report progress
+        python = IndexingTracker(LANGUAGE_IDENTIFIER.PYTHON, timeout=5, quiet=0.2)
+        self.assertTrue(python.ready())
+
+    def test_cap_and_cancel(self):
+        tracker = IndexingTracker(LANGUAGE_IDENTIFIER.JAVA, timeout=0.2)
+        tracker.on_progress(progress("begin"))
+        self.assertLess(tracker.wait(), 1)
+
+        tracker.reset()
+        tracker.on_progress(progress("begin"))
+        threading.Timer(0.1, tracker.cancel).start()
+        start = time.monotonic()
+        tracker.wait()
+        self.assertLess(time.monotonic() - start, 0.2)
+
+    def test_wait_async(self):
+        tracker = IndexingTracker(LANGUAGE_IDENTIFIER.GO, timeout=5)
+        tracker.on_progress(progress("begin"))
+
+        async def run():
+            asyncio.get_running_loop().call_later(
+                0.1, tracker.on_progress, progress("end")
+            )
+            return await tracker.wait_async(interval=0.02)
+
+        self.assertGreaterEqual(asyncio.run(run()), 0.05)
+
+
+class TestRetry(unittest.TestCase):
+    def test_only_indexing_servers(self):
+        self.assertTrue(readiness.defers(LANGUAGE_IDENTIFIER.GO))
+        # RustSynchronizer indexes with tree-sitter, there is no server to wait for
+        self.assertFalse(readiness.defers(LANGUAGE_IDENTIFIER.RUST))
+        self.assertTrue(IndexingTracker(LANGUAGE_IDENTIFIER.RUST).ready())
+
+    def test_record_retry(self):
+        readiness.STATS.clear()
+        self.assertTrue(is_premature({"error": "No definition found: []"}))
+        self.assertFalse(is_premature({"error": "GoDef Request Failed"}))
+        self.assertFalse(is_premature({"code": "def f(): ..."}))
+
+        results = [{"code": "def f(): ..."}, {"error": "No definition found"}]
+        self.assertIs(record_retry(results), results)
+        self.assertEqual(readiness.STATS["retried"], 2)
+        self.assertEqual(readiness.STATS["recovered"], 1)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
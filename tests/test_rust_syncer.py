@@ -0,0 +1,118 @@
+import unittest
+import os
+import logging
+import tempfile
+from unittest import mock
+from unitsyncer import rust_syncer
+from unitsyncer.parse_cache import PARSE_CACHE
+from unitsyncer.rust_syncer import RustSynchronizer, module_path, cached_functions
+
+
+class TestRustSynchronizer(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = self.tmp_dir.name
+        layout = {
+            "src/lib.rs": "pub fn new() -> u8 { 0 }\n",
+            "src/engine/mod.rs": (
+                "pub struct Engine;\n"
+                "impl Engine {\n"
+                "    pub fn new() -> Self { Engine }\n"
+                "    pub fn encode(&self) -> u8 { 1 }\n"
+                "}\n"
+            ),
+            "src/codec.rs": (
+                "pub struct Codec<T>(T);\n"
+                "impl<T> Codec<T> {\n"
+                "    pub fn encode(&self) -> u8 { 2 }\n"
+                "}\n"
+                "pub fn encode(x: u8) -> u8 { x }\n"
+            ),
+            "target/debug/build/out/gen.rs": "pub fn new() -> u8 { 3 }\n",
+        }
+        for path, content in layout.items():
+            full_path = os.path.join(self.root, path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, "w") as f:
+                f.write(content)
+        self.cache_dir = os.path.join(self.root, "cache")
+        self.syncer = RustSynchronizer(self.root, cache_dir=self.cache_dir)
+        self.syncer.initialize()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def definition(self, focal_name: str) -> list[tuple[str, int]]:
+        return [
+            (os.path.relpath(path, self.root), loc.range.start.line)
+            for path, loc in self.syncer.goto_definition(focal_name)
+        ]
+
+    def test_module_path(self):
+        self.assertEqual(module_path(self.root, f"{self.root}/src/lib.rs"), [])
+        self.assertEqual(
+            module_path(self.root, f"{self.root}/src/engine/mod.rs"), ["engine"]
+        )
+
+    def test_qualified_path(self):
+        self.assertEqual(self.definition("Engine::new()"), [("src/engine/mod.rs", 2)])
+        self.assertEqual(
+            self.definition("crate::engine::Engine::new()"),
+            [("src/engine/mod.rs", 2)],
+        )
+        self.assertEqual(self.definition("codec::encode(1)"), [("src/codec.rs", 4)])
+        self.assertEqual(self.definition("Missing::new()"), [])
+
+    def test_method_of_known_type(self):
+        self.assertEqual(
+            self.definition("Codec::new(1).encode()"), [("src/codec.rs", 2)]
+        )
+        self.assertEqual(
+            self.definition("Engine::new().encode().unwrap()"),
+            [("src/engine/mod.rs", 3)],
+        )
+
+    def test_method_ranked_by_receiver(self):
+        self.assertEqual(
+            self.definition("engine.encode()")[0], ("src/engine/mod.rs", 3)
+        )
+        self.assertEqual(len(self.definition("engine.encode()")), 3)
+
+    def test_prune_target(self):
+        self.assertNotIn(
+            os.path.join(self.root, "target/debug/build/out/gen.rs"),
+            self.syncer.file_func_map,
+        )
+        self.assertEqual(
+            sorted(self.definition("new()")),
+            [("src/engine/mod.rs", 2), ("src/lib.rs", 0)],
+        )
+
+    def test_cached_functions(self):
+        file_path = os.path.join(self.root, "src/codec.rs")
+        with mock.patch.object(rust_syncer, "parse_functions") as parse:
+            records = cached_functions(file_path, self.cache_dir)
+            parse.assert_not_called()
+        self.assertEqual(
+            records,
+            [
+                ("encode", "Codec::encode", 2, 4, 2, 36),
+                ("encode", "encode", 4, 0, 4, 32),
+            ],
+        )
+
+        # a changed file misses the cache
+        with open(file_path, "a") as f:
+            f.write("fn extra() {}\n")
+        self.assertEqual(cached_functions(file_path, self.cache_dir)[-1][1], "extra")
+
+    def test_index_keeps_no_tree(self):
+        file_path = os.path.join(self.root, "src/codec.rs")
+        PARSE_CACHE.clear()
+        cached_functions(file_path, None)
+        self.assertEqual(PARSE_CACHE.n_bytes, 0)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+import os
+import logging
+import tempfile
+from unitsyncer.scheduler import (
+    BYTES_PER_FOCAL,
+    CostLog,
+    WorkUnit,
+    plan,
+    scan_focal_files,
+)
+from unitsyncer.journal import recover_jsonl
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        # big.jsonl spans three workdirs, small.jsonl one
+        self.focal = {
+            "big.jsonl": {f"big/m{i}": [{}] * (100 - 10 * i) for i in range(3)},
+            "small.jsonl": {"small/small": [{}] * 10},
+        }
+        self.sizes = {
+            focal_file: BYTES_PER_FOCAL * sum(map(len, wd.values()))
+            for focal_file, wd in self.focal.items()
+        }
+        self.loaded: list[str] = []
+
+    def load_workdirs(self, focal_file: str) -> dict[str, list[dict]]:
+        self.loaded.append(focal_file)
+        return self.focal[focal_file]
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_longest_first(self):
+        units = plan(self.sizes, self.load_workdirs, 8)
+        costs = [u.cost for u in units]
+        self.assertEqual(costs, sorted(costs, reverse=True))
+
+    def test_split_big_file(self):
+        units = plan(self.sizes, self.load_workdirs, 2)
+        big = [u for u in units if u.focal_file == "big.jsonl"]
+
+        self.assertEqual(
+            [u.workdirs for u in big], [["big/m0"], ["big/m1"], ["big/m2"]]
+        )
+        self.assertEqual(big[0].n_focal, 100)
+        self.assertEqual(
+            [(u.focal_file, u.workdirs) for u in units if u.focal_file != "big.jsonl"],
+            [("small.jsonl", None)],
+        )
+        # the small file is planned from its size alone
+        self.assertEqual(self.loaded, ["big.jsonl"])
+
+    def test_no_split_with_one_worker(self):
+        units = plan(self.sizes, self.load_workdirs, 1)
+        self.assertEqual([u.workdirs for u in units], [None, None])
+        self.assertEqual(units[0].n_focal, 270)
+        self.assertEqual(self.loaded, [])
+
+    def test_scan_focal_files(self):
+        os.makedirs(os.path.join(self.tmp_dir.name, "go"))
+        for path, content in {"a.jsonl": "{}\n", "go/b.jsonl": "{}\n{}\n"}.items():
+            with open(os.path.join(self.tmp_dir.name, path), "w") as f:
+                f.write(content)
+        with open(os.path.join(self.tmp_dir.name, "notes.txt"), "w") as f:
+            f.write("not a focal file")
+
+        self.assertEqual(
+            scan_focal_files(self.tmp_dir.name),
+            {
+                os.path.join(self.tmp_dir.name, "a.jsonl"): 3,
+                os.path.join(self.tmp_dir.name, "go", "b.jsonl"): 6,
+            },
+        )
+
+    def test_cost_log(self):
+        path = os.path.join(self.tmp_dir.name, "schedule.jsonl")
+        unit = WorkUnit("small.jsonl", None, 10, 1)
+        CostLog(path).record(unit, 1.5)
+
+        (row,) = recover_jsonl(path)
+        self.assertEqual(row["predicted"], round(unit.cost, 3))
+        self.assertEqual(row["actual"], 1.5)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
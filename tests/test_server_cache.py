@@ -0,0 +1,85 @@
+import unittest
+import os
+import logging
+import tempfile
+from pylspclient.lsp_structs import LANGUAGE_IDENTIFIER
+from unitsyncer import server_cache
+from unitsyncer.server_cache import cache_usage, get_lsp_env, prune, repo_cache_dir
+
+
+class TestServerCache(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp_dir.name, "servers")
+        self.repos_root = os.path.join(self.tmp_dir.name, "repos")
+        self.server_cache = server_cache.SERVER_CACHE
+        self.repos_root_default = server_cache.REPOS_ROOT
+        server_cache.configure(self.root, self.repos_root)
+
+    def tearDown(self):
+        server_cache.configure(self.server_cache, self.repos_root_default)
+        self.tmp_dir.cleanup()
+
+    def workspace(self, repo: str, *workdir: str) -> str:
+        return os.path.join(self.repos_root, repo, *workdir)
+
+    def test_one_dir_per_repo(self):
+        go = LANGUAGE_IDENTIFIER.GO
+        a1 = repo_cache_dir(self.workspace("a", "a-1"), go)
+        a2 = repo_cache_dir(self.workspace("a", "a-2"), go)
+        b1 = repo_cache_dir(self.workspace("b", "b-1"), go)
+        self.assertEqual(a1, a2)
+        self.assertNotEqual(a1, b1)
+        self.assertTrue(a1.startswith(os.path.join(self.root, go, "a-")))
+
+        env = get_lsp_env(go, a1)
+        self.assertEqual(env["GOPLSCACHE"], os.path.join(a1, "gopls"))
+        self.assertIsNone(get_lsp_env(go, None))
+
+    def test_nested_workdirs(self):
+        java = LANGUAGE_IDENTIFIER.JAVA
+        repo = repo_cache_dir(self.workspace("a", "sha"), java)
+        self.assertEqual(repo_cache_dir(self.workspace("a", "sha", "mod"), java), repo)
+        self.assertEqual(
+            repo_cache_dir(self.workspace("a", "sha", "mod", "sub"), java), repo
+        )
+
+    def test_repos_right_under_root(self):
+        alice = repo_cache_dir(self.workspace("alice-proj1"), "python")
+        bob = repo_cache_dir(self.workspace("bob-proj2"), "python")
+        self.assertNotEqual(alice, bob)
+        self.assertTrue(alice.startswith(os.path.join(self.root, "python", "alice-")))
+
+        # a repo of the same name under another repos root
+        other_root = os.path.join(self.tmp_dir.name, "other")
+        other = repo_cache_dir(
+            os.path.join(other_root, "alice-proj1"), "python", other_root
+        )
+        self.assertNotEqual(other, alice)
+
+    def test_outside_repos_root(self):
+        scratch = os.path.join(self.tmp_dir.name, "scratch")
+        self.assertIsNone(repo_cache_dir(scratch, "python"))
+        self.assertIsNone(repo_cache_dir(self.repos_root, "python"))
+        self.assertFalse(os.path.exists(self.root))
+
+    def test_disabled(self):
+        server_cache.configure(None)
+        self.assertIsNone(repo_cache_dir(self.workspace("a", "a-1"), "rust"))
+
+    def test_prune_least_recently_used(self):
+        dirs = [repo_cache_dir(self.workspace(r, "w"), "c") for r in "abc"]
+        for i, cache_dir in enumerate(dirs):
+            with open(os.path.join(cache_dir, "index"), "wb") as f:
+                f.write(b"x" * 1000)
+            os.utime(cache_dir, (i, i))
+        self.assertEqual(sum(cache_usage().values()), 3000)
+
+        self.assertEqual(prune(2000), dirs[:1])
+        self.assertEqual(sorted(cache_usage()), dirs[1:])
+        self.assertEqual(prune(2000), [])
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+import logging
+from unittest import mock
+from unitsyncer.sync import Synchronizer
+from unitsyncer import server_pool
+from unitsyncer.server_pool import SynchronizerPool
+
+
+class FakeSynchronizer(Synchronizer):
+    can_switch = True
+
+    def __init__(self, workspace_dir: str, language: str, max_inflight=8) -> None:
+        super().__init__(workspace_dir, language)
+        self.stopped = False
+        self.workspaces = [self.workspace_dir]
+
+    def initialize(self, timeout: int = 10):
+        pass
+
+    def switch_workspace(self, workspace_dir: str) -> bool:
+        if self.can_switch:
+            self.workspaces.append(workspace_dir)
+        return self.can_switch
+
+    def stop(self):
+        self.stopped = True
+
+
+@mock.patch.object(server_pool, "new_synchronizer", FakeSynchronizer)
+class TestSynchronizerPool(unittest.TestCase):
+    def test_reuse_across_repos(self):
+        pool = SynchronizerPool(max_repos=10)
+        first = pool.acquire("/repos/a", "python")
+        second = pool.acquire("/repos/b", "python")
+
+        self.assertIs(first, second)
+        self.assertEqual(first.workspaces, ["/repos/a", "/repos/b"])
+        self.assertEqual(pool.stats["cold_starts"], 1)
+        self.assertEqual(pool.stats["cold_starts_avoided"], 1)
+
+    def test_one_server_per_language(self):
+        pool = SynchronizerPool()
+        py = pool.acquire("/repos/a", "python")
+        cpp = pool.acquire("/repos/b", "cpp")
+
+        self.assertIsNot(py, cpp)
+        self.assertEqual(pool.stats["cold_starts"], 2)
+
+    def test_recycle_after_max_repos(self):
+        pool = SynchronizerPool(max_repos=2)
+        first = pool.acquire("/repos/a", "python")
+        pool.acquire("/repos/b", "python")
+        third = pool.acquire("/repos/c", "python")
+
+        self.assertIsNot(first, third)
+        self.assertTrue(first.stopped)
+        self.assertEqual(pool.stats["recycled"], 1)
+        self.assertEqual(pool.stats["cold_starts"], 2)
+
+    def test_restart_when_switch_unsupported(self):
+        pool = SynchronizerPool()
+        with mock.patch.object(FakeSynchronizer, "can_switch", False):
+            first = pool.acquire("/repos/a", "java")
+            second = pool.acquire("/repos/b", "java")
+
+        self.assertIsNot(first, second)
+        self.assertTrue(first.stopped)
+        self.assertEqual(pool.stats["cold_starts"], 2)
+        self.assertEqual(pool.stats["cold_starts_avoided"], 0)
+
+    def test_discard_and_close(self):
+        pool = SynchronizerPool()
+        syncer = pool.acquire("/repos/a", "python")
+        pool.discard("python")
+        self.assertTrue(syncer.stopped)
+
+        syncer = pool.acquire("/repos/b", "python")
+        pool.close()
+        self.assertTrue(syncer.stopped)
+        self.assertEqual(pool.syncers, {})
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,126 @@
+import unittest
+import os
+import logging
+import tempfile
+from unittest import mock
+from returns.result import Success
+from unitsyncer import definition_cache, server_cache
+from unitsyncer.parse_cache import PARSE_CACHE
+from unitsyncer.static_python_syncer import (
+    StaticPythonSynchronizer,
+    called_name,
+    module_names,
+)
+
+
+class TestStaticPythonSynchronizer(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        # keep the user's definition and server caches out of the test
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.addCleanup(definition_cache.configure, definition_cache.CACHE_PATH)
+        self.addCleanup(server_cache.configure, server_cache.SERVER_CACHE)
+        definition_cache.configure(os.path.join(cache_dir.name, "definitions.sqlite"))
+        server_cache.configure(os.path.join(cache_dir.name, "servers"))
+        self.repos_root = self.tmp_dir.name
+        self.workdir = "owner-repo/owner-repo-abc"
+        self.root = os.path.join(self.repos_root, self.workdir)
+        layout = {
+            "src/pkg/__init__.py": "from .core import add as plus\n",
+            "src/pkg/core.py": (
+                "def add(x, y):\n"
+                "    return x + y\n"
+                "\n"
+                "class Person:\n"
+                "    def greet(self):\n"
+                "        return 'hi'\n"
+                "\n"
+                "async def fetch(x):\n"
+                "    return x\n"
+            ),
+            "tests/test_core.py": (
+                "import pkg.core as core\n"
+                "from pkg import plus\n"
+                "\n"
+                "def test_add():\n"
+                "    assert core.add(1, 2) == plus(1, 2)\n"
+                "    p = core.Person()\n"
+                "    assert p.greet() == 'hi'\n"
+            ),
+            "py2.py": "print 'not python 3'\n",
+        }
+        for path, content in layout.items():
+            full_path = os.path.join(self.root, path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, "w") as f:
+                f.write(content)
+        self.test_file = os.path.join(self.root, "tests/test_core.py")
+        self.syncer = StaticPythonSynchronizer(self.root)
+        self.syncer.initialize()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def resolve(self, focal_id: str, line: int = 0, col: int = 0):
+        match self.syncer.resolve(focal_id, self.test_file, line, col):
+            case (path, def_line, def_col):
+                return os.path.relpath(path, self.root), def_line, def_col
+            case None:
+                return None
+
+    def test_module_names(self):
+        self.assertEqual(
+            module_names("src/pkg/core.py", lambda d: d == "src/pkg"),
+            ["src.pkg.core", "pkg.core"],
+        )
+        self.assertEqual(module_names("pkg/__init__.py", lambda d: True), ["pkg"])
+
+    def test_called_name(self):
+        line = "    assert core.add(1, 2) == plus(1, 2)"
+        self.assertEqual(called_name(line, line.index("add")), "core.add")
+        self.assertEqual(called_name(line, line.index("plus")), "plus")
+        self.assertIsNone(called_name("make().add(1)", 7))
+
+    def test_resolve_focal_id(self):
+        self.assertEqual(self.resolve("src.pkg.core.add"), ("src/pkg/core.py", 0, 4))
+        self.assertEqual(self.resolve("pkg.plus"), ("src/pkg/core.py", 0, 4))
+        self.assertEqual(
+            self.resolve(f"{self.workdir}/src/pkg/core.py::Person::greet"),
+            ("src/pkg/core.py", 4, 8),
+        )
+        self.assertEqual(self.resolve("pkg.core.fetch"), ("src/pkg/core.py", 7, 10))
+        (fetch,) = self.syncer.get_sources_of_calls(
+            [("pkg.core.fetch", self.test_file, 0, 0)]
+        )
+        self.assertTrue(fetch.unwrap()[0].startswith("async def fetch(x):"))
+
+    def test_index_keeps_no_tree(self):
+        PARSE_CACHE.clear()
+        self.syncer.initialize()
+        self.assertEqual(len(PARSE_CACHE.entries), 0)
+
+    def test_resolve_call_site(self):
+        self.assertEqual(self.resolve("unknown", 4, 16), ("src/pkg/core.py", 0, 4))
+        self.assertEqual(self.resolve("unknown", 4, 29), ("src/pkg/core.py", 0, 4))
+        # method of a local variable
+        self.assertIsNone(self.resolve("unknown", 6, 13))
+
+    def test_fallback_on_miss(self):
+        fallback = mock.Mock()
+        fallback.get_sources_of_calls.return_value = [Success(("lsp", None, None))]
+        with mock.patch.object(self.syncer, "_fallback", return_value=fallback):
+            results = self.syncer.get_sources_of_calls(
+                [
+                    ("pkg.core.add", self.test_file, 4, 16),
+                    ("unknown", self.test_file, 6, 13),
+                ]
+            )
+        self.assertEqual(results[0].unwrap()[0], "def add(x, y):\n    return x + y")
+        self.assertEqual(results[1], Success(("lsp", None, None)))
+        self.assertEqual(self.syncer.stats, {"hits": 1, "misses": 1})
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
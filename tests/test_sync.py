@@ -0,0 +1,92 @@
+import unittest
+import logging
+import time
+from unittest import mock
+from returns.result import Success, Failure
+from unitsyncer.sync import (
+    PipelinedLspEndpoint,
+    pipeline,
+    parse_definition_response,
+)
+
+
+class TestPipeline(unittest.TestCase):
+    def test_window_and_order(self):
+        sent: list[int] = []
+        in_flight: set[int] = set()
+        max_in_flight = 0
+
+        def send(x: int):
+            nonlocal max_in_flight
+            sent.append(x)
+            in_flight.add(x)
+            max_in_flight = max(max_in_flight, len(in_flight))
+            return Success(x)
+
+        def receive(rpc_id: int):
+            in_flight.remove(rpc_id)
+            return rpc_id * 10
+
+        results = pipeline(list(range(20)), send, receive, Failure, window=4)
+
+        self.assertEqual(results, [x * 10 for x in range(20)])
+        self.assertEqual(sent, list(range(20)))
+        self.assertEqual(max_in_flight, 4)
+
+    def test_send_failure(self):
+        def send(x: int):
+            return Failure("boom") if x == 1 else Success(x)
+
+        results = pipeline([0, 1, 2], send, Success, Failure, window=2)
+        self.assertEqual(results, [Success(0), Failure("boom"), Success(2)])
+
+
+class TestPipelinedLspEndpoint(unittest.TestCase):
+    def test_reply_stamped_on_arrival(self):
+        endpoint = PipelinedLspEndpoint(mock.Mock())
+        first = endpoint.send_request("textDocument/definition")
+        second = endpoint.send_request("textDocument/definition")
+        endpoint.handle_result(first, [], None)
+        endpoint.handle_result(second, None, {"code": -32603, "message": "boom"})
+        arrived = time.perf_counter()
+        time.sleep(0.05)
+
+        result, error, received_at = endpoint.wait_for_reply(first)
+        self.assertEqual((result, error), ([], None))
+        # the time it waited for its turn is not part of it
+        self.assertLessEqual(received_at, arrived)
+        with self.assertRaisesRegex(Exception, "boom"):
+            endpoint.wait_for_response(second)
+
+
+class TestParseDefinitionResponse(unittest.TestCase):
+    range_ = {
+        "start": {"line": 1, "character": 4},
+        "end": {"line": 1, "character": 7},
+    }
+
+    def test_empty(self):
+        self.assertEqual(parse_definition_response(None), [])
+        self.assertEqual(parse_definition_response([]), [])
+
+    def test_location(self):
+        (loc,) = parse_definition_response(
+            {"uri": "file:///a.py", "range": self.range_}
+        )
+        self.assertEqual(loc.uri, "file:///a.py")
+        self.assertEqual(loc.range.start.line, 1)
+
+    def test_location_link(self):
+        link = {
+            "targetUri": "file:///b.py",
+            "targetRange": self.range_,
+            "targetSelectionRange": self.range_,
+        }
+        (loc,) = parse_definition_response([link])
+        self.assertEqual(loc.uri, "file:///b.py")
+        self.assertEqual(loc.range.start.character, 4)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
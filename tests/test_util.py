@@ -0,0 +1,59 @@
+import unittest
+import io
+import logging
+import sys
+import threading
+from unitsyncer.util import silence
+
+
+class TestSilence(unittest.TestCase):
+    def test_overlapping_threads(self):
+        stdout = io.StringIO()
+        second_in = threading.Event()
+        first_out = threading.Event()
+
+        @silence
+        def first():
+            second_in.wait(5)
+
+        @silence
+        def second():
+            second_in.set()
+            first_out.wait(5)
+            # the first call is done, the second one is still silenced
+            print("second")
+
+        original = sys.stdout
+        sys.stdout = stdout
+        try:
+            threads = [threading.Thread(target=first), threading.Thread(target=second)]
+            threads[0].start()
+            threads[1].start()
+            threads[0].join(5)
+            first_out.set()
+            threads[1].join(5)
+            restored = sys.stdout
+        finally:
+            sys.stdout = original
+        self.assertIs(restored, stdout)
+        self.assertEqual(stdout.getvalue(), "")
+
+    def test_nested(self):
+        @silence
+        def inner():
+            return 1
+
+        @silence
+        def outer():
+            replaced = sys.stdout
+            inner()
+            return sys.stdout is replaced
+
+        original = sys.stdout
+        self.assertTrue(outer())
+        self.assertIs(sys.stdout, original)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
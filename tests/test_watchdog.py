@@ -0,0 +1,128 @@
+import unittest
+import os
+import sys
+import time
+import logging
+import tempfile
+import threading
+from unittest import mock
+from unitsyncer.sync import LSPSynchronizer, Synchronizer
+from unitsyncer.util import proc_tree_pids
+from unitsyncer import definition_cache, server_cache, watchdog
+from unitsyncer.watchdog import Deadline, RepoClock, repo_deadline
+
+# a server that never answers and leaves a child behind
+HUNG_SERVER = [
+    sys.executable,
+    "-c",
+    "import subprocess, time; subprocess.Popen(['sleep', '600']); time.sleep(600)",
+]
+
+
+def alive(pid: int) -> bool:
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().split(") ")[1][0] != "Z"
+    except OSError:
+        return False
+
+
+class FakeSynchronizer(Synchronizer):
+    def __init__(self) -> None:
+        super().__init__("/repos/a", "python")
+        self.killed = False
+
+    def kill(self):
+        self.killed = True
+
+
+class TestWatchdog(unittest.TestCase):
+    def setUp(self):
+        # keep the user's definition and server caches out of the test
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        self.addCleanup(definition_cache.configure, definition_cache.CACHE_PATH)
+        self.addCleanup(server_cache.configure, server_cache.SERVER_CACHE)
+        definition_cache.configure(os.path.join(cache_dir.name, "definitions.sqlite"))
+        server_cache.configure(os.path.join(cache_dir.name, "servers"))
+
+    def test_kill_hung_server_tree(self):
+        syncer = LSPSynchronizer(os.getcwd(), "python")
+        with mock.patch("unitsyncer.sync.get_lsp_cmd", return_value=HUNG_SERVER):
+            syncer.start_lsp_server(timeout=60)
+        syncer.lsp_endpoint.start()
+        deadline_at = time.time() + 5
+        while len(proc_tree_pids(syncer.server_pid)) < 2 and time.time() < deadline_at:
+            time.sleep(0.05)
+        pids = proc_tree_pids(syncer.server_pid)
+        self.assertEqual(len(pids), 2)
+
+        errors = []
+
+        def wait():
+            rpc_id = syncer.lsp_endpoint.send_request("shutdown")
+            try:
+                syncer.lsp_endpoint.wait_for_response(rpc_id)
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                errors.append(e)
+
+        start = time.perf_counter()
+        with Deadline(0.2, "hung") as deadline:
+            deadline.watch(syncer)
+            waiter = threading.Thread(target=wait)
+            waiter.start()
+            waiter.join(10)
+
+        self.assertTrue(deadline.expired)
+        self.assertLess(time.perf_counter() - start, 5)
+        self.assertIsInstance(errors[0], ConnectionError)
+        syncer.lsp_proc.wait(5)
+        time.sleep(0.1)
+        self.assertFalse(any(alive(pid) for pid in pids))
+
+    def test_watch_after_expiry(self):
+        with Deadline(0) as deadline:
+            while not deadline.expired:
+                time.sleep(0.01)
+            late = FakeSynchronizer()
+            deadline.watch(late)
+        self.assertTrue(late.killed)
+
+    def test_unwatch(self):
+        syncer = FakeSynchronizer()
+        with Deadline(0.1) as deadline:
+            deadline.watch(syncer)
+            deadline.unwatch(syncer)
+            time.sleep(0.2)
+        self.assertTrue(deadline.expired)
+        self.assertFalse(syncer.killed)
+
+
+class TestRepoDeadline(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        watchdog.share_deadlines(self.tmp_dir.name)
+
+    def tearDown(self):
+        watchdog.share_deadlines(None)
+        self.tmp_dir.cleanup()
+
+    def test_units_share_deadline(self):
+        first = repo_deadline("a", 10)
+        time.sleep(0.2)
+        # a later unit of the repo, e.g. in another worker, gets what is left
+        other_worker = RepoClock(self.tmp_dir.name)
+        self.assertEqual(other_worker.started_at("a"), watchdog.CLOCK.started_at("a"))
+        self.assertLessEqual(repo_deadline("a", 10), first - 0.2)
+        self.assertGreater(repo_deadline("b", 10), first - 0.2)
+        self.assertEqual(repo_deadline("a", 0.1), 0)
+        self.assertIsNone(repo_deadline("a", None))
+
+    def test_not_shared(self):
+        watchdog.share_deadlines(None)
+        self.assertEqual(repo_deadline("a", 10), 10)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
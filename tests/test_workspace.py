@@ -0,0 +1,61 @@
+import unittest
+import os
+import logging
+import tempfile
+from returns.maybe import Nothing, Some
+from unitsyncer.workspace import is_java_module, java_module_of
+
+
+class TestJavaModules(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.root = self.tmp_dir.name
+        self.repo = "spring-cloud/spring-cloud-abc"
+        layout = {
+            "pom.xml": "",
+            "core/pom.xml": "",
+            "core/src/test/java/CoreTest.java": "",
+            "gradle/settings.gradle": "",
+            "gradle/app/build.gradle.kts": "",
+            "gradle/app/src/test/java/AppTest.java": "",
+            "gradle/lib/src/test/java/LibTest.java": "",
+        }
+        for path, content in layout.items():
+            full_path = os.path.join(self.root, self.repo, path)
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            with open(full_path, "w") as f:
+                f.write(content)
+        is_java_module.cache_clear()
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def module_of(self, path: str):
+        return java_module_of(self.root, f"{self.repo}/{path}")
+
+    def test_innermost_module(self):
+        self.assertEqual(
+            self.module_of("core/src/test/java/CoreTest.java"),
+            Some(f"{self.repo}/core"),
+        )
+        self.assertEqual(
+            self.module_of("gradle/app/src/test/java/AppTest.java"),
+            Some(f"{self.repo}/gradle/app"),
+        )
+
+    def test_gradle_settings_root(self):
+        # lib has no build file of its own, it is built from the settings root
+        self.assertEqual(
+            self.module_of("gradle/lib/src/test/java/LibTest.java"),
+            Some(f"{self.repo}/gradle"),
+        )
+
+    def test_stop_at_repo(self):
+        os.remove(os.path.join(self.root, self.repo, "pom.xml"))
+        os.makedirs(os.path.join(self.root, self.repo, "plain/src"))
+        self.assertEqual(self.module_of("plain/src/Test.java"), Nothing)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
@@ -0,0 +1,304 @@
+"""Synchronizer driving a language server with asyncio
+
+Unlike LSPSynchronizer and SansioLSPSynchronizer, no thread is started per
+server: one event loop can drive several servers with many requests in flight.
+"""
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Optional
+from returns.result import Failure
+from unitsyncer.documents import OpenDocuments
+from unitsyncer.notifications import NotificationRouter
+from unitsyncer.readiness import IndexingTracker
+from unitsyncer import metrics, server_cache, health, profiles
+from unitsyncer.sync import (
+    FocalCall,
+    SourceResult,
+    get_lsp_cmd,
+    parse_definition_response,
+    STOP_TIMEOUT,
+    prepare_workspace,
+    source_of_definition,
+)
+from unitsyncer.util import path2uri, kill_proc_tree
+
+LEN_HEADER = "Content-Length: "
+
+
+class AsyncLSPSynchronizer:
+    """asyncio counterpart of LSPSynchronizer, every method is a coroutine"""
+
+    def __init__(
+        self, workspace_dir: str, language: str, max_inflight: int = 8
+    ) -> None:
+        self.workspace_dir = os.path.abspath(workspace_dir)
+        self.langID = language
+        self.max_inflight = max_inflight
+        self.root_uri = path2uri(self.workspace_dir)
+        self.documents = OpenDocuments(self._did_open, self._did_close)
+        self.timeout: float = 10
+        self.init_timeout = 10
+        self.stopped = False
+        self.monitor: Optional[health.HealthMonitor] = None
+
+        self.lsp_proc: Optional[asyncio.subprocess.Process] = None
+        self._reader: Optional[asyncio.Task] = None
+        self._next_id = 0
+        self._pending: dict[int, asyncio.Future] = {}
+        self.notifications = NotificationRouter()
+        self.indexing = IndexingTracker(language)
+        self.notifications.on("$/progress", self.indexing.on_progress)
+
+    async def initialize(self, timeout: int = 10):
+        lsp_cmd = get_lsp_cmd(self.langID)
+        if lsp_cmd is None:
+            raise ValueError(f"Language {self.langID} is not supported")
+
+        lsp_args = await asyncio.to_thread(
+            prepare_workspace, self.workspace_dir, self.langID
+        )
+        self.timeout = timeout
+        self.init_timeout = timeout
+        self.indexing.reset()
+        cache_dir = server_cache.repo_cache_dir(self.workspace_dir, self.langID)
+        self.lsp_proc = await asyncio.create_subprocess_exec(
+            *lsp_cmd,
+            *server_cache.get_lsp_args(self.langID, cache_dir),
+            *profiles.server_args(self.langID),
+            *lsp_args,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+            env=server_cache.get_lsp_env(self.langID, cache_dir),
+            start_new_session=True,
+        )
+        health.limit_memory(self.lsp_proc.pid, self.langID)
+        self._reader = asyncio.create_task(self._read_loop())
+
+        workspace_name = os.path.basename(self.workspace_dir)
+        response = await self.request(
+            "initialize",
+            {
+                "processId": os.getpid(),
+                "rootPath": self.workspace_dir,
+                "rootUri": self.root_uri,
+                "initializationOptions": profiles.init_options(self.langID),
+                "capabilities": profiles.capabilities(),
+                "trace": "off",
+                "workspaceFolders": [{"name": workspace_name, "uri": self.root_uri}],
+            },
+        )
+        logging.debug(json.dumps(response))
+        self.notify("initialized", {})
+        settings = profiles.settings(self.langID)
+        if settings is not None:
+            self.notify("workspace/didChangeConfiguration", {"settings": settings})
+        if self.monitor is None:
+            self.monitor = health.HealthMonitor(self).start()
+
+    async def restart(self):
+        """start a new server for the workspace after the previous one died or
+        stopped making sense"""
+        assert self.lsp_proc is not None
+        # the reader also stops on a malformed message of a live server
+        self.recycle()
+        await self.lsp_proc.wait()
+        health.release_cgroup(self.lsp_proc.pid)
+        self.documents.forget_all()
+        await self.initialize(self.init_timeout)
+
+    @property
+    def server_pid(self) -> Optional[int]:
+        return None if self.lsp_proc is None else self.lsp_proc.pid
+
+    def recycle(self):
+        """kill the server, the lookups it loses are replayed on a new one;
+        called from the HealthMonitor thread"""
+        self.indexing.cancel()
+        if self.lsp_proc is not None and self.lsp_proc.returncode is None:
+            kill_proc_tree(self.lsp_proc.pid)
+
+    def _crashed(self) -> bool:
+        # the reader stops at the end of the server's stdout
+        return not self.stopped and self._reader is not None and self._reader.done()
+
+    # ---------------------------- json-rpc ----------------------------
+
+    def _write(self, message: dict):
+        assert self.lsp_proc is not None and self.lsp_proc.stdin is not None
+        body = json.dumps(message).encode()
+        self.lsp_proc.stdin.write(f"{LEN_HEADER}{len(body)}\r\n\r\n".encode() + body)
+
+    def notify(self, method: str, params: Any):
+        self._write({"jsonrpc": "2.0", "method": method, "params": params})
+
+    async def request(self, method: str, params: Any, timeout: Optional[float] = None):
+        """send a request and wait for its result
+
+        Raises:
+            TimeoutError: if no response arrives within timeout
+            RuntimeError: if the server answers with an error
+            ConnectionError: if the server already closed its stdout
+        """
+        if self._reader is not None and self._reader.done():
+            raise ConnectionError("language server is gone")
+        rpc_id = self._next_id
+        self._next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self._pending[rpc_id] = future
+
+        self._write(
+            {"jsonrpc": "2.0", "id": rpc_id, "method": method, "params": params}
+        )
+        assert self.lsp_proc is not None and self.lsp_proc.stdin is not None
+        try:
+            await self.lsp_proc.stdin.drain()
+            return await asyncio.wait_for(future, timeout or self.timeout)
+        finally:
+            self._pending.pop(rpc_id, None)
+
+    async def _read_message(self) -> Optional[dict]:
+        assert self.lsp_proc is not None and self.lsp_proc.stdout is not None
+        size = None
+        while True:
+            line = await self.lsp_proc.stdout.readline()
+            if not line:
+                return None  # server quit
+            header = line.decode("utf-8").rstrip("\r\n")
+            if header == "":
+                break
+            if header.startswith(LEN_HEADER):
+                size = int(header[len(LEN_HEADER) :])
+        if size is None:
+            raise ValueError("Bad header: missing size")
+        body = await self.lsp_proc.stdout.readexactly(size)
+        message: dict = json.loads(body)
+        return message
+
+    async def _read_loop(self):
+        error: BaseException = EOFError("language server closed its stdout")
+        try:
+            while (message := await self._read_message()) is not None:
+                self._dispatch(message)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            error = e
+        for future in self._pending.values():
+            if not future.done():
+                future.set_exception(error)
+
+    def _dispatch(self, message: dict):
+        method = message.get("method")
+        rpc_id = message.get("id")
+        if method is None:
+            future = self._pending.get(rpc_id)  # type: ignore
+            if future is None or future.done():
+                return
+            if "error" in message:
+                future.set_exception(RuntimeError(message["error"].get("message")))
+            else:
+                future.set_result(message.get("result"))
+        elif rpc_id is not None:
+            self._write(
+                {"jsonrpc": "2.0", "id": rpc_id, "result": self._reply(message)}
+            )
+        else:
+            self.notifications.route(method, message.get("params"))
+
+    def _reply(self, request: dict) -> Any:
+        """default result of a request sent by the server"""
+        match request["method"]:
+            case "workspace/configuration":
+                items = request.get("params", {}).get("items", [])
+                return profiles.configuration(
+                    self.langID, [item.get("section") for item in items]
+                )
+            case "workspace/workspaceFolders":
+                name = os.path.basename(self.workspace_dir)
+                return [{"name": name, "uri": self.root_uri}]
+            case _:
+                return None
+
+    # ---------------------------- synchronizer ----------------------------
+
+    def release(self, file_paths: list[str]):
+        """close the documents of files no later lookup will come from"""
+        for file_path in file_paths:
+            self.documents.close(path2uri(file_path))
+
+    def _did_open(self, uri: str, text: str):
+        document = {"uri": uri, "languageId": self.langID, "version": 1, "text": text}
+        self.notify("textDocument/didOpen", {"textDocument": document})
+
+    def _did_close(self, uri: str):
+        self.notify("textDocument/didClose", {"textDocument": {"uri": uri}})
+
+    async def get_source_of_call(
+        self,
+        focal_name: str,
+        file_path: str,
+        line: int,
+        col: int,
+    ) -> SourceResult:
+        """see LSPSynchronizer.get_source_of_call"""
+        try:
+            uri = self.documents.open(file_path)
+            with metrics.timer("definition"):
+                response = await self.request(
+                    "textDocument/definition",
+                    {
+                        "textDocument": {"uri": uri},
+                        "position": {"line": line, "character": col},
+                    },
+                )
+            locations = parse_definition_response(response)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            return Failure(str(e) or type(e).__name__)
+
+        match locations:
+            case []:
+                return Failure(f"No definition found: {response}")
+            case [loc, *_]:
+                # parsing and the definition cache would block the event loop
+                return await asyncio.to_thread(
+                    source_of_definition, loc, self.workspace_dir, self.langID
+                )
+        return Failure(f"Unexpected response from LSP server: {response}")
+
+    async def get_sources_of_calls(self, calls: list[FocalCall]) -> list[SourceResult]:
+        """resolve calls concurrently, with at most max_inflight requests in flight"""
+        window = asyncio.Semaphore(max(self.max_inflight, 1))
+
+        async def bounded(call: FocalCall) -> SourceResult:
+            async with window:
+                return await self.get_source_of_call(*call)
+
+        async def lookup(batch: list[FocalCall]) -> list[SourceResult]:
+            await self.indexing.wait_async()
+            return list(await asyncio.gather(*map(bounded, batch)))
+
+        return await health.replay_lost_async(
+            calls, await lookup(calls), self._crashed, self.restart, lookup
+        )
+
+    async def stop(self):
+        self.stopped = True
+        if self.monitor is not None:
+            self.monitor.stop()
+        if self.lsp_proc is None:
+            return
+        try:
+            await self.request("shutdown", None, timeout=STOP_TIMEOUT)
+            self.notify("exit", None)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logging.debug(e)
+        if self.lsp_proc.returncode is None:
+            kill_proc_tree(self.lsp_proc.pid)
+        await self.lsp_proc.wait()
+        health.release_cgroup(self.lsp_proc.pid)
+        logging.debug(
+            f"{self.langID} server notifications: {self.notifications.summary()}"
+        )
+        if self._reader is not None:
+            self._reader.cancel()
@@ -0,0 +1,183 @@
+"""Parquet output of synchronized pairs for column-wise analytics
+
+pyarrow is only imported when Parquet is read or written, see require_pyarrow.
+The lang column holds the names of the jsonl dataset, e.g. "js" for the
+"javascript" of LANGUAGE_IDENTIFIER, see dataset_lang.
+
+python3 -m unitsyncer.columnar data/source data/source/all.parquet --lang=python
+"""
+import json
+import os
+from typing import Any, Iterable, Optional
+import fire
+from pylspclient.lsp_structs import LANGUAGE_IDENTIFIER
+
+# text columns of a success record, as written by main.py
+TEXT_COLUMNS = ("test_id", "test", "code_id", "code", "docstring", "test_header")
+
+# languages whose LANGUAGE_IDENTIFIER differs from their name in the dataset
+DATASET_LANGS = {LANGUAGE_IDENTIFIER.JAVASCRIPT: "js"}
+
+
+def dataset_lang(lang: str) -> str:
+    """name of a language in the lang column, as matched by the evaluation"""
+    return DATASET_LANGS.get(lang, lang)
+
+
+def _pyarrow():
+    try:
+        import pyarrow  # pylint: disable=import-outside-toplevel
+        import pyarrow.parquet  # pylint: disable=import-outside-toplevel,unused-import
+    except ImportError as e:
+        raise ImportError("Parquet output requires pyarrow: pip install pyarrow") from e
+    return pyarrow
+
+
+def require_pyarrow():
+    """fail before a run whose Parquet output could not be written"""
+    _pyarrow()
+
+
+def schema():
+    pa = _pyarrow()
+    # repo and lang repeat on every row, they are stored once per row group
+    categorical = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema(
+        [("repo", categorical), ("lang", categorical)]
+        + [(name, pa.string()) for name in TEXT_COLUMNS]
+    )
+
+
+class ParquetWriter:
+    """buffer records and write them as zstd compressed row groups
+
+    The file is written to `path`.tmp and renamed on close, so readers never
+    see a file without footer.
+
+    Args:
+        path (str): output Parquet file
+        row_group_size (int): number of records per row group
+        compression (str): Parquet compression codec
+    """
+
+    def __init__(
+        self, path: str, row_group_size: int = 8192, compression: str = "zstd"
+    ) -> None:
+        pa = _pyarrow()
+        self.path = path
+        self.tmp_path = f"{path}.tmp"
+        self.row_group_size = row_group_size
+        self.schema = schema()
+        self.columns: dict[str, list[Any]] = {name: [] for name in self.schema.names}
+        self.n_rows = 0
+        self.writer = pa.parquet.ParquetWriter(
+            self.tmp_path,
+            self.schema,
+            compression=compression,
+            use_dictionary=["repo", "lang"],
+        )
+
+    def __enter__(self) -> "ParquetWriter":
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def write(self, record: dict, repo: str, lang: str):
+        self.columns["repo"].append(repo)
+        self.columns["lang"].append(dataset_lang(lang))
+        for name in TEXT_COLUMNS:
+            self.columns[name].append(record.get(name))
+        if len(self.columns["repo"]) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        """write the buffered records as one row group"""
+        n_rows = len(self.columns["repo"])
+        if n_rows == 0:
+            return
+        pa = _pyarrow()
+        table = pa.Table.from_pydict(self.columns, schema=self.schema)
+        self.writer.write_table(table, row_group_size=n_rows)
+        self.n_rows += n_rows
+        for values in self.columns.values():
+            values.clear()
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        os.replace(self.tmp_path, self.path)
+
+
+def jsonl_to_parquet(
+    sources: Iterable[tuple[str, str, str]],
+    out_path: str,
+    row_group_size: int = 8192,
+) -> int:
+    """collect success jsonl files into one Parquet file
+
+    Args:
+        sources (Iterable[tuple[str, str, str]]): (jsonl file, repo, lang)
+
+    Returns:
+        int: number of records written
+    """
+    with ParquetWriter(out_path, row_group_size) as writer:
+        for jsonl_file, repo, lang in sources:
+            if not os.path.exists(jsonl_file):
+                continue
+            with open(jsonl_file) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if "error" not in record:
+                        writer.write(record, repo, lang)
+        writer.flush()
+        return writer.n_rows
+
+
+def read_records(
+    path: str,
+    columns: Optional[list[str]] = None,
+    langs: Optional[list[str]] = None,
+    repos: Optional[list[str]] = None,
+) -> list[dict]:
+    """read records of a Parquet file as the dicts of the jsonl output
+
+    Only the given columns are read, and row groups without any of the given
+    langs or repos are skipped.
+
+    Args:
+        columns (list[str] | None): columns to read, all if None
+        langs (list[str] | None): only keep records of these languages
+        repos (list[str] | None): only keep records of these repos
+    """
+    pa = _pyarrow()
+    filters = []
+    if langs is not None:
+        filters.append(("lang", "in", [dataset_lang(lang) for lang in langs]))
+    if repos is not None:
+        filters.append(("repo", "in", repos))
+    table = pa.parquet.read_table(path, columns=columns, filters=filters or None)
+    records: list[dict] = table.to_pylist()
+    return records
+
+
+def main(
+    source_dir: str = "data/source",
+    out_path: str = "data/source/all.parquet",
+    lang: str = "python",
+):
+    """convert every *.success.jsonl in source_dir, the repo is the file name"""
+    files = sorted(f for f in os.listdir(source_dir) if f.endswith(".success.jsonl"))
+    sources = [
+        (os.path.join(source_dir, f), f.removesuffix(".success.jsonl"), lang)
+        for f in files
+    ]
+    print(f"wrote {jsonl_to_parquet(sources, out_path)} records to {out_path}")
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -3,6 +3,10 @@ import os
 
 UNITSYNCER_HOME = os.path.abspath(os.getenv("UNITSYNCER_HOME", os.curdir))
 CORES = int(os.getenv("CORES", "1"))
+# on-disk caches shared by all runs, e.g. the function tables of Rust files
+UNITSYNCER_CACHE = os.path.abspath(
+    os.getenv("UNITSYNCER_CACHE", os.path.join(UNITSYNCER_HOME, "data", "cache"))
+)
 
 CAPABILITIES = {
     "textDocument": {
@@ -148,6 +152,8 @@ CAPABILITIES = {
         "workspaceEdit": {"documentChanges": True},
         "workspaceFolders": True,
     },
+    # servers report indexing with $/progress, see readiness.py
+    "window": {"workDoneProgress": True},
 }
 
 RUST_CAPABILITIES = {
@@ -0,0 +1,149 @@
+"""compilation database of C++ workspaces for clangd, generated out of tree
+
+The database of a workspace is written to `compile-db/<workdir>-<hash>` in the
+server cache of its repo, where clangd also keeps its background index. The
+hash covers the CMake files of the workspace, so a rerun reuses the database
+until they change. When the workspace has no CMakeLists.txt, or cmake is
+missing, fails or times out, a compile_flags.txt with the include directories
+found in the tree is written instead. A compile_commands.json of the workspace
+itself is copied there, so the index does not end up in the tree, outside of
+what server_cache sizes and prunes.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import subprocess
+from typing import Optional
+from pylspclient.lsp_structs import LANGUAGE_IDENTIFIER
+from unitsyncer.common import UNITSYNCER_CACHE
+from unitsyncer import server_cache
+
+# seconds cmake may take to configure a workspace before the fallback is used
+CMAKE_TIMEOUT = 120
+HEADER_EXTENSIONS = (".h", ".hh", ".hpp", ".hxx", ".inl")
+SKIP_DIRS = {".git", "build", "node_modules"}
+
+
+def cmake_files(workspace_dir: str) -> list[str]:
+    """CMakeLists.txt and *.cmake files of a workspace, sorted"""
+    found = []
+    for root, dirs, files in os.walk(workspace_dir):
+        dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+        for file in files:
+            if file == "CMakeLists.txt" or file.endswith(".cmake"):
+                found.append(os.path.join(root, file))
+    return sorted(found)
+
+
+def workspace_digest(workspace_dir: str) -> str:
+    """hash of the CMake files of a workspace, changes when they are edited"""
+    h = hashlib.sha1()
+    for path in cmake_files(workspace_dir):
+        h.update(os.path.relpath(path, workspace_dir).encode())
+        try:
+            with open(path, "rb") as f:
+                h.update(f.read())
+        except OSError:
+            pass
+    return h.hexdigest()[:16]
+
+
+def include_dirs(workspace_dir: str) -> list[str]:
+    """directories holding headers and their parents"""
+    found = set()
+    for root, dirs, files in os.walk(workspace_dir):
+        dirs[:] = [d for d in dirs if d not in SKIP_DIRS and not d.startswith(".")]
+        if any(f.endswith(HEADER_EXTENSIONS) for f in files):
+            found.add(root)
+            # #include "pkg/x.h" is relative to the dir above pkg
+            parent = os.path.dirname(root)
+            if parent.startswith(workspace_dir):
+                found.add(parent)
+    return sorted(found)
+
+
+def write_compile_flags(workspace_dir: str, db_dir: str):
+    """heuristic compile_flags.txt: C++17 and every include dir of the tree"""
+    flags = ["-xc++", "-std=c++17", f"-I{workspace_dir}"]
+    flags += [f"-I{d}" for d in include_dirs(workspace_dir) if d != workspace_dir]
+    tmp_path = os.path.join(db_dir, "compile_flags.txt.tmp")
+    with open(tmp_path, "w") as f:
+        f.write("\n".join(flags) + "\n")
+    os.replace(tmp_path, os.path.join(db_dir, "compile_flags.txt"))
+
+
+def run_cmake(workspace_dir: str, build_dir: str, timeout: float) -> bool:
+    """configure the workspace in build_dir, True if it exported the commands"""
+    if shutil.which("cmake") is None:
+        return False
+    try:
+        subprocess.run(
+            [
+                "cmake",
+                "-S",
+                workspace_dir,
+                "-B",
+                build_dir,
+                "-DCMAKE_EXPORT_COMPILE_COMMANDS=ON",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            timeout=timeout,
+            check=False,
+        )
+    except subprocess.TimeoutExpired:
+        logging.warning(f"cmake took more than {timeout}s in {workspace_dir}")
+        return False
+    return os.path.exists(os.path.join(build_dir, "compile_commands.json"))
+
+
+def copy_compile_db(db_file: str, base: str, workspace_dir: str) -> str:
+    """copy of a compile_commands.json under base, keyed by its content"""
+    with open(db_file, "rb") as f:
+        content = f.read()
+    digest = hashlib.sha1(content).hexdigest()[:16]
+    db_dir = os.path.join(
+        base, "compile-db", f"{os.path.basename(workspace_dir)}-{digest}"
+    )
+    db_path = os.path.join(db_dir, "compile_commands.json")
+    if not os.path.exists(db_path):
+        os.makedirs(db_dir, exist_ok=True)
+        with open(db_path + ".tmp", "wb") as f:
+            f.write(content)
+        os.replace(db_path + ".tmp", db_path)
+    return db_dir
+
+
+def compile_db_dir(workspace_dir: str, timeout: float = CMAKE_TIMEOUT) -> Optional[str]:
+    """directory of the compilation database of a C++ workspace
+
+    Args:
+        workspace_dir (str): root of the workspace
+        timeout (float): seconds before cmake is abandoned for compile_flags.txt
+
+    Returns:
+        Optional[str]: None if the workspace has its own compile_commands.json
+            and the server caches are disabled, clangd then finds it in the tree
+    """
+    workspace_dir = os.path.abspath(workspace_dir)
+    cache_dir = server_cache.repo_cache_dir(workspace_dir, LANGUAGE_IDENTIFIER.CPP)
+    own_db = os.path.join(workspace_dir, "compile_commands.json")
+    if os.path.exists(own_db):
+        if cache_dir is None:
+            return None
+        return copy_compile_db(own_db, cache_dir, workspace_dir)
+
+    base = cache_dir or UNITSYNCER_CACHE
+    name = f"{os.path.basename(workspace_dir)}-{workspace_digest(workspace_dir)}"
+    db_dir = os.path.join(base, "compile-db", name)
+    for db_file in ("compile_commands.json", "compile_flags.txt"):
+        if os.path.exists(os.path.join(db_dir, db_file)):
+            return db_dir
+
+    os.makedirs(db_dir, exist_ok=True)
+    has_cmake = os.path.exists(os.path.join(workspace_dir, "CMakeLists.txt"))
+    if not (has_cmake and run_cmake(workspace_dir, db_dir, timeout)):
+        logging.debug(f"writing compile_flags.txt for {workspace_dir}")
+        write_compile_flags(workspace_dir, db_dir)
+    return db_dir
@@ -0,0 +1,227 @@
+"""on-disk memo of focal lookups, shared by all workers and reruns
+
+Two layers are kept in one sqlite file:
+- requests: (calling file, its content hash, line, col) -> source of the
+  focal function, so a call site that was resolved once never reaches a server.
+  The path is part of the key as identical tests of two repos, or of two
+  modules of a repo, do not call the same definition.
+- definitions: (definition file, mtime, size, line, col) -> extracted source,
+  so call sites that resolve to the same definition extract it once
+
+Only successful lookups are stored, failures such as timeouts are retried.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from typing import TYPE_CHECKING, Awaitable, Callable, Optional
+from returns.result import Success
+from unitsyncer.common import UNITSYNCER_CACHE
+
+if TYPE_CHECKING:
+    from unitsyncer.sync import FocalCall, SourceResult
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS requests (
+    path TEXT, digest TEXT, lang TEXT, line INTEGER, col INTEGER, source TEXT,
+    PRIMARY KEY (path, digest, lang, line, col)
+);
+CREATE TABLE IF NOT EXISTS definitions (
+    path TEXT, stamp TEXT, lang TEXT, line INTEGER, col INTEGER, source TEXT,
+    PRIMARY KEY (path, stamp, lang, line, col)
+);
+"""
+
+
+class DefinitionCache:
+    """sqlite store of the two memo layers, safe to use from several threads
+
+    Args:
+        path (str): sqlite file, created if it does not exist
+    """
+
+    def __init__(self, path: str) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        # workers write concurrently, wait for their transactions to finish
+        self.conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        # (path, mtime_ns, size) -> sha1 of the content
+        self._digests: dict[tuple[str, int, int], str] = {}
+
+    def digest(self, file_path: str) -> Optional[str]:
+        """content hash of a file, computed once per version of the file"""
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return None
+        key = (file_path, st.st_mtime_ns, st.st_size)
+        if key not in self._digests:
+            try:
+                with open(file_path, "rb") as f:
+                    self._digests[key] = hashlib.sha1(f.read()).hexdigest()
+            except OSError:
+                return None
+        return self._digests[key]
+
+    def get_request(
+        self, lang: str, file_path: str, line: int, col: int
+    ) -> Optional["SourceResult"]:
+        """cached source of the function called at a location, None on a miss"""
+        digest = self.digest(file_path)
+        if digest is None:
+            return None
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT source FROM requests WHERE path = ? AND digest = ? "
+                "AND lang = ? AND line = ? AND col = ?",
+                (file_path, digest, lang, line, col),
+            ).fetchone()
+        return None if row is None else Success(tuple(json.loads(row[0])))
+
+    def put_requests(
+        self, lang: str, calls: list["FocalCall"], sources: list["SourceResult"]
+    ):
+        """store the successful sources of calls"""
+        rows = []
+        for (_, file_path, line, col), source in zip(calls, sources):
+            digest = self.digest(file_path)
+            if isinstance(source, Success) and digest is not None:
+                source_json = json.dumps(source.unwrap())
+                rows.append((file_path, digest, lang, line, col, source_json))
+        if rows:
+            with self._lock, self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO requests VALUES (?, ?, ?, ?, ?, ?)", rows
+                )
+
+    def definition(
+        self,
+        file_path: str,
+        lang: str,
+        line: int,
+        col: int,
+        extract: Callable[[], "SourceResult"],
+    ) -> "SourceResult":
+        """source extracted at a definition location, memoized by the location
+
+        Args:
+            extract (Callable[[], SourceResult]): extraction on a miss
+        """
+        try:
+            st = os.stat(file_path)
+        except OSError:
+            return extract()
+        key = (file_path, f"{st.st_mtime_ns}:{st.st_size}", lang, line, col)
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT source FROM definitions WHERE path = ? AND stamp = ? "
+                "AND lang = ? AND line = ? AND col = ?",
+                key,
+            ).fetchone()
+        if row is not None:
+            return Success(tuple(json.loads(row[0])))
+
+        source = extract()
+        if isinstance(source, Success):
+            with self._lock, self.conn:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO definitions VALUES (?, ?, ?, ?, ?, ?)",
+                    key + (json.dumps(source.unwrap()),),
+                )
+        return source
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+
+# path of the process-wide cache, None to disable it
+CACHE_PATH: Optional[str] = os.path.join(UNITSYNCER_CACHE, "definitions.sqlite")
+_CACHE: Optional[DefinitionCache] = None
+_CACHE_PID: Optional[int] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def configure(path: Optional[str]):
+    """set the file of the process-wide cache, before the workers are forked"""
+    global CACHE_PATH, _CACHE  # pylint: disable=global-statement
+    with _CACHE_LOCK:
+        CACHE_PATH = path
+        _CACHE = None
+
+
+def cache() -> Optional[DefinitionCache]:
+    """the cache of the current process, each forked worker opens its own"""
+    global _CACHE, _CACHE_PID  # pylint: disable=global-statement
+    if CACHE_PATH is None:
+        return None
+    with _CACHE_LOCK:
+        if _CACHE is None or _CACHE_PID != os.getpid():
+            _CACHE = DefinitionCache(CACHE_PATH)
+            _CACHE_PID = os.getpid()
+        return _CACHE
+
+
+def split_cached(
+    lang: str, calls: list["FocalCall"]
+) -> tuple[list[Optional["SourceResult"]], list[int]]:
+    """cached sources of calls and the indices of the calls that missed"""
+    store = cache()
+    if store is None:
+        return [None] * len(calls), list(range(len(calls)))
+    sources = [store.get_request(lang, *call[1:]) for call in calls]
+    return sources, [i for i, source in enumerate(sources) if source is None]
+
+
+def merge_lookups(
+    lang: str,
+    calls: list["FocalCall"],
+    sources: list[Optional["SourceResult"]],
+    misses: list[int],
+    found: list["SourceResult"],
+) -> list["SourceResult"]:
+    """fill the sources looked up for the missed calls and store them"""
+    for i, source in zip(misses, found):
+        sources[i] = source
+    store = cache()
+    if store is not None:
+        store.put_requests(lang, [calls[i] for i in misses], found)
+    return [source for source in sources if source is not None]
+
+
+def cached_lookup(
+    lang: str,
+    calls: list["FocalCall"],
+    lookup: Callable[[list["FocalCall"]], list["SourceResult"]],
+) -> list["SourceResult"]:
+    """sources of calls, only the calls missing from the cache go to lookup
+
+    Args:
+        lookup (Callable[[list[FocalCall]], list[SourceResult]]): e.g.
+            get_sources_of_calls of a synchronizer, not called if all calls hit
+    """
+    sources, misses = split_cached(lang, calls)
+    if not misses:
+        return [source for source in sources if source is not None]
+    found = lookup([calls[i] for i in misses])
+    return merge_lookups(lang, calls, sources, misses, found)
+
+
+async def cached_lookup_async(
+    lang: str,
+    calls: list["FocalCall"],
+    lookup: Callable[[list["FocalCall"]], Awaitable[list["SourceResult"]]],
+) -> list["SourceResult"]:
+    """cached_lookup with a coroutine lookup, the cache is read and written
+    from a thread so the event loop is not blocked"""
+    sources, misses = await asyncio.to_thread(split_cached, lang, calls)
+    if not misses:
+        return [source for source in sources if source is not None]
+    found = await lookup([calls[i] for i in misses])
+    return await asyncio.to_thread(merge_lookups, lang, calls, sources, misses, found)
@@ -0,0 +1,87 @@
+"""tracking of documents opened on a language server"""
+from collections import Counter, OrderedDict
+from typing import Callable
+import logging
+from unitsyncer.util import path2uri, replace_tabs
+from unitsyncer import metrics
+
+# counters of every OpenDocuments of the current process
+STATS: Counter[str] = Counter()
+
+
+class OpenDocuments:
+    """sends didOpen once per document and keeps a bounded LRU of open documents
+
+    Args:
+        did_open (Callable[[str, str], None]): sends didOpen for (uri, text)
+        did_close (Callable[[str], None]): sends didClose for uri
+        capacity (int): maximum number of documents kept open on the server
+    """
+
+    def __init__(
+        self,
+        did_open: Callable[[str, str], None],
+        did_close: Callable[[str], None],
+        capacity: int = 64,
+    ) -> None:
+        self.did_open = did_open
+        self.did_close = did_close
+        self.capacity = capacity
+        self.uris: OrderedDict[str, None] = OrderedDict()
+        self.stats: Counter[str] = Counter()
+
+    def open(self, file_path: str) -> str:
+        """make sure file_path is open on the server
+
+        Args:
+            file_path (str): absolute path to the file
+
+        Returns:
+            str: uri of the opened file
+        """
+        uri = path2uri(file_path)
+        if uri in self.uris:
+            self.uris.move_to_end(uri)
+            self._count("hits")
+            return uri
+
+        with metrics.timer("open_file"):
+            with open(file_path, "r", errors="replace") as f:
+                text = replace_tabs(f.read())
+            self.did_open(uri, text)
+        self.uris[uri] = None
+        self._count("opened")
+
+        while len(self.uris) > self.capacity:
+            evicted, _ = self.uris.popitem(last=False)
+            self._close(evicted)
+        return uri
+
+    def close(self, uri: str):
+        """close uri if it is open"""
+        if uri in self.uris:
+            del self.uris[uri]
+            self._close(uri)
+
+    def close_all(self):
+        while self.uris:
+            uri, _ = self.uris.popitem(last=False)
+            self._close(uri)
+
+    def forget_all(self):
+        """drop the documents of a server that died, without didClose"""
+        self.uris.clear()
+
+    def _count(self, name: str):
+        self.stats[name] += 1
+        STATS[name] += 1
+
+    def _close(self, uri: str):
+        self._count("closed")
+        try:
+            self.did_close(uri)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logging.debug(f"didClose {uri} failed: {e}")
+
+    def __contains__(self, uri: str) -> bool:
+        return uri in self.uris
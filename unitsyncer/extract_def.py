@@ -9,6 +9,7 @@ from frontend.parser import (
     JAVA_LANGUAGE,
 )
 from itertools import takewhile
+from unitsyncer import metrics
 from tqdm import tqdm
 import json
 import os
@@ -77,6 +78,7 @@ def java_get_def(code: str) -> str | None:
     return "".join(takewhile(lambda c: c != "{", code)) + "{\n"
 
 
+@metrics.timed("get_def_header")
 def get_def_header(code: str, lang: str) -> str | None:
     header: str | None = None
     if lang == "python":
@@ -0,0 +1,200 @@
+"""memory and cpu of language servers while they serve requests
+
+A HealthMonitor thread samples the process tree of a synchronizer's server.
+When its rss passes MAX_RSS_MB the server is recycled, the synchronizer then
+restarts it and replays the lookups it lost, see `replay_lost`. A hard
+ceiling of HARD_LIMIT_FACTOR * MAX_RSS_MB is also set on the server when it
+starts, so a spike between two samples cannot take the whole machine down:
+- cgroup v2: a child cgroup with memory.max under $UNITSYNCER_CGROUP, which
+  has to be a delegated cgroup with the memory controller enabled
+- otherwise RLIMIT_AS, except for servers whose runtime reserves large
+  address ranges up front (JVM, V8, Go)
+"""
+import logging
+import os
+import resource
+import threading
+from collections import Counter
+from typing import TYPE_CHECKING, Awaitable, Callable, Optional
+from returns.result import Failure
+from pylspclient.lsp_structs import LANGUAGE_IDENTIFIER
+from unitsyncer.util import proc_tree_cpu, proc_tree_rss
+
+if TYPE_CHECKING:
+    from unitsyncer.sync import FocalCall, SourceResult, Synchronizer
+    from unitsyncer.async_syncer import AsyncLSPSynchronizer
+
+# soft ceiling in MB of a server process tree, None to only sample
+MAX_RSS_MB: Optional[int] = None
+HARD_LIMIT_FACTOR = 1.5
+SAMPLE_INTERVAL = 1.0
+CGROUP_ROOT = os.getenv("UNITSYNCER_CGROUP")
+# virtual memory of these runtimes is far above their rss
+NO_RLIMIT_LANGS = (
+    LANGUAGE_IDENTIFIER.JAVA,
+    LANGUAGE_IDENTIFIER.JAVASCRIPT,
+    LANGUAGE_IDENTIFIER.GO,
+)
+
+# counters of the current process, reported in the run summary
+STATS: Counter[str] = Counter()
+
+
+def configure(max_rss_mb: Optional[int], interval: float = SAMPLE_INTERVAL):
+    """set the ceiling of every server, before the workers are forked"""
+    global MAX_RSS_MB, SAMPLE_INTERVAL  # pylint: disable=global-statement
+    MAX_RSS_MB = max_rss_mb
+    SAMPLE_INTERVAL = interval
+
+
+def limit_memory(pid: int, language: str) -> Optional[str]:
+    """set the hard memory ceiling of a freshly started server
+
+    Returns:
+        Optional[str]: "cgroup" or "rlimit", None if no ceiling could be set
+    """
+    if MAX_RSS_MB is None:
+        return None
+    limit = int(MAX_RSS_MB * HARD_LIMIT_FACTOR * 2**20)
+    if CGROUP_ROOT is not None:
+        cgroup = os.path.join(CGROUP_ROOT, f"server-{pid}")
+        try:
+            os.makedirs(cgroup, exist_ok=True)
+            with open(os.path.join(cgroup, "memory.max"), "w") as f:
+                f.write(str(limit))
+            with open(os.path.join(cgroup, "cgroup.procs"), "w") as f:
+                f.write(str(pid))
+            return "cgroup"
+        except OSError as e:
+            logging.debug(f"cannot use cgroup {cgroup}: {e}")
+    if language in NO_RLIMIT_LANGS:
+        return None
+    try:
+        resource.prlimit(pid, resource.RLIMIT_AS, (limit, limit))
+        return "rlimit"
+    except (OSError, ValueError) as e:
+        logging.debug(f"cannot set RLIMIT_AS of {pid}: {e}")
+        return None
+
+
+def release_cgroup(pid: int):
+    """remove the cgroup of a stopped server"""
+    if CGROUP_ROOT is not None:
+        try:
+            os.rmdir(os.path.join(CGROUP_ROOT, f"server-{pid}"))
+        except OSError:
+            pass
+
+
+class HealthMonitor:
+    """sample the server of a synchronizer, recycle it when it grows too big
+
+    The pid is read from the synchronizer at every sample, so the monitor
+    keeps watching the server across restarts.
+
+    Args:
+        syncer (Synchronizer | AsyncLSPSynchronizer): synchronizer whose
+            server_pid is sampled, its recycle is called from the monitor thread
+        interval (float): seconds between two samples
+    """
+
+    def __init__(
+        self,
+        syncer: "Synchronizer | AsyncLSPSynchronizer",
+        interval: float = SAMPLE_INTERVAL,
+    ):
+        self.syncer = syncer
+        self.interval = interval
+        self.peak_rss_mb = 0.0
+        self.cpu_seconds: dict[int, float] = {}
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="server-health", daemon=True
+        )
+
+    def start(self) -> "HealthMonitor":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        logging.debug(
+            f"{self.syncer.langID} server: peak rss {self.peak_rss_mb:.0f}MB, "
+            f"{sum(self.cpu_seconds.values()):.1f}s cpu"
+        )
+
+    def sample(self):
+        pid = self.syncer.server_pid
+        if pid is None:
+            return
+        rss_mb = proc_tree_rss(pid) / 2**20
+        self.peak_rss_mb = max(self.peak_rss_mb, rss_mb)
+        self.cpu_seconds[pid] = proc_tree_cpu(pid)
+        if MAX_RSS_MB is not None and rss_mb > MAX_RSS_MB:
+            logging.warning(
+                f"killing {self.syncer.langID} server using {rss_mb:.0f}MB "
+                f"of {MAX_RSS_MB}MB in {self.syncer.workspace_dir}"
+            )
+            STATS["rss_kills"] += 1
+            self.syncer.recycle()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.sample()
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                logging.debug(e)
+
+
+def replay_lost(
+    calls: list["FocalCall"],
+    results: list["SourceResult"],
+    crashed: Callable[[], bool],
+    restart: Callable[[], None],
+    lookup: Callable[[list["FocalCall"]], list["SourceResult"]],
+) -> list["SourceResult"]:
+    """restart a server that died during a batch and look up its failures again
+
+    Every failure is replayed once, as after a crash it cannot be told apart
+    from a lookup that legitimately found nothing.
+
+    Args:
+        crashed (Callable[[], bool]): whether the server died without being
+            stopped, e.g. recycled by the monitor or killed by the kernel
+        restart (Callable[[], None]): starts a new server for the workspace
+        lookup (Callable[[list[FocalCall]], list[SourceResult]]): the batch lookup
+    """
+    if not crashed():
+        return results
+    lost = [i for i, result in enumerate(results) if isinstance(result, Failure)]
+    STATS["restarts"] += 1
+    restart()
+    if not lost:
+        return results
+    STATS["replayed"] += len(lost)
+    results = list(results)
+    for i, result in zip(lost, lookup([calls[i] for i in lost])):
+        results[i] = result
+    return results
+
+
+async def replay_lost_async(
+    calls: list["FocalCall"],
+    results: list["SourceResult"],
+    crashed: Callable[[], bool],
+    restart: Callable[[], Awaitable[None]],
+    lookup: Callable[[list["FocalCall"]], Awaitable[list["SourceResult"]]],
+) -> list["SourceResult"]:
+    """replay_lost with a coroutine restart and lookup"""
+    if not crashed():
+        return results
+    lost = [i for i, result in enumerate(results) if isinstance(result, Failure)]
+    STATS["restarts"] += 1
+    await restart()
+    if not lost:
+        return results
+    STATS["replayed"] += len(lost)
+    results = list(results)
+    for i, result in zip(lost, await lookup([calls[i] for i in lost])):
+        results[i] = result
+    return results
@@ -0,0 +1,157 @@
+"""append-only journal of backend results, used to resume an interrupted run"""
+import fcntl
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+@contextmanager
+def locked(fd: int):
+    """exclusive lock on an open file, shared by every process appending to it"""
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    try:
+        yield fd
+    finally:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+
+
+def recover_jsonl(path: str) -> list[dict]:
+    """read the complete records of a jsonl file that may have been cut short
+
+    A trailing line without newline is the record being written when the
+    process died, it is truncated so that appending starts on a fresh line.
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, "rb+") as f, locked(f.fileno()):
+        data = f.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            logging.warning(f"truncating partial record at the end of {path}")
+            f.truncate(end)
+
+    records = []
+    for line in data[:end].splitlines():
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError:
+            logging.warning(f"skipping corrupted record in {path}")
+    return records
+
+
+def start_over(*paths: str):
+    """empty the output files of a focal file before a run that does not resume
+
+    Called once before the units of a focal file are dispatched, as every
+    unit opens its own journal on the same files.
+    """
+    for path in paths:
+        with open(path, "ab") as f, locked(f.fileno()):
+            f.truncate(0)
+
+
+class ResultJournal:
+    """success and failure files of a focal file, keyed by test_id
+
+    Records are buffered and appended with one locked write and fsync every
+    `sync_every` records or `sync_interval` seconds, whichever comes first, so
+    several processes can journal different workdirs of the same focal file.
+
+    Args:
+        success_file (str): results with source code
+        failure_file (str): results with an error
+        resume (bool): read the results already in the files; records are
+            always appended, see start_over to begin with empty files
+        sync_every (int): number of records between two fsync
+        sync_interval (float): seconds between two fsync
+    """
+
+    def __init__(
+        self,
+        success_file: str,
+        failure_file: str,
+        resume: bool = True,
+        sync_every: int = 64,
+        sync_interval: float = 5.0,
+    ) -> None:
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self.done: set[str] = set()
+        self.succeeded: set[str] = set()
+        self.n_success = 0
+
+        if resume:
+            successes = recover_jsonl(success_file)
+            failures = recover_jsonl(failure_file)
+            self.n_success = len(successes)
+            self.succeeded = {r["test_id"] for r in successes if "test_id" in r}
+            self.done = self.succeeded | {
+                r["test_id"] for r in failures if "test_id" in r
+            }
+
+        flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND
+        self.success_fd = os.open(success_file, flags, 0o644)
+        self.failure_fd = os.open(failure_file, flags, 0o644)
+        self.buffers: dict[int, list[str]] = {self.success_fd: [], self.failure_fd: []}
+        self.closed = False
+        self.n_unsynced = 0
+        self.last_sync = time.monotonic()
+        self._lock = threading.RLock()
+
+    def __contains__(self, test_id: str) -> bool:
+        return test_id in self.done
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.close()
+
+    def write(self, result: dict):
+        line = json.dumps(result) + "\n"
+        with self._lock:
+            if "error" in result:
+                self.buffers[self.failure_fd].append(line)
+            else:
+                self.buffers[self.success_fd].append(line)
+                self.succeeded.add(result["test_id"])
+                self.n_success += 1
+            self.done.add(result["test_id"])
+
+            self.n_unsynced += 1
+            if (
+                self.n_unsynced >= self.sync_every
+                or time.monotonic() - self.last_sync >= self.sync_interval
+            ):
+                self.sync()
+
+    def write_all(self, results: list[dict]):
+        for result in results:
+            self.write(result)
+
+    def sync(self):
+        """append buffered records and fsync them to disk"""
+        with self._lock:
+            for fd, lines in self.buffers.items():
+                if not lines:
+                    continue
+                data = "".join(lines).encode()
+                with locked(fd):
+                    while data:
+                        data = data[os.write(fd, data) :]
+                    os.fsync(fd)
+                lines.clear()
+            self.n_unsynced = 0
+            self.last_sync = time.monotonic()
+
+    def close(self):
+        with self._lock:
+            if self.closed:
+                return
+            self.sync()
+            os.close(self.success_fd)
+            os.close(self.failure_fd)
+            self.closed = True
@@ -0,0 +1,108 @@
+"""order focal objects of a workdir so that lookups touching the same files run together
+
+The frontends write focal objects in the order they found the tests, so
+consecutive lookups hop between test files and the open documents of the
+server and the parse cache keep evicting each other. With ordering enabled:
+- the objects of one test file are looked up contiguously, and its document
+  is closed on the server as soon as the last of them is done
+- test files, and the objects within one, are sorted by the likely file of
+  their focal function, the qualifier of the focal_id, e.g. `pkg.mod` of
+  `pkg.mod.func`, so definitions are parsed once while they are hot
+"""
+from collections import Counter
+from typing import Iterator
+from unitsyncer import documents
+from unitsyncer.parse_cache import PARSE_CACHE
+
+# keep objects in the order of the focal file if False
+ENABLED = True
+
+
+def configure(enabled: bool):
+    """enable the ordering of every workdir, before the workers are forked"""
+    global ENABLED  # pylint: disable=global-statement
+    ENABLED = enabled
+
+
+def test_file(obj: dict) -> str:
+    """path of the test file of a focal object, relative to the repos root"""
+    test_id: str = obj["test_id"]
+    return test_id.split("::")[0]
+
+
+def definition_hint(focal_id: str) -> str:
+    """qualifier of a focal id, shared by the functions of one file or class
+
+    Python and Rust ids are `::` separated, the others are call expressions
+    like `pkg.Func` or `obj.method`; an unqualified call has no hint.
+    """
+    sep = "::" if "::" in focal_id else "."
+    return focal_id.rpartition(sep)[0]
+
+
+def order(objs: list[dict]) -> list[list[dict]]:
+    """group objs by test file, sorted by the likely files of their focal functions
+
+    Returns:
+        list[list[dict]]: the objects of each test file
+    """
+
+    def key(obj: dict) -> tuple[str, list]:
+        return definition_hint(obj["focal_id"]), obj["focal_loc"]
+
+    by_file: dict[str, list[dict]] = {}
+    for obj in objs:
+        by_file.setdefault(test_file(obj), []).append(obj)
+    groups = [sorted(group, key=key) for group in by_file.values()]
+
+    def dominant_hint(group: list[dict]) -> str:
+        hints = Counter(definition_hint(obj["focal_id"]) for obj in group)
+        return hints.most_common(1)[0][0]
+
+    return sorted(groups, key=lambda g: (dominant_hint(g), test_file(g[0])))
+
+
+def chunks(objs: list[dict], size: int) -> Iterator[tuple[list[dict], list[str]]]:
+    """split objs into chunks of at most size objects in locality order
+
+    A test file is only split when it alone has more than size objects.
+
+    Returns:
+        Iterator[tuple[list[dict], list[str]]]: objects of each chunk and the
+            test files whose last object is in it
+    """
+    if not ENABLED:
+        for i in range(0, len(objs), size):
+            yield objs[i : i + size], []
+        return
+
+    chunk: list[dict] = []
+    finished: list[str] = []
+    for group in order(objs):
+        if chunk and len(chunk) + len(group) > size:
+            yield chunk, finished
+            chunk, finished = [], []
+        while len(group) > size:
+            yield group[:size], []
+            group = group[size:]
+        chunk += group
+        finished.append(test_file(group[0]))
+    if chunk:
+        yield chunk, finished
+
+
+def cache_stats() -> Counter[str]:
+    """hit counters of the open documents and the parse cache of this process"""
+    stats: Counter[str] = Counter()
+    for name, n in documents.STATS.items():
+        stats[f"documents_{name}"] = n
+    for name, n in PARSE_CACHE.stats.items():
+        stats[f"parse_{name}"] = n
+    return stats
+
+
+def hit_rate(stats: Counter[str], prefix: str, miss: str) -> float:
+    """share of hits among the hits and misses counted under prefix"""
+    hits = stats[f"{prefix}_hits"]
+    total = hits + stats[f"{prefix}_{miss}"]
+    return hits / total if total else 0.0
@@ -0,0 +1,206 @@
+"""per-stage latency metrics of the synchronizer backend
+
+Durations are recorded into log-bucketed histograms keyed by
+(repo, language, stage), the repo and language come from the enclosing `scope`.
+
+python3 -m unitsyncer.metrics data/source/metrics.jsonl
+"""
+import contextvars
+import functools
+import json
+import math
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Iterator, TypeVar
+import fire
+from unitsyncer.journal import locked
+
+T = TypeVar("T")
+
+# bucket i holds durations in [MIN_SECONDS * BASE**i, MIN_SECONDS * BASE**(i+1))
+MIN_SECONDS = 1e-6
+BASE = 2**0.25
+
+
+class Histogram:
+    """log-bucketed histogram of durations in seconds, about 19% resolution"""
+
+    def __init__(self) -> None:
+        self.buckets: defaultdict[int, int] = defaultdict(int)
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    @staticmethod
+    def bucket(seconds: float) -> int:
+        if seconds <= MIN_SECONDS:
+            return 0
+        return int(math.log(seconds / MIN_SECONDS, BASE))
+
+    def add(self, seconds: float):
+        self.buckets[self.bucket(seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def merge(self, other: "Histogram"):
+        for i, n in other.buckets.items():
+            self.buckets[i] += n
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, q: float) -> float:
+        """approximate q-th percentile, q in [0, 100]"""
+        if self.count == 0:
+            return math.nan
+        rank = q / 100 * self.count
+        seen = 0
+        for i in sorted(self.buckets):
+            seen += self.buckets[i]
+            if seen >= rank:
+                # geometric middle of the bucket, within the observed range
+                middle: float = MIN_SECONDS * BASE ** (i + 0.5)
+                return min(max(middle, self.min), self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+            "buckets": dict(self.buckets),
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> "Histogram":
+        hist = cls()
+        hist.buckets.update({int(i): n for i, n in d["buckets"].items()})
+        hist.count = d["count"]
+        hist.total = d["total"]
+        hist.min = d["min"]
+        hist.max = d["max"]
+        return hist
+
+
+_SCOPE: contextvars.ContextVar[tuple[str, str]] = contextvars.ContextVar(
+    "metrics_scope", default=("", "")
+)
+
+
+class MetricsRecorder:
+    """thread-safe collection of histograms keyed by (repo, language, stage)"""
+
+    def __init__(self) -> None:
+        self.histograms: defaultdict[tuple[str, str, str], Histogram] = defaultdict(
+            Histogram
+        )
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, seconds: float):
+        repo, lang = _SCOPE.get()
+        with self._lock:
+            self.histograms[(repo, lang, stage)].add(seconds)
+
+    def flush(self, path: str):
+        """append the histograms to a metrics jsonl file and reset them"""
+        with self._lock:
+            histograms, self.histograms = self.histograms, defaultdict(Histogram)
+        if not histograms:
+            return
+        lines = "".join(
+            json.dumps({"repo": repo, "lang": lang, "stage": stage, **h.to_dict()})
+            + "\n"
+            for (repo, lang, stage), h in histograms.items()
+        )
+        with open(path, "a") as f, locked(f.fileno()):
+            f.write(lines)
+
+
+RECORDER = MetricsRecorder()
+
+
+@contextmanager
+def scope(repo: str, lang: str) -> Iterator[None]:
+    """attribute the durations recorded in this context to repo and lang"""
+    token = _SCOPE.set((repo, lang))
+    try:
+        yield
+    finally:
+        _SCOPE.reset(token)
+
+
+@contextmanager
+def timer(stage: str) -> Iterator[None]:
+    """record the duration of the block as stage"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        RECORDER.record(stage, time.perf_counter() - start)
+
+
+def timed(stage: str) -> Callable[[Callable[..., T]], Callable[..., T]]:
+    """decorator recording the duration of each call as stage"""
+
+    def decorator(func: Callable[..., T]) -> Callable[..., T]:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs) -> T:
+            with timer(stage):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def record(stage: str, seconds: float):
+    RECORDER.record(stage, seconds)
+
+
+def flush(path: str):
+    RECORDER.flush(path)
+
+
+def load(path: str, by_repo: bool = False) -> dict[tuple[str, ...], Histogram]:
+    """merge the histograms of a metrics jsonl file
+
+    Args:
+        by_repo (bool): keep repos apart, otherwise merge them per language
+
+    Returns:
+        dict[tuple[str, ...], Histogram]: {(lang, stage) or (repo, lang, stage): Histogram}
+    """
+    merged: dict[tuple[str, ...], Histogram] = defaultdict(Histogram)
+    with open(path) as f:
+        for line in f:
+            row = json.loads(line)
+            key: tuple[str, ...] = (row["lang"], row["stage"])
+            if by_repo:
+                key = (row["repo"], *key)
+            merged[key].merge(Histogram.from_dict(row))
+    return merged
+
+
+def main(metrics_file: str = "data/source/metrics.jsonl", by_repo: bool = False):
+    """print p50/p95/p99 per stage of a metrics jsonl file"""
+    columns = ["repo"] * by_repo + ["lang", "stage", "count", "total_s"]
+    print("\t".join(columns + ["p50_ms", "p95_ms", "p99_ms", "max_ms"]))
+    for key, hist in sorted(load(metrics_file, by_repo).items()):
+        quantiles = [hist.percentile(q) for q in (50, 95, 99)] + [hist.max]
+        print(
+            "\t".join(
+                [*key, str(hist.count), f"{hist.total:.2f}"]
+                + [f"{s * 1000:.2f}" for s in quantiles]
+            )
+        )
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,83 @@
+"""routing of the messages language servers send without being asked
+
+Servers publish diagnostics for every opened document, log messages and
+report progress during a whole repo, while the synchronizers only need the
+responses to their definition requests. A NotificationRouter decides by the
+POLICY of each method what is kept of a notification:
+- "drop": discarded
+- "aggregate": counted, the params are discarded
+- "keep": counted, the params go to a ring buffer of the last RING_SIZE
+  notifications, for debugging
+Handlers registered with `on` see every notification of their method first.
+"""
+import functools
+from collections import Counter, deque
+from typing import Any, Callable
+
+DROP = "drop"
+AGGREGATE = "aggregate"
+KEEP = "keep"
+
+POLICY: dict[str, str] = {
+    "textDocument/publishDiagnostics": AGGREGATE,
+    "window/logMessage": AGGREGATE,
+    "window/showMessage": AGGREGATE,
+    "telemetry/event": DROP,
+    "$/logTrace": DROP,
+}
+RING_SIZE = 64
+
+
+class NotificationRouter:
+    """apply the policy of each method to the notifications of one server
+
+    Args:
+        policy (dict[str, str]): method to policy, others are kept
+        ring_size (int): number of kept notifications remembered
+    """
+
+    def __init__(
+        self, policy: dict[str, str] | None = None, ring_size: int = RING_SIZE
+    ) -> None:
+        self.policy = POLICY if policy is None else policy
+        self.counts: Counter[str] = Counter()
+        self.recent: deque[tuple[str, Any]] = deque(maxlen=ring_size)
+        self.handlers: dict[str, list[Callable[[Any], None]]] = {}
+
+    def on(self, method: str, handler: Callable[[Any], None]):
+        """call handler with the params of every notification of method"""
+        self.handlers.setdefault(method, []).append(handler)
+
+    def route(self, method: str, params: Any = None):
+        for handler in self.handlers.get(method, ()):
+            handler(params)
+        match self.policy.get(method, KEEP):
+            case "drop":
+                return
+            case "aggregate":
+                self.counts[method] += 1
+            case _:
+                self.counts[method] += 1
+                self.recent.append((method, params))
+
+    def callbacks(self) -> dict[str, Callable[[Any], None]]:
+        """notify_callbacks of a pylspclient LspEndpoint routing every method"""
+        return _RouteAll(self)
+
+    def summary(self) -> str:
+        return ", ".join(f"{method} x{n}" for method, n in self.counts.most_common())
+
+
+class _RouteAll(dict):
+    """pylspclient looks a method up in its notify_callbacks and prints the
+    ones it has no callback for, this has a callback for any method"""
+
+    def __init__(self, router: NotificationRouter) -> None:
+        super().__init__()
+        self.router = router
+
+    def __contains__(self, method) -> bool:
+        return True
+
+    def __missing__(self, method: str) -> Callable[[Any], None]:
+        return functools.partial(self.router.route, method)
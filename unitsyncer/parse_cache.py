@@ -0,0 +1,198 @@
+"""process-wide cache of parsed source files"""
+import ast
+import os
+import threading
+from bisect import bisect_left
+from itertools import accumulate
+from collections import Counter, OrderedDict
+from typing import Callable, Optional
+from pylspclient.lsp_structs import LANGUAGE_IDENTIFIER
+from returns.maybe import Maybe, Nothing, Some
+from tree_sitter import Language, Node, Tree
+from frontend.parser.ast_util import ASTUtil, iter_preorder
+from frontend.parser import (
+    GO_LANGUAGE,
+    JAVA_LANGUAGE,
+    JAVASCRIPT_LANGUAGE,
+    RUST_LANGUAGE,
+    CPP_LANGUAGE,
+)
+from unitsyncer.util import replace_tabs
+
+TS_LANGUAGES: dict[str, Language] = {
+    LANGUAGE_IDENTIFIER.JAVA: JAVA_LANGUAGE,
+    LANGUAGE_IDENTIFIER.JAVASCRIPT: JAVASCRIPT_LANGUAGE,
+    LANGUAGE_IDENTIFIER.RUST: RUST_LANGUAGE,
+    LANGUAGE_IDENTIFIER.GO: GO_LANGUAGE,
+    LANGUAGE_IDENTIFIER.C: CPP_LANGUAGE,
+    LANGUAGE_IDENTIFIER.CPP: CPP_LANGUAGE,
+}
+
+# estimated bytes of syntax tree per character of source, ast objects of
+# python and tree-sitter nodes are both an order of magnitude above the text
+TREE_BYTES_PER_CHAR = {LANGUAGE_IDENTIFIER.PYTHON: 32}
+TS_TREE_BYTES_PER_CHAR = 24
+
+
+class DefinitionIndex:
+    """nodes of one type sorted by start line, looked up by binary search
+
+    Args:
+        nodes (list[Node]): nodes in preorder
+        reach (Callable[[Node], int] | None): last line that still refers to a
+            node, e.g. a java method is also found from its annotation lines.
+            If None, only the first node starting on each line is kept.
+    """
+
+    def __init__(
+        self, nodes: list[Node], reach: Optional[Callable[[Node], int]] = None
+    ) -> None:
+        # stable sort keeps the preorder between nodes on the same line
+        nodes = sorted(nodes, key=lambda n: n.start_point[0])
+        if reach is None:
+            nodes = [
+                n
+                for i, n in enumerate(nodes)
+                if i == 0 or nodes[i - 1].start_point[0] != n.start_point[0]
+            ]
+        self.nodes = nodes
+        self.lines = [n.start_point[0] for n in nodes]
+        # running maximum of reach, so the first node reaching a line is a bisect
+        self.max_reach = (
+            list(accumulate((reach(n) for n in nodes), max))
+            if reach is not None
+            else self.lines
+        )
+
+    def at_line(self, lineno: int) -> Maybe[Node]:
+        """first node starting at lineno"""
+        i = bisect_left(self.lines, lineno)
+        if i < len(self.lines) and self.lines[i] == lineno:
+            return Some(self.nodes[i])
+        return Nothing
+
+    def first_reaching(self, lineno: int) -> Maybe[Node]:
+        """first node whose reach is at or after lineno"""
+        i = bisect_left(self.max_reach, lineno)
+        if i < len(self.nodes):
+            return Some(self.nodes[i])
+        return Nothing
+
+
+class ParsedFile:
+    """source text of a file with its syntax tree
+
+    python files are parsed with `ast` as they are, other languages are parsed
+    with tree-sitter after replacing tabs, as get_function_code always did.
+    """
+
+    def __init__(self, path: str, code: str, lang: str) -> None:
+        self.path = path
+        self.lang = lang
+        self.py_tree: Optional[ast.Module] = None
+        self.ast_util: Optional[ASTUtil] = None
+        self.ts_tree: Optional[Tree] = None
+
+        if lang == LANGUAGE_IDENTIFIER.PYTHON:
+            self.code = code
+            self.py_tree = ast.parse(code, filename=path)
+        else:
+            self.code = replace_tabs(code)
+            self.ast_util = ASTUtil(self.code)
+            self.ts_tree = self.ast_util.tree(TS_LANGUAGES[lang])
+
+        self._def_indexes: dict[Optional[str], DefinitionIndex] = {}
+
+    @property
+    def size(self) -> int:
+        """estimated memory of the file, its source and its syntax tree"""
+        per_char = TREE_BYTES_PER_CHAR.get(self.lang, TS_TREE_BYTES_PER_CHAR)
+        return len(self.code) * (1 + per_char)
+
+    def def_index(
+        self, node_type: Optional[str], reach: Optional[Callable[[Node], int]] = None
+    ) -> DefinitionIndex:
+        """index of the nodes of node_type in the tree-sitter tree, built on first use
+
+        Args:
+            node_type (str | None): type of node to index, if None index all Node
+            reach (Callable[[Node], int] | None): see DefinitionIndex, only used
+                when the index of node_type is built
+        """
+        assert self.ts_tree is not None
+        if node_type not in self._def_indexes:
+            nodes = list(iter_preorder(self.ts_tree.root_node, node_type))
+            self._def_indexes[node_type] = DefinitionIndex(nodes, reach)
+        return self._def_indexes[node_type]
+
+
+class ParseCache:
+    """LRU cache of ParsedFile keyed by (path, mtime, size)
+
+    Args:
+        max_bytes (int): estimated memory of the cached files, trees included,
+            before evicting, see ParsedFile.size
+    """
+
+    def __init__(self, max_bytes: int = 64 * 2**20) -> None:
+        self.max_bytes = max_bytes
+        self.n_bytes = 0
+        # (path, lang) -> ((mtime_ns, size), ParsedFile)
+        self.entries: OrderedDict[
+            tuple[str, str], tuple[tuple[int, int], ParsedFile]
+        ] = OrderedDict()
+        self.stats: Counter[str] = Counter()
+        self._lock = threading.Lock()
+
+    def get(self, path: str, lang: str) -> Maybe[ParsedFile]:
+        """parsed content of path, Nothing if it does not exist or lang is unsupported"""
+        if lang != LANGUAGE_IDENTIFIER.PYTHON and lang not in TS_LANGUAGES:
+            return Nothing
+        try:
+            st = os.stat(path)
+        except OSError:
+            return Nothing
+        stamp = (st.st_mtime_ns, st.st_size)
+        key = (path, lang)
+
+        with self._lock:
+            match self.entries.get(key):
+                case (cached_stamp, parsed) if cached_stamp == stamp:
+                    self.entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return Some(parsed)
+            self.stats["misses"] += 1
+
+        try:
+            with open(path, "r", errors="replace") as file:
+                code = file.read()
+        except OSError:
+            return Nothing
+        parsed = ParsedFile(path, code, lang)
+
+        with self._lock:
+            self._remove(key)
+            self.entries[key] = (stamp, parsed)
+            self.n_bytes += parsed.size
+            while self.n_bytes > self.max_bytes and len(self.entries) > 1:
+                self._remove(next(iter(self.entries)))
+                self.stats["evictions"] += 1
+        return Some(parsed)
+
+    def _remove(self, key: tuple[str, str]):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.n_bytes -= entry[1].size
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.n_bytes = 0
+
+
+PARSE_CACHE = ParseCache()
+
+
+def parse_file(path: str, lang: str) -> Maybe[ParsedFile]:
+    """parse path with the process-wide PARSE_CACHE"""
+    return PARSE_CACHE.get(path, lang)
@@ -0,0 +1,125 @@
+"""named configurations of the language servers
+
+- "full": the client capabilities of an editor, servers keep their defaults
+- "definition": only what textDocument/definition needs; linters,
+  diagnostics, code lenses and formatting are turned off through the
+  settings, initializationOptions or flags each server reads
+
+python3 scripts/bench_lsp_latency.py <focal file> --profile=definition
+"""
+from typing import Optional
+from pylspclient.lsp_structs import LANGUAGE_IDENTIFIER
+from unitsyncer.common import CAPABILITIES
+
+PROFILES = ("full", "definition")
+
+DEFINITION_CAPABILITIES = {
+    "textDocument": {
+        "synchronization": {"dynamicRegistration": False, "didSave": False},
+        "definition": {"dynamicRegistration": False, "linkSupport": True},
+    },
+    "workspace": {"workspaceFolders": True, "configuration": True},
+    "window": {"workDoneProgress": True},
+}
+
+# pylsp plugins other than jedi_definition, they run on every didOpen or request
+PYLSP_PLUGINS = (
+    "autopep8",
+    "flake8",
+    "jedi_completion",
+    "jedi_hover",
+    "jedi_references",
+    "jedi_signature_help",
+    "jedi_symbols",
+    "mccabe",
+    "preload",
+    "pycodestyle",
+    "pydocstyle",
+    "pyflakes",
+    "pylint",
+    "rope_autoimport",
+    "rope_completion",
+    "yapf",
+)
+
+# settings sent with workspace/didChangeConfiguration and returned to
+# workspace/configuration requests, keyed by section
+DEFINITION_SETTINGS: dict[str, dict] = {
+    LANGUAGE_IDENTIFIER.PYTHON: {
+        "pylsp": {"plugins": {plugin: {"enabled": False} for plugin in PYLSP_PLUGINS}}
+    },
+    LANGUAGE_IDENTIFIER.GO: {
+        "gopls": {
+            # diagnostics are only computed on didSave, which is never sent
+            "diagnosticsTrigger": "Save",
+            "staticcheck": False,
+            "semanticTokens": False,
+            "codelenses": {},
+            "vulncheck": "Off",
+        }
+    },
+}
+
+# Rust is answered by RustSynchronizer from tree-sitter, no server is started
+DEFINITION_INIT_OPTIONS: dict[str, dict] = {
+    LANGUAGE_IDENTIFIER.JAVASCRIPT: {"disableAutomaticTypingAcquisition": True},
+    LANGUAGE_IDENTIFIER.GO: DEFINITION_SETTINGS[LANGUAGE_IDENTIFIER.GO]["gopls"],
+}
+
+DEFINITION_ARGS: dict[str, list[str]] = {
+    LANGUAGE_IDENTIFIER.C: ["--clang-tidy=false", "--header-insertion=never"],
+    LANGUAGE_IDENTIFIER.CPP: ["--clang-tidy=false", "--header-insertion=never"],
+}
+
+PROFILE = "full"
+
+
+def configure(name: str):
+    """select the profile of every server, before the workers are forked"""
+    global PROFILE  # pylint: disable=global-statement
+    if name not in PROFILES:
+        raise ValueError(f"Unknown profile {name}, expected one of {PROFILES}")
+    PROFILE = name
+
+
+def capabilities() -> dict:
+    """client capabilities sent with initialize"""
+    return DEFINITION_CAPABILITIES if PROFILE == "definition" else CAPABILITIES
+
+
+def settings(language: str) -> Optional[dict]:
+    """settings of the server, None to keep its defaults"""
+    if PROFILE == "definition":
+        return DEFINITION_SETTINGS.get(language)
+    return None
+
+
+def configuration(language: str, sections: list[Optional[str]]) -> list:
+    """result of a workspace/configuration request for the given sections"""
+    server_settings = settings(language) or {}
+    return [server_settings.get(section or "") for section in sections]
+
+
+def server_args(language: str) -> list[str]:
+    """extra command line arguments of the server"""
+    if PROFILE == "definition":
+        return DEFINITION_ARGS.get(language, [])
+    return []
+
+
+def init_options(language: str, base: Optional[dict] = None) -> Optional[dict]:
+    """initializationOptions of the server, merged into base"""
+    if PROFILE != "definition" or language not in DEFINITION_INIT_OPTIONS:
+        return base
+    return merge(base or {}, DEFINITION_INIT_OPTIONS[language])
+
+
+def merge(base: dict, extra: dict) -> dict:
+    """recursive union of two settings dicts, extra wins on conflicts"""
+    merged = dict(base)
+    for key, value in extra.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
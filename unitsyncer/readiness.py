@@ -0,0 +1,150 @@
+"""readiness of language servers that index the workspace before answering
+
+gopls, jdtls and clangd answer `definition` with nothing while they are still
+indexing, so lookups sent right after initialize fail with "No definition
+found". Rust is answered by RustSynchronizer without a server. Two measures
+against it:
+- IndexingTracker follows the work done progress a server reports with
+  $/progress begin/end, and holds the lookups of its synchronizer until no
+  progress is active, at most READY_TIMEOUT seconds after the server started.
+  A server of INDEXING_LANGS that reports no progress within QUIET_SECONDS is
+  taken as ready, the others are never held unless they report progress.
+- lookups of INDEXING_LANGS that still found no definition are deferred to
+  the end of their workdir and looked up once more, see `is_premature`.
+"""
+import asyncio
+import threading
+import time
+from collections import Counter
+from typing import Any
+from pylspclient.lsp_structs import LANGUAGE_IDENTIFIER
+from unitsyncer import metrics
+
+# seconds after the start of a server after which lookups are no longer held
+READY_TIMEOUT = 60.0
+# seconds an indexing server has to report its first progress
+QUIET_SECONDS = 1.0
+INDEXING_LANGS = (
+    LANGUAGE_IDENTIFIER.GO,
+    LANGUAGE_IDENTIFIER.JAVA,
+    LANGUAGE_IDENTIFIER.C,
+    LANGUAGE_IDENTIFIER.CPP,
+)
+
+# counters of the current process, reported in the run summary
+STATS: Counter[str] = Counter()
+
+
+def _field(obj: Any, name: str) -> Any:
+    """field of a json dict or of a sansio_lsp_client event"""
+    if isinstance(obj, dict):
+        return obj.get(name)
+    return getattr(obj, name, None)
+
+
+class IndexingTracker:
+    """work done progress of one server, across its restarts
+
+    Args:
+        language (str): LANGUAGE_IDENTIFIER of the server
+        timeout (float): READY_TIMEOUT
+        quiet (float): QUIET_SECONDS
+    """
+
+    def __init__(
+        self,
+        language: str,
+        timeout: float = READY_TIMEOUT,
+        quiet: float = QUIET_SECONDS,
+    ) -> None:
+        self.timeout = timeout
+        self.quiet = quiet if language in INDEXING_LANGS else 0.0
+        self.active: set[Any] = set()
+        self.started_at = time.monotonic()
+        self.reported = False
+        self.cancelled = False
+        self._cond = threading.Condition()
+
+    def reset(self):
+        """a new server is starting, it has not indexed anything yet"""
+        with self._cond:
+            self.active.clear()
+            self.started_at = time.monotonic()
+            self.reported = False
+            self.cancelled = False
+
+    def cancel(self):
+        """the server was killed, release the held lookups"""
+        with self._cond:
+            self.cancelled = True
+            self._cond.notify_all()
+
+    def on_progress(self, params: Any):
+        """handler of $/progress notifications"""
+        token = _field(params, "token")
+        kind = _field(_field(params, "value"), "kind")
+        with self._cond:
+            if kind == "begin":
+                self.active.add(token)
+                self.reported = True
+            elif kind == "end":
+                self.active.discard(token)
+            self._cond.notify_all()
+
+    def ready(self) -> bool:
+        if self.cancelled or time.monotonic() >= self.started_at + self.timeout:
+            return True
+        if self.active:
+            return False
+        return self.reported or time.monotonic() >= self.started_at + self.quiet
+
+    def _next_check(self) -> float:
+        """seconds until ready() can change without a notification"""
+        now = time.monotonic()
+        deadline = self.started_at + self.timeout
+        if not self.active and not self.reported:
+            deadline = min(deadline, self.started_at + self.quiet)
+        return max(deadline - now, 0.0)
+
+    def wait(self) -> float:
+        """block until the server is ready
+
+        Returns:
+            float: seconds waited
+        """
+        start = time.monotonic()
+        with self._cond:
+            while not self.ready():
+                self._cond.wait(self._next_check())
+        return self._waited(start)
+
+    async def wait_async(self, interval: float = 0.1) -> float:
+        """wait with a coroutine, progress is fed by the event loop itself"""
+        start = time.monotonic()
+        while not self.ready():
+            await asyncio.sleep(min(interval, self._next_check()))
+        return self._waited(start)
+
+    def _waited(self, start: float) -> float:
+        waited = time.monotonic() - start
+        if waited > 0.01:
+            STATS["held_batches"] += 1
+            metrics.record("wait_ready", waited)
+        return waited
+
+
+def defers(language: str) -> bool:
+    """whether lookups without a definition are retried at the end of a workdir"""
+    return language in INDEXING_LANGS
+
+
+def is_premature(result: dict) -> bool:
+    """result of a lookup the server may have answered before it was ready"""
+    return str(result.get("error", "")).startswith("No definition found")
+
+
+def record_retry(results: list[dict]) -> list[dict]:
+    """count the deferred lookups looked up again and the ones recovered"""
+    STATS["retried"] += len(results)
+    STATS["recovered"] += sum("code" in result for result in results)
+    return results
@@ -1,8 +1,12 @@
 """Replacement Synchronizer for Rust"""
-from typing import Optional
+from typing import Optional, Sequence
 from pip._vendor import tomli
 from os.path import join as pjoin, isfile, isdir, abspath
 import os
+import sys
+import json
+import hashlib
+import logging
 from returns.maybe import Maybe, Nothing, Some
 from returns.result import Result, Success, Failure
 from frontend.parser.ast_util import ASTLoc, ASTUtil
@@ -11,42 +15,240 @@ from tree_sitter import Language, Parser, Tree
 from tree_sitter import Node
 from pylspclient.lsp_structs import Location, LANGUAGE_IDENTIFIER, Range, Position
 from unitsyncer.source_code import get_function_code
+from unitsyncer.parse_cache import ParsedFile
 from unitsyncer.util import path2uri, uri2path
 from returns.converters import maybe_to_result
 from unitsyncer.sync import Synchronizer
+from unitsyncer.common import UNITSYNCER_CACHE
 from fuzzywuzzy import process
-from functools import partial
+from array import array
 
 
-class RustSynchronizer(Synchronizer):
-    def __init__(self, workspace_dir: str, language="rust") -> None:
-        super().__init__(workspace_dir, LANGUAGE_IDENTIFIER.RUST)
-        self.file_func_map: dict[str, list[tuple[str, Node]]] = {}
+def module_path(workspace_dir: str, file_path: str) -> list[str]:
+    """rust module path of a file, e.g. src/engine/general_purpose/mod.rs is
+    ["engine", "general_purpose"]
 
-    def initialize(self, timeout: int = 10):
-        """index all files and functions in the workdir/src"""
-        for root, _, files in os.walk(self.workspace_dir):
-            for file in files:
-                if file.endswith(".rs"):
-                    file_path = pjoin(root, file)
-                    funcs = self._get_file_functions(file_path)
-                    self.file_func_map[file_path] = funcs
+    Args:
+        workspace_dir (str): root of the crate
+        file_path (str): path to a .rs file in the crate
+    """
+    parts = os.path.relpath(file_path, workspace_dir).removesuffix(".rs").split("/")
+    if "src" in parts:
+        parts = parts[parts.index("src") + 1 :]
+    if parts and parts[-1] in ("mod", "lib", "main"):
+        parts = parts[:-1]
+    return parts
 
-    def _get_file_functions(self, file_path: str) -> list[tuple[str, Node]]:
-        """get all function items in the given file
 
-        Args:
-            file_path (str): path to source code file
+def owner_name(node: Node) -> Optional[str]:
+    """name of the type or trait whose impl or trait block contains a function"""
+    parent = node.parent
+    while parent is not None:
+        match parent.type:
+            case "impl_item":
+                owner = parent.child_by_field_name("type")
+                # Foo<T> -> Foo, module::Foo -> Foo
+                while owner is not None and owner.type in (
+                    "generic_type",
+                    "scoped_type_identifier",
+                ):
+                    owner = owner.child_by_field_name(
+                        "type" if owner.type == "generic_type" else "name"
+                    )
+                return None if owner is None else owner.text.decode()
+            case "trait_item":
+                name = parent.child_by_field_name("name")
+                return None if name is None else name.text.decode()
+            case "function_item":
+                # functions nested in a function body are not reachable by path
+                return None
+        parent = parent.parent
+    return None
+
+
+def strip_call(expr: str) -> list[str]:
+    """path segments of a call expression, e.g. `a::B::new(x)` is ["a", "B", "new"]"""
+    return expr.split("(")[0].split("<")[0].split("::")
+
+
+# (name, qualname, start_row, start_col, end_row, end_col), where qualname is
+# `Type::name` for a function in an impl or trait block and `name` otherwise
+FunctionRecord = tuple[str, str, int, int, int, int]
+
+# bump when the records or the way they are extracted change
+INDEX_VERSION = 1
+
+# build output, VCS metadata and vendored dependencies are never indexed
+PRUNE_DIRS = {"target", "vendor", "node_modules", ".git", ".cargo"}
+
+
+def rust_files(workspace_dir: str):
+    """paths of the .rs files in a workspace, without pruned directories
+    and cargo target dirs (marked by a CACHEDIR.TAG) under any name"""
+    for root, dirs, files in os.walk(workspace_dir):
+        dirs[:] = [
+            d
+            for d in dirs
+            if d not in PRUNE_DIRS and not isfile(pjoin(root, d, "CACHEDIR.TAG"))
+        ]
+        for file in files:
+            if file.endswith(".rs"):
+                yield pjoin(root, file)
+
+
+def parse_functions(file_path: str) -> list[FunctionRecord]:
+    """get all function items in the given file
+
+    Args:
+        file_path (str): path to source code file
+
+    Returns:
+        list[FunctionRecord]: functions in preorder
+    """
+
+    try:
+        with open(file_path, "r", errors="replace") as f:
+            code = f.read()
+    except OSError:
+        return []
+    # not through PARSE_CACHE, the tree is freed once its rows are extracted
+    parsed = ParsedFile(file_path, code, LANGUAGE_IDENTIFIER.RUST)
+    ast_util, tree = parsed.ast_util, parsed.ts_tree
+    assert ast_util is not None and tree is not None
+    records = []
+    for node in ast_util.get_all_nodes_of_type(tree.root_node, "function_item"):
+        name = ast_util.get_name(node).value_or("")
+        owner = owner_name(node)
+        qualname = name if owner is None else f"{owner}::{name}"
+        records.append((name, qualname, *node.start_point, *node.end_point))
+    return records
+
+
+def cached_functions(
+    file_path: str, cache_dir: Optional[str] = UNITSYNCER_CACHE
+) -> list[FunctionRecord]:
+    """function table of a file, cached on disk by the hash of its content
+
+    Args:
+        file_path (str): path to source code file
+        cache_dir (str | None): root of the cache, None to always parse
+
+    Returns:
+        list[FunctionRecord]: functions in preorder
+    """
+    if cache_dir is None:
+        return parse_functions(file_path)
+    try:
+        with open(file_path, "rb") as f:
+            digest = hashlib.sha1(f.read()).hexdigest()
+    except OSError:
+        return []
+
+    cache_file = pjoin(cache_dir, f"rust-index-v{INDEX_VERSION}", digest[:2], digest)
+    try:
+        with open(cache_file) as f:
+            return [tuple(r) for r in json.load(f)]
+    except (OSError, ValueError):
+        pass
+
+    records = parse_functions(file_path)
+    try:
+        os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        # write then rename, so concurrent workers never read a partial table
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        with open(tmp_file, "w") as f:
+            json.dump(records, f)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        logging.debug(f"cannot cache functions of {file_path}: {e}")
+    return records
+
+
+class FunctionTable:
+    """functions of a workspace in flat arrays, each function is an int id
+
+    Only names, file ids and positions are kept, no tree-sitter node, so the
+    syntax trees of indexed files can be freed. Source code is read back from
+    the file when a definition is looked up.
+    """
+
+    def __init__(self) -> None:
+        self.files: list[str] = []
+        self.names: list[str] = []
+        self.file_ids = array("I")
+        # start_row, start_col, end_row, end_col of each function
+        self.points = array("I")
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def add(self, file_path: str, records: list[FunctionRecord]) -> range:
+        """append the functions of a file
 
         Returns:
-            list[tuple[str, Node]]: [(function_name, function_node)]
+            range: ids of the added functions
         """
-        with open(file_path) as code_file:
-            ast_util = ASTUtil(code_file.read())
-        tree = ast_util.tree(RUST_LANGUAGE)
-        nodes = ast_util.get_all_nodes_of_type(tree.root_node, "function_item")
-        names = [ast_util.get_name(node).value_or("") for node in nodes]
-        return list(zip(names, nodes))
+        file_id = len(self.files)
+        self.files.append(file_path)
+        start = len(self.names)
+        for name, _, *points in records:
+            self.names.append(sys.intern(name))
+            self.file_ids.append(file_id)
+            self.points.extend(points)
+        return range(start, len(self.names))
+
+    def file_of(self, func_id: int) -> str:
+        return self.files[self.file_ids[func_id]]
+
+    def location(self, func_id: int) -> Location:
+        start_row, start_col, end_row, end_col = self.points[
+            4 * func_id : 4 * func_id + 4
+        ]
+        return Location(
+            path2uri(self.file_of(func_id)),
+            Range(Position(start_row, start_col), Position(end_row, end_col)),
+        )
+
+
+class RustSynchronizer(Synchronizer):
+    def __init__(
+        self,
+        workspace_dir: str,
+        language="rust",
+        cache_dir: Optional[str] = UNITSYNCER_CACHE,
+    ) -> None:
+        super().__init__(workspace_dir, LANGUAGE_IDENTIFIER.RUST)
+        self.cache_dir = cache_dir
+        self.table = FunctionTable()
+        # file path -> function ids
+        self.file_func_map: dict[str, range] = {}
+        # function name -> function ids, in file_func_map order
+        self.name_index: dict[str, array] = {}
+        # `Type::method`, `module::Type::method` and `module::function` keys
+        self.qualified_index: dict[str, array] = {}
+
+    def initialize(self, timeout: int = 10):
+        """index all files and functions in the workdir"""
+        for file_path in rust_files(self.workspace_dir):
+            funcs = cached_functions(file_path, self.cache_dir)
+            func_ids = self.table.add(file_path, funcs)
+            self.file_func_map[file_path] = func_ids
+            self._index_functions(file_path, funcs, func_ids)
+
+    def _index_functions(
+        self, file_path: str, funcs: list[FunctionRecord], func_ids: range
+    ):
+        module = module_path(self.workspace_dir, file_path)
+        for (name, qualname, *_), func_id in zip(funcs, func_ids):
+            self.name_index.setdefault(name, array("I")).append(func_id)
+            if qualname == name:
+                keys = [module + [name]]
+            else:
+                keys = [[qualname], module + [qualname]]
+            for key in keys:
+                self.qualified_index.setdefault("::".join(key), array("I")).append(
+                    func_id
+                )
 
     def get_source_of_call(
         self,
@@ -72,9 +274,9 @@ class RustSynchronizer(Synchronizer):
                     maybe_to_result(get_function_code(loc, LANGUAGE_IDENTIFIER.RUST))
                     .alt(not_found_error)
                     .bind(
-                        lambda t: Failure("Empty Source Code")
-                        if t[0] == ""
-                        else Success(t)
+                        lambda t: (
+                            Failure("Empty Source Code") if t[0] == "" else Success(t)
+                        )
                     )
                 )
             case _:
@@ -83,6 +285,11 @@ class RustSynchronizer(Synchronizer):
     def goto_definition(self, focal_name: str) -> list[tuple[str, Location]]:
         """get the definition of the given function name
 
+        A qualified call such as `Type::new(..)` or `module::f(..)` only resolves
+        to an exact path in the crate. A method call resolves to `Type::method`
+        if a type in the receiver is known, otherwise to every function with
+        that name, ranked by the similarity of their file with the receiver.
+
         Args:
             focal_name (str): name of the function
 
@@ -90,9 +297,9 @@ class RustSynchronizer(Synchronizer):
             list[tuple[str, Location]]: [(source_file_path, location))],
                 source_file_path is used for sorting the results
         """
-        results: list[tuple[str, Location]] = []  # [(file_path, location)]
         include_name: str
         base_name: str
+        receiver: list[str] = []
 
         match focal_name.split("."):
             case [obj_name, *xs, method_name]:
@@ -101,35 +308,67 @@ class RustSynchronizer(Synchronizer):
                 # if method_name is unwrap, use the previous splitted name as method_name
                 if "unwrap" in method_name:
                     method_name = obj_name if len(xs) == 0 else xs[-1]
+                if method_name != obj_name:
+                    receiver = strip_call(obj_name)
                 base_name = method_name.split("(")[0]
             case _:
                 temp_name = focal_name.split("(")[0]
                 include_name = temp_name
                 base_name = temp_name
 
-        for file_path, funcs in self.file_func_map.items():
-            for name, node in funcs:
-                if name == base_name:
-                    uri = path2uri(file_path)
-                    range_ = Range(
-                        Position(*node.start_point),
-                        Position(*node.end_point),
+        candidates: Sequence[int]
+        match strip_call(base_name):
+            case [name]:
+                candidates = self._lookup_method(receiver, name)
+            case path:
+                candidates = self._lookup_path(path)
+
+        if len(candidates) > 1:
+            # sort by fuzzy match with include name, once per file
+            scores: dict[str, float] = {}
+            for func_id in candidates:
+                file_path = self.table.file_of(func_id)
+                if file_path not in scores:
+                    scores[file_path] = self.fuzzy_comparator(
+                        include_name, (file_path, None)
                     )
-                    results.append((file_path, Location(uri, range_)))
+            candidates = sorted(
+                candidates,
+                key=lambda func_id: scores[self.table.file_of(func_id)],
+                reverse=True,
+            )
 
-        # sort by fuzzy match with base name
-        return sorted(
-            results,
-            key=partial(self.fuzzy_comparator, include_name),
-            reverse=True,
-        )
+        return [
+            (self.table.file_of(func_id), self.table.location(func_id))
+            for func_id in candidates
+        ]
+
+    def _lookup_path(self, path: list[str]) -> Sequence[int]:
+        """functions whose qualified name is the longest suffix of path,
+        so that `crate::`, `self::` and re-exported prefixes are skipped"""
+        for i in range(len(path) - 1):
+            if (funcs := self.qualified_index.get("::".join(path[i:]))) is not None:
+                return funcs
+        return []
+
+    def _lookup_method(self, receiver: list[str], name: str) -> Sequence[int]:
+        """`Type::name` for the innermost type named in receiver, if any,
+        otherwise all functions named `name`"""
+        for segment in reversed(receiver):
+            if segment[:1].isupper() and (
+                funcs := self.qualified_index.get(f"{segment}::{name}")
+            ):
+                return funcs
+        return self.name_index.get(name, [])
 
-    def fuzzy_comparator(self, include_name: str, x: tuple[str, Location]) -> float:
+    def fuzzy_comparator(
+        self, include_name: str, x: tuple[str, Optional[Location]]
+    ) -> float:
         """similarity score of file path with include_name
 
         Args:
             include_name (str): **engine::GeneralPurpose::new(&URL_SAFE, PAD)**.encode(bytes)
-            x (tuple[str, Location]): (file_path, location)
+            x (tuple[str, Location | None]): (file_path, location)
 
         Returns:
             float: similarity score
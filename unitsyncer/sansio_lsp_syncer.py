@@ -1,22 +1,39 @@
 """Synchronizer Based on sansio_lsp"""
 
-from unitsyncer.sync import Synchronizer, get_lsp_cmd
+from unitsyncer.sync import (
+    Synchronizer,
+    get_lsp_cmd,
+    pipeline,
+    FocalCall,
+    SourceResult,
+    WORKSPACE_SWITCH_LANGS,
+    STOP_TIMEOUT,
+    prepare_workspace,
+    source_of_definition,
+)
 import pprint
 import pathlib
 import subprocess
 import sys
 import threading
 import queue
-import time
 import os
+from collections import deque
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Callable, Optional, TypeVar
 from returns.result import Result, Success, Failure
-from returns.converters import maybe_to_result
 import logging
-from unitsyncer.util import path2uri, replace_tabs, uri2path
-from unitsyncer.source_code import get_function_code
+from unitsyncer.util import path2uri, kill_proc_tree, ReadPipe
+from unitsyncer.documents import OpenDocuments
+from unitsyncer.notifications import NotificationRouter
+from unitsyncer.readiness import IndexingTracker
+from unitsyncer import metrics, server_cache, health, profiles
 
 import sansio_lsp_client as lsp
 
+T = TypeVar("T")
+
 # ============================utils ========================
 # from https://github.com/PurpleMyst/sansio-lsp-client/blob/master/tests/test_actual_langservers.py
 
@@ -46,27 +63,59 @@ RESPONSE_TYPES = {
     METHOD_FORMAT_SEL: lsp.DocumentFormatting,
 }
 
+# method of the messages the server sends unprompted, for the router's policy
+SERVER_METHODS = {
+    lsp.PublishDiagnostics: "textDocument/publishDiagnostics",
+    lsp.LogMessage: "window/logMessage",
+    lsp.ShowMessage: "window/showMessage",
+    lsp.WorkDoneProgressBegin: "$/progress",
+    lsp.WorkDoneProgressReport: "$/progress",
+    lsp.WorkDoneProgressEnd: "$/progress",
+    lsp.ShowMessageRequest: "window/showMessageRequest",
+    lsp.WorkDoneProgressCreate: "window/workDoneProgress/create",
+    lsp.RegisterCapabilityRequest: "client/registerCapability",
+    lsp.ConfigurationRequest: "workspace/configuration",
+    lsp.WorkspaceFolders: "workspace/workspaceFolders",
+}
+# responses without an id waited for by type, e.g. Shutdown, kept at most
+MAX_UNCLAIMED = 256
+
 
 class ThreadedServer:
     """
     Gathers all messages received from server - to handle random-order-messages
     that are not a response to a request.
+
+    The reader thread feeds stdout to the client in chunks as soon as it arrives;
+    responses are routed to a Future per request id with the time they were
+    received, requests and notifications of the server go through
+    self.notifications, and the few responses the client gives no id, e.g.
+    Initialized, are queued by type in self.msgs.
+    All access to lsp_client has to hold self._cond.
     """
 
-    def __init__(self, process, root_uri):
+    READ_CHUNK_SIZE = 1 << 16
+
+    def __init__(self, process, root_uri, language=None, notifications=None):
         self.process = process
         self.root_uri = root_uri
+        self.language = language
         self.lsp_client = lsp.Client(
             root_uri=root_uri,
             workspace_folders=[lsp.WorkspaceFolder(uri=self.root_uri, name="Root")],
             trace="verbose",
         )
-        self.msgs = []
+        self.msgs: dict[type, deque] = {}
+        self.notifications: NotificationRouter = (
+            NotificationRouter() if notifications is None else notifications
+        )
+        self.late_responses = 0
+        self._pending: dict[int, Future] = {}
+        self._cond = threading.Condition()
 
         self._pout = process.stdout
         self._pin = process.stdin
 
-        self._read_q: queue.Queue[bytes] = queue.Queue()
         self._send_q: queue.Queue[bytes | None] = queue.Queue()
 
         self.reader_thread = threading.Thread(
@@ -76,25 +125,37 @@ class ThreadedServer:
             target=self._send_loop, name="lsp-writer", daemon=True
         )
 
+        self.exception = None
+
         self.reader_thread.start()
         self.writer_thread.start()
 
-        self.exception = None
+        # the client queued its initialize request on construction
+        with self._cond:
+            self._queue_data_to_send()
 
     # threaded
     def _read_loop(self):
         try:
             while True:
-                data = self.process.stdout.read(1)
+                data = self._pout.read1(self.READ_CHUNK_SIZE)
 
                 if data == b"":
                     break
 
-                self._read_q.put(data)
+                self._data_received(data)
         except Exception as ex:  # pylint: disable=broad-exception-caught
             self.exception = ex
         self._send_q.put_nowait(None)  # stop send loop
 
+        with self._cond:
+            if self.exception is None:
+                self.exception = EOFError("language server closed its stdout")
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(self.exception)
+            self._cond.notify_all()
+
     # threaded
     def _send_loop(self):
         try:
@@ -114,13 +175,27 @@ class ThreadedServer:
         if send_buf:
             self._send_q.put(send_buf)
 
-    def _read_data_received(self):
-        while not self._read_q.empty():
-            data = self._read_q.get()
-            events = self.lsp_client.recv(data)
-            for ev in events:
-                self.msgs.append(ev)
-                self._try_default_reply(ev)
+    def _data_received(self, data: bytes):
+        with self._cond:
+            for ev in self.lsp_client.recv(data):
+                message_id = getattr(ev, "message_id", None)
+                if message_id in self._pending:
+                    # the waiter removes it, the response may come first
+                    if not self._pending[message_id].done():
+                        self._pending[message_id].set_result((ev, time.perf_counter()))
+                elif isinstance(ev, (lsp.ServerNotification, lsp.ServerRequest)):
+                    method = SERVER_METHODS.get(type(ev), type(ev).__name__)
+                    self.notifications.route(method, ev)
+                    self._try_default_reply(ev)
+                elif message_id is not None:
+                    # response to a request that already timed out
+                    self.late_responses += 1
+                else:
+                    self.msgs.setdefault(type(ev), deque(maxlen=MAX_UNCLAIMED)).append(
+                        ev
+                    )
+            self._queue_data_to_send()
+            self._cond.notify_all()
 
     def _try_default_reply(self, msg):
         if isinstance(
@@ -129,36 +204,83 @@ class ThreadedServer:
                 lsp.ShowMessageRequest,
                 lsp.WorkDoneProgressCreate,
                 lsp.RegisterCapabilityRequest,
-                lsp.ConfigurationRequest,
             ),
         ):
             msg.reply()
 
+        elif isinstance(msg, lsp.ConfigurationRequest):
+            sections = [item.section for item in msg.items]
+            msg.reply(profiles.configuration(self.language, sections))
+
         elif isinstance(msg, lsp.WorkspaceFolders):
             msg.reply([lsp.WorkspaceFolder(uri=self.root_uri, name="Root")])
 
-    def wait_for_message_of_type(self, type_, timeout=60):
-        end_time = time.monotonic() + timeout
-        while time.monotonic() < end_time:
+    def send(self, call: Callable[[lsp.Client], T]) -> T:
+        """run call on the client under the client lock and send what it queued"""
+        with self._cond:
+            result = call(self.lsp_client)
             self._queue_data_to_send()
-            self._read_data_received()
+        return result
 
-            # raise thread's exception if have any
+    def request(self, call: Callable[[lsp.Client], int]) -> int:
+        """send a request, its response is collected with wait_for_response
+
+        Args:
+            call (Callable[[lsp.Client], int]): sends the request, returns its id
+        """
+        with self._cond:
             if self.exception:
                 raise self.exception
+            event_id = call(self.lsp_client)
+            self._pending[event_id] = Future()
+            self._queue_data_to_send()
+        return event_id
 
-            for msg in self.msgs:
-                if isinstance(msg, type_):
-                    self.msgs.remove(msg)
-                    return msg
+    def wait_for_message_of_type(self, type_, timeout=60):
+        found = []
 
-            time.sleep(0.2)
+        def find() -> bool:
+            if self.msgs.get(type_):
+                found.append(self.msgs[type_].popleft())
+                return True
+            return self.exception is not None
 
-        raise Exception(  # pylint: disable=broad-exception-raised
-            f"Didn't receive {type_} in time; have: " + pprint.pformat(self.msgs)
-        )
+        with self._cond:
+            self._cond.wait_for(find, timeout=timeout)
+            if found:
+                return found[0]
 
-    def exit_cleanly(self):
+            # raise thread's exception if have any
+            if self.exception:
+                raise self.exception
+
+            raise Exception(  # pylint: disable=broad-exception-raised
+                f"Didn't receive {type_} in time; recent notifications: "
+                + pprint.pformat(list(self.notifications.recent))
+            )
+
+    def wait_for_response(self, message_id: int, timeout=60):
+        """wait for the response (or error) to the request with the given id"""
+        return self.wait_for_reply(message_id, timeout)[0]
+
+    def wait_for_reply(self, message_id: int, timeout=60) -> tuple:
+        """wait_for_response, with the perf_counter time the response was received"""
+        with self._cond:
+            future = self._pending.get(message_id)
+        if future is None:
+            raise KeyError(f"No pending request {message_id}")
+        try:
+            reply: tuple = future.result(timeout=timeout)
+            return reply
+        except FutureTimeoutError as e:
+            raise Exception(  # pylint: disable=broad-exception-raised
+                f"Didn't receive response {message_id} in time"
+            ) from e
+        finally:
+            with self._cond:
+                self._pending.pop(message_id, None)
+
+    def exit_cleanly(self, timeout=60):
         # Not necessarily error, gopls sends logging messages for example
         #        if self.msgs:
         #            print(
@@ -166,11 +288,9 @@ class ThreadedServer:
         #            )
 
         assert self.lsp_client.state == lsp.ClientState.NORMAL
-        self.lsp_client.shutdown()
-        self.wait_for_message_of_type(lsp.Shutdown)
-        self.lsp_client.exit()
-        self._queue_data_to_send()
-        self._read_data_received()
+        self.send(lambda client: client.shutdown())
+        self.wait_for_message_of_type(lsp.Shutdown, timeout=timeout)
+        self.send(lambda client: client.exit())
 
     def do_method(
         self, text, file_uri, method, pos, response_type=None
@@ -181,54 +301,68 @@ class ThreadedServer:
                 position=pos,
             )
 
+        def send(client: lsp.Client) -> int:
+            if method == METHOD_COMPLETION:
+                return client.completion(
+                    text_document_position=doc_pos(),
+                    context=lsp.CompletionContext(
+                        triggerKind=lsp.CompletionTriggerKind.INVOKED,
+                        triggerCharacter=None,
+                    ),
+                )
+            if method == METHOD_HOVER:
+                return client.hover(text_document_position=doc_pos())
+            if method == METHOD_SIG_HELP:
+                return client.signatureHelp(text_document_position=doc_pos())
+            if method == METHOD_DEFINITION:
+                return client.definition(text_document_position=doc_pos())
+            if method == METHOD_REFERENCES:
+                return client.references(text_document_position=doc_pos())
+            if method == METHOD_IMPLEMENTATION:
+                return client.implementation(text_document_position=doc_pos())
+            if method == METHOD_DECLARATION:
+                return client.declaration(text_document_position=doc_pos())
+            if method == METHOD_TYPEDEF:
+                return client.typeDefinition(text_document_position=doc_pos())
+            if method == METHOD_DOC_SYMBOLS:
+                _docid = lsp.TextDocumentIdentifier(uri=file_uri)
+                return client.documentSymbol(text_document=_docid)
+            raise NotImplementedError(method)
+
         if not response_type:
             response_type = RESPONSE_TYPES[method]
 
-        if method == METHOD_COMPLETION:
-            event_id = self.lsp_client.completion(
-                text_document_position=doc_pos(),
-                context=lsp.CompletionContext(
-                    triggerKind=lsp.CompletionTriggerKind.INVOKED, triggerCharacter=None
-                ),
-            )
-        elif method == METHOD_HOVER:
-            event_id = self.lsp_client.hover(text_document_position=doc_pos())
-        elif method == METHOD_SIG_HELP:
-            event_id = self.lsp_client.signatureHelp(text_document_position=doc_pos())
-        elif method == METHOD_DEFINITION:
-            event_id = self.lsp_client.definition(text_document_position=doc_pos())
-        elif method == METHOD_REFERENCES:
-            event_id = self.lsp_client.references(text_document_position=doc_pos())
-        elif method == METHOD_IMPLEMENTATION:
-            event_id = self.lsp_client.implementation(text_document_position=doc_pos())
-        elif method == METHOD_DECLARATION:
-            event_id = self.lsp_client.declaration(text_document_position=doc_pos())
-        elif method == METHOD_TYPEDEF:
-            event_id = self.lsp_client.typeDefinition(text_document_position=doc_pos())
-        elif method == METHOD_DOC_SYMBOLS:
-            _docid = lsp.TextDocumentIdentifier(uri=file_uri)
-            event_id = self.lsp_client.documentSymbol(text_document=_docid)
-        else:
-            raise NotImplementedError(method)
-
-        resp = self.wait_for_message_of_type(response_type)
-        assert not hasattr(resp, "message_id") or resp.message_id == event_id
-        return resp
+        if method in (METHOD_REFERENCES, METHOD_IMPLEMENTATION, METHOD_DECLARATION):
+            # these events carry no message_id, so they can only be matched by type
+            self.send(send)
+            return self.wait_for_message_of_type(response_type)
+        return self.wait_for_response(self.request(send))
 
 
 # ============================ ends utils ========================
 
 
 class SansioLSPSynchronizer(Synchronizer):
-    def __init__(self, workspace_dir: str, language: str) -> None:
+    def __init__(
+        self, workspace_dir: str, language: str, max_inflight: int = 8
+    ) -> None:
         super().__init__(workspace_dir, language)
+        self.max_inflight = max_inflight
+        self.documents = OpenDocuments(self._did_open, self._did_close)
 
         self.workspace_path: pathlib.Path = pathlib.Path(self.workspace_dir)
         self.root_uri = self.workspace_path.as_uri()
 
         self.lsp_proc: subprocess.Popen
         self.lsp_server: ThreadedServer
+        self.stderr: Optional[ReadPipe] = None
         self.lsp_client: lsp.Client
+        self.init_timeout = 20
+        self.stopped = False
+        self.monitor: Optional[health.HealthMonitor] = None
+        self.notifications = NotificationRouter()
+        self.indexing = IndexingTracker(language)
+        self.notifications.on("$/progress", self.indexing.on_progress)
 
     def start_lsp_server(self):
         lsp_cmd = get_lsp_cmd(self.langID)
@@ -236,18 +370,69 @@ class SansioLSPSynchronizer(Synchronizer):
             sys.stderr.write("Language {language} is not supported\n")
             exit(1)
 
+        cache_dir = server_cache.repo_cache_dir(self.workspace_dir, self.langID)
         self.lsp_proc = subprocess.Popen(
-            lsp_cmd,
+            lsp_cmd
+            + server_cache.get_lsp_args(self.langID, cache_dir)
+            + profiles.server_args(self.langID)
+            + prepare_workspace(self.workspace_dir, self.langID),
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
+            env=server_cache.get_lsp_env(self.langID, cache_dir),
+            # own process group, so the server and its children are killed together
+            start_new_session=True,
+        )
+        health.limit_memory(self.lsp_proc.pid, self.langID)
+        self.stderr = ReadPipe(self.lsp_proc.stderr)
+        self.stderr.start()
+        self.lsp_server = ThreadedServer(
+            self.lsp_proc, self.root_uri, self.langID, self.notifications
         )
-        self.lsp_server = ThreadedServer(self.lsp_proc, self.root_uri)
         self.lsp_client = self.lsp_server.lsp_client
 
     def initialize(self, timeout: int = 20):
+        self.init_timeout = timeout
+        self.indexing.reset()
         self.start_lsp_server()
         self.lsp_server.wait_for_message_of_type(lsp.Initialized, timeout=timeout)
+        if self.monitor is None:
+            self.monitor = health.HealthMonitor(self).start()
+
+    def restart(self):
+        """start a new server for the workspace after the previous one died"""
+        if self.stderr is not None:
+            logging.debug(f"stderr of the {self.langID} server:\n{self.stderr.text()}")
+        health.release_cgroup(self.lsp_proc.pid)
+        self.documents.forget_all()
+        self.initialize(self.init_timeout)
+
+    def switch_workspace(self, workspace_dir: str) -> bool:
+        if self.langID not in WORKSPACE_SWITCH_LANGS:
+            return False
+
+        self.documents.close_all()
+        old_folder = lsp.WorkspaceFolder(uri=self.root_uri, name="Root")
+        self.workspace_dir = os.path.abspath(workspace_dir)
+        self.workspace_path = pathlib.Path(self.workspace_dir)
+        self.root_uri = self.workspace_path.as_uri()
+        new_folder = lsp.WorkspaceFolder(uri=self.root_uri, name="Root")
+
+        self.lsp_server.root_uri = self.root_uri
+        self.lsp_server.send(
+            lambda client: client.did_change_workspace_folders(
+                added=[new_folder], removed=[old_folder]
+            )
+        )
+        return True
+
+    @property
+    def server_pid(self) -> Optional[int]:
+        return self.lsp_proc.pid
+
+    def release(self, file_paths: list[str]):
+        for file_path in file_paths:
+            self.documents.close(path2uri(file_path))
 
     def open_file(self, file_path: str) -> str:
         """send a file to LSP server
@@ -258,14 +443,18 @@ class SansioLSPSynchronizer(Synchronizer):
         Returns:
             str: uri of the opened file
         """
-        uri = path2uri(file_path)
-        with open(file_path, "r", errors="replace") as f:
-            text = replace_tabs(f.read())
+        return self.documents.open(file_path)
+
+    def _did_open(self, uri: str, text: str):
         file_item = lsp.TextDocumentItem(
             uri=uri, languageId=self.langID, text=text, version=0
         )
-        self.lsp_client.did_open(file_item)
-        return uri
+        self.lsp_server.send(lambda client: client.did_open(file_item))
+
+    def _did_close(self, uri: str):
+        self.lsp_server.send(
+            lambda client: client.did_close(lsp.TextDocumentIdentifier(uri=uri))
+        )
 
     def get_source_of_call(
         self,
@@ -275,48 +464,96 @@ class SansioLSPSynchronizer(Synchronizer):
         col: int,
         verbose: bool = False,
     ) -> Result[tuple[str, str | None, str | None], str]:
-        file_uri = self.open_file(file_path)
-        pos = lsp.Position(line=line, character=col)
+        return self.get_sources_of_calls(
+            [(focal_name, file_path, line, col)], verbose=verbose
+        )[0]
+
+    def get_sources_of_calls(
+        self, calls: list[FocalCall], verbose: bool = False
+    ) -> list[SourceResult]:
+        def lookup(batch: list[FocalCall]) -> list[SourceResult]:
+            self.indexing.wait()
+            return pipeline(
+                batch,
+                self._send_definition,
+                self._receive_definition,
+                Failure,
+                self.max_inflight,
+            )
+
+        return health.replay_lost(
+            calls, lookup(calls), self._crashed, self.restart, lookup
+        )
+
+    def _crashed(self) -> bool:
+        return not self.stopped and self.lsp_proc.poll() is not None
+
+    def _send_definition(self, call: FocalCall) -> Result[tuple[int, float], str]:
+        _, file_path, line, col = call
         try:
-            defn_response = self.lsp_server.do_method(
-                focal_name,
-                file_uri,
-                METHOD_DEFINITION,
-                pos,
+            file_uri = self.open_file(file_path)
+            doc_pos = lsp.TextDocumentPosition(
+                textDocument=lsp.TextDocumentIdentifier(uri=file_uri),
+                position=lsp.Position(line=line, character=col),
+            )
+            event_id = self.lsp_server.request(
+                lambda client: client.definition(text_document_position=doc_pos)
             )
         except Exception as e:  # pylint: disable=broad-exception-caught
             return Failure(f"GoDef Request Failed: {e}")
+        return Success((event_id, time.perf_counter()))
+
+    def _receive_definition(self, sent: tuple[int, float]) -> SourceResult:
+        event_id, sent_at = sent
+        received_at = None
+        try:
+            defn_response, received_at = self.lsp_server.wait_for_reply(event_id)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            return Failure(f"GoDef Request Failed: {e}")
+        finally:
+            # up to its arrival, not to its turn in the pipeline
+            end = time.perf_counter() if received_at is None else received_at
+            metrics.record("definition", end - sent_at)
 
         logging.debug(defn_response)
 
-        def_location: lsp.Location
+        if isinstance(defn_response, lsp.ResponseError):
+            return Failure(f"GoDef Request Failed: {defn_response.message}")
+
         match defn_response.result:
-            case []:
+            case [] | None:
                 return Failure("No definition found")
-            case [fst, *_]:
-                def_location = fst
+            case [def_location, *_]:
+                return source_of_definition(
+                    def_location, self.workspace_dir, self.langID
+                )
             case _:
                 return Failure(
                     f"Unexpected response from LSP server: {str(defn_response)}"
                 )
 
-        file_path = uri2path(def_location.uri).value_or(str(def_location.uri))
-        logging.debug(file_path)
-
-        # check if file path is relative to workspace root
-        if not file_path.startswith(str(self.workspace_dir)):
-            return Failure(f"Source code not in workspace: {file_path}")
-
-        def not_found_error(_):
-            lineno = def_location.range.start.line
-            col_offset = def_location.range.start.character
-            return f"Source code not found: {file_path}:{lineno}:{col_offset}"
-
-        return (
-            maybe_to_result(get_function_code(def_location, self.langID))
-            .alt(not_found_error)
-            .bind(lambda t: Failure("Empty Source Code") if t[0] == "" else Success(t))
+    def stop(self):
+        if self.monitor is not None:
+            self.monitor.stop()
+        try:
+            self.lsp_server.exit_cleanly(timeout=STOP_TIMEOUT)
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logging.debug(e)
+        self.kill()
+        health.release_cgroup(self.lsp_proc.pid)
+        logging.debug(
+            f"{self.langID} server notifications: "
+            f"{self.notifications.summary()}, "
+            f"{self.lsp_server.late_responses} late responses"
         )
 
-    def stop(self):
-        pass
+    def kill(self):
+        self.stopped = True
+        self.recycle()
+
+    def recycle(self):
+        self.indexing.cancel()
+        # the reader thread sees EOF and fails the pending requests
+        if self.lsp_proc.returncode is None:
+            kill_proc_tree(self.lsp_proc.pid)
+            self.lsp_proc.wait()
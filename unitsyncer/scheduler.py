@@ -0,0 +1,115 @@
+"""size-aware scheduling of focal files over worker processes
+
+Focal files are turned into WorkUnits with an estimated cost, files costing more
+than a fair share of a worker are split into one unit per workdir, and units are
+dispatched longest-first so that big repos do not start last.
+
+The cost is estimated from the size of the focal files, collected in one
+scandir pass. Only the files above a fair share are loaded to be split, reading
+every focal file and walking every repo in the parent would stall the start of
+the run for minutes.
+"""
+import dataclasses
+import os
+import time
+from typing import Callable, Optional, TypeVar
+import jsonlines
+
+T = TypeVar("T")
+
+# estimated seconds per focal object and per language server start; tune them
+# with the log written by CostLog
+COST_PER_FOCAL = 0.05
+COST_PER_WORKDIR = 5.0
+# average size of a line of a focal file
+BYTES_PER_FOCAL = 200
+
+
+@dataclasses.dataclass
+class WorkUnit:
+    focal_file: str
+    workdirs: Optional[list[str]]  # None for every workdir of the focal file
+    n_focal: int
+    n_workdirs: int
+
+    @property
+    def cost(self) -> float:
+        return COST_PER_FOCAL * self.n_focal + COST_PER_WORKDIR * self.n_workdirs
+
+
+def scan_focal_files(focal_dir: str) -> dict[str, int]:
+    """sizes in bytes of the focal jsonl files under focal_dir"""
+    sizes = {}
+    with os.scandir(focal_dir) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                sizes.update(scan_focal_files(entry.path))
+            elif entry.name.endswith(".jsonl"):
+                sizes[entry.path] = entry.stat().st_size
+    return sizes
+
+
+def plan(
+    focal_sizes: dict[str, int],
+    load_workdirs: Callable[[str], dict[str, list[dict]]],
+    n_workers: int,
+) -> list[WorkUnit]:
+    """estimate the cost of focal files and split the big ones by workdir
+
+    Args:
+        focal_sizes (dict[str, int]): sizes in bytes of the focal jsonl files
+        load_workdirs (Callable[[str], dict[str, list[dict]]]): focal objects of
+            a focal file grouped by workdir, only called on the files above a
+            fair share
+        n_workers (int): number of worker processes
+
+    Returns:
+        list[WorkUnit]: units sorted by decreasing cost
+    """
+    estimates = [
+        WorkUnit(focal_file, None, max(size // BYTES_PER_FOCAL, 1), 1)
+        for focal_file, size in focal_sizes.items()
+    ]
+    fair_share = sum(u.cost for u in estimates) / max(n_workers, 1)
+
+    planned = []
+    for estimate in estimates:
+        if n_workers <= 1 or estimate.cost <= fair_share:
+            planned.append(estimate)
+            continue
+        wd = load_workdirs(estimate.focal_file)
+        units = [
+            WorkUnit(estimate.focal_file, [workdir], len(objs), 1)
+            for workdir, objs in wd.items()
+        ]
+        if len(units) > 1:
+            planned.extend(units)
+        else:
+            planned.append(estimate)
+    return sorted(planned, key=lambda u: u.cost, reverse=True)
+
+
+def run_timed(
+    func: Callable[[WorkUnit], T], unit: WorkUnit
+) -> tuple[WorkUnit, T, float]:
+    """run func on a unit and measure its wall time in seconds"""
+    start = time.perf_counter()
+    result = func(unit)
+    return unit, result, time.perf_counter() - start
+
+
+class CostLog:
+    """jsonl log of predicted vs actual cost of each unit"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def record(self, unit: WorkUnit, actual: float):
+        with jsonlines.open(self.path, "a") as f:
+            f.write(
+                {
+                    **dataclasses.asdict(unit),
+                    "predicted": round(unit.cost, 3),
+                    "actual": round(actual, 3),
+                }
+            )
@@ -0,0 +1,161 @@
+"""per-repo on-disk state of language servers, kept between runs
+
+Every server keeps its caches under `SERVER_CACHE/<language>/<repo>`, so a
+rerun of a repo starts from the index written by the previous run:
+- clangd: XDG_CACHE_HOME for its module caches, its background index is
+  written next to compile_commands.json, which compile_db keeps in
+  `<repo>/compile-db`
+- gopls: GOPLSCACHE, its file cache of type-checked packages
+- pylsp: XDG_CACHE_HOME for the jedi cache
+
+A pooled server keeps the directory of the repo it was started for, the
+caches of gopls and jedi are content-addressed so other repos can share it.
+
+python3 -m unitsyncer.server_cache --max_gb=20
+"""
+import hashlib
+import logging
+import os
+import shutil
+from typing import Optional
+import fire
+from pylspclient.lsp_structs import LANGUAGE_IDENTIFIER
+from unitsyncer.common import UNITSYNCER_CACHE
+from unitsyncer.util import dir_size
+
+# root of the server caches, None to start servers in throwaway state
+SERVER_CACHE: Optional[str] = os.path.abspath(
+    os.getenv("UNITSYNCER_SERVER_CACHE", os.path.join(UNITSYNCER_CACHE, "servers"))
+)
+
+# repos are the directories right under it, see repo_cache_dir
+REPOS_ROOT: str = os.path.abspath("data/repos")
+
+
+def configure(root: Optional[str], repos_root: Optional[str] = None):
+    """set the root of the server caches, and of the repos if given, before the
+    workers are forked"""
+    global SERVER_CACHE, REPOS_ROOT  # pylint: disable=global-statement
+    SERVER_CACHE = None if root is None else os.path.abspath(root)
+    if repos_root is not None:
+        REPOS_ROOT = os.path.abspath(repos_root)
+
+
+def repo_of(workspace_dir: str, repos_root: str) -> Optional[str]:
+    """directory of the repo a workspace belongs to, the first directory under
+    repos_root on its path, None if the workspace is not under repos_root"""
+    rel = os.path.relpath(workspace_dir, repos_root)
+    if rel == os.curdir or rel == os.pardir or rel.startswith(os.pardir + os.sep):
+        return None
+    return os.path.join(repos_root, rel.split(os.sep)[0])
+
+
+def repo_cache_dir(
+    workspace_dir: str, language: str, repos_root: Optional[str] = None
+) -> Optional[str]:
+    """cache directory of the repo a workspace belongs to, created on use
+
+    Workdirs of one repo, e.g. Java modules at any depth, share the directory
+    of the repo.
+
+    Args:
+        workspace_dir (str): <repos_root>/<repo>[/<workdir>...]
+        language (str): LANGUAGE_IDENTIFIER of the server
+        repos_root (str | None): defaults to REPOS_ROOT
+
+    Returns:
+        Optional[str]: None if the server caches are disabled, or for a
+            workspace outside repos_root, e.g. a scratch directory, whose
+            cache would never be used again
+    """
+    if SERVER_CACHE is None:
+        return None
+    workspace_dir = os.path.abspath(workspace_dir)
+    repo_dir = repo_of(workspace_dir, os.path.abspath(repos_root or REPOS_ROOT))
+    if repo_dir is None:
+        return None
+    repo = os.path.basename(repo_dir)
+    # two repos roots can hold repos of the same name
+    digest = hashlib.sha1(repo_dir.encode()).hexdigest()[:8]
+    cache_dir = os.path.join(SERVER_CACHE, language, f"{repo}-{digest}")
+    os.makedirs(cache_dir, exist_ok=True)
+    # mtime of the directory is the last use, pruning removes the oldest first
+    os.utime(cache_dir)
+    return cache_dir
+
+
+def get_lsp_args(language: str, cache_dir: Optional[str]) -> list[str]:
+    """extra command line arguments of a server using cache_dir"""
+    match language:
+        case LANGUAGE_IDENTIFIER.CPP if cache_dir:
+            # the index goes next to the database compile_db keeps in cache_dir,
+            # a C workspace would get it next to its own compile_commands.json
+            return ["--background-index"]
+        case _:
+            return []
+
+
+def get_lsp_env(language: str, cache_dir: Optional[str]) -> Optional[dict[str, str]]:
+    """environment of a server using cache_dir, None to inherit ours"""
+    if cache_dir is None:
+        return None
+    env = dict(os.environ)
+    match language:
+        case LANGUAGE_IDENTIFIER.GO:
+            env["GOPLSCACHE"] = os.path.join(cache_dir, "gopls")
+    env["XDG_CACHE_HOME"] = os.path.join(cache_dir, "xdg")
+    return env
+
+
+def cache_usage(root: Optional[str] = None) -> dict[str, int]:
+    """size in bytes of each repo cache directory under root"""
+    root = root or SERVER_CACHE
+    usage: dict[str, int] = {}
+    if root is None or not os.path.isdir(root):
+        return usage
+    for language in os.listdir(root):
+        language_dir = os.path.join(root, language)
+        if not os.path.isdir(language_dir):
+            continue
+        for repo in os.listdir(language_dir):
+            repo_dir = os.path.join(language_dir, repo)
+            if os.path.isdir(repo_dir):
+                usage[repo_dir] = dir_size(repo_dir)
+    return usage
+
+
+def prune(max_bytes: int, root: Optional[str] = None) -> list[str]:
+    """remove the least recently used repo caches until root fits in max_bytes
+
+    Returns:
+        list[str]: removed directories
+    """
+    usage = cache_usage(root)
+    total = sum(usage.values())
+    removed = []
+    for repo_dir in sorted(usage, key=lambda d: os.stat(d).st_mtime):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(repo_dir, ignore_errors=True)
+        total -= usage[repo_dir]
+        removed.append(repo_dir)
+    if removed:
+        logging.info(
+            f"removed {len(removed)} server caches, {total / 2**30:.2f} GiB left"
+        )
+    return removed
+
+
+def main(max_gb: Optional[float] = None, root: Optional[str] = None):
+    """print the size of every repo cache, prune to max_gb if given"""
+    root = root or SERVER_CACHE
+    if max_gb is not None:
+        prune(int(max_gb * 2**30), root)
+    usage = cache_usage(root)
+    for repo_dir, size in sorted(usage.items(), key=lambda x: -x[1]):
+        print(f"{size / 2**20:10.1f} MiB  {repo_dir}")
+    print(f"{sum(usage.values()) / 2**30:10.2f} GiB  total")
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
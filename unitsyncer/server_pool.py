@@ -0,0 +1,118 @@
+"""per-worker pool of long-lived synchronizers reused across repos"""
+import atexit
+import logging
+from collections import Counter
+from typing import Optional
+from pylspclient.lsp_structs import LANGUAGE_IDENTIFIER
+from unitsyncer.sync import Synchronizer, LSPSynchronizer
+from unitsyncer.rust_syncer import RustSynchronizer
+from unitsyncer.sansio_lsp_syncer import SansioLSPSynchronizer
+from unitsyncer.static_python_syncer import StaticPythonSynchronizer
+from unitsyncer.util import proc_tree_rss
+
+
+def new_synchronizer(
+    workdir: str, language: str, max_inflight: int = 8
+) -> Synchronizer:
+    """construct the synchronizer backend used for the given language
+
+    Args:
+        max_inflight (int): number of definition requests kept in flight per server
+    """
+    match language:
+        case LANGUAGE_IDENTIFIER.RUST:
+            return RustSynchronizer(workdir, language)
+        case LANGUAGE_IDENTIFIER.PYTHON:
+            return StaticPythonSynchronizer(workdir, language, max_inflight)
+        case LANGUAGE_IDENTIFIER.GO:
+            return SansioLSPSynchronizer(workdir, language, max_inflight)
+        case _:
+            return LSPSynchronizer(workdir, language, max_inflight)
+
+
+class SynchronizerPool:
+    """keeps one initialized synchronizer per language and moves it between repos
+
+    a server is switched to the next workspace when it supports it, and is
+    recycled (stopped and cold started again) after serving `max_repos` repos
+    or when its process tree grows beyond `max_rss_mb`.
+    """
+
+    def __init__(
+        self,
+        max_repos: int = 20,
+        max_rss_mb: int = 4096,
+        init_timeout: int = 60,
+        max_inflight: int = 8,
+    ) -> None:
+        self.max_repos = max_repos
+        self.max_rss_mb = max_rss_mb
+        self.init_timeout = init_timeout
+        self.max_inflight = max_inflight
+        self.syncers: dict[str, Synchronizer] = {}
+        self.n_repos: dict[str, int] = {}
+        self.stats: Counter[str] = Counter()
+
+    def acquire(self, workdir: str, language: str) -> Synchronizer:
+        """get an initialized synchronizer for workdir, starting a server if needed"""
+        syncer = self.syncers.get(language)
+        if syncer is not None:
+            if self._should_recycle(language, syncer):
+                self.stats["recycled"] += 1
+                self.discard(language)
+            elif syncer.switch_workspace(workdir):
+                self.n_repos[language] += 1
+                self.stats["cold_starts_avoided"] += 1
+                return syncer
+            else:
+                self.discard(language)
+
+        syncer = new_synchronizer(workdir, language, self.max_inflight)
+        self.syncers[language] = syncer
+        self.n_repos[language] = 1
+        self.stats["cold_starts"] += 1
+        syncer.initialize(timeout=self.init_timeout)
+        return syncer
+
+    def _should_recycle(self, language: str, syncer: Synchronizer) -> bool:
+        if self.n_repos[language] >= self.max_repos:
+            return True
+        pid = syncer.server_pid
+        if pid is None:
+            return False
+        rss_mb = proc_tree_rss(pid) / 2**20
+        if rss_mb > self.max_rss_mb:
+            logging.debug(f"recycling {language} server using {rss_mb:.0f}MB")
+            return True
+        return False
+
+    def discard(self, language: str):
+        """stop and forget the synchronizer of language, e.g. after it failed"""
+        syncer = self.syncers.pop(language, None)
+        self.n_repos.pop(language, None)
+        if syncer is None:
+            return
+        try:
+            syncer.stop()
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logging.debug(e)
+
+    def close(self):
+        for language in list(self.syncers.keys()):
+            self.discard(language)
+
+
+_WORKER_POOL: Optional[SynchronizerPool] = None
+
+
+def worker_pool(**kwargs) -> SynchronizerPool:
+    """the pool of the current worker process, created on first use
+
+    Args:
+        **kwargs: arguments to SynchronizerPool, only used on creation
+    """
+    global _WORKER_POOL  # pylint: disable=global-statement
+    if _WORKER_POOL is None:
+        _WORKER_POOL = SynchronizerPool(**kwargs)
+        atexit.register(_WORKER_POOL.close)
+    return _WORKER_POOL
@@ -3,22 +3,18 @@ import ast
 from typing import Optional, TypeAlias
 from pylspclient.lsp_structs import LANGUAGE_IDENTIFIER, Location as PyLSPLoc
 from sansio_lsp_client import Location as SansioLoc
-from unitsyncer.util import replace_tabs, uri2path, get_cpp_func_name
+from unitsyncer.util import uri2path, get_cpp_func_name
+from unitsyncer.parse_cache import ParsedFile, parse_file
+from unitsyncer import metrics
 from returns.maybe import Maybe, Nothing, Some
 from frontend.parser.ast_util import ASTUtil
-from frontend.parser import (
-    GO_LANGUAGE,
-    JAVA_LANGUAGE,
-    JAVASCRIPT_LANGUAGE,
-    RUST_LANGUAGE,
-    CPP_LANGUAGE,
-)
 from tree_sitter import Node
 from frontend.parser.ast_util import remove_leading_spaces
 
 Location: TypeAlias = PyLSPLoc | SansioLoc
 
 
+@metrics.timed("get_function_code")
 def get_function_code(
     func_location: Location, lang: str
 ) -> Maybe[tuple[str, str | None, str | None]]:
@@ -35,22 +31,20 @@ def get_function_code(
     col_offset = func_location.range.start.character  # pylint: disable=unused-variable
 
     def _get_function_code(file_path) -> Maybe[tuple[str, str | None, str | None]]:
-        try:
-            with open(file_path, "r", errors="replace") as file:
-                code = file.read()
-        except FileNotFoundError:
-            return Nothing
+        return parse_file(file_path, lang).bind(_get_def_code)
 
+    def _get_def_code(parsed: ParsedFile) -> Maybe[tuple[str, str | None, str | None]]:
+        file_path = parsed.path
+        if parsed.py_tree is not None:
+            return py_get_def(parsed.py_tree, lineno).map(
+                lambda node: (ast.unparse(node), ast.get_docstring(node), None)
+            )
+
+        ast_util = parsed.ast_util
+        assert ast_util is not None
         match lang:
-            case LANGUAGE_IDENTIFIER.PYTHON:
-                node = ast.parse(code, filename=file_path)
-                return py_get_def(node, lineno).map(
-                    lambda node: (ast.unparse(node), ast.get_docstring(node), None)
-                )
             case LANGUAGE_IDENTIFIER.JAVA:
-                ast_util = ASTUtil(replace_tabs(code))
-                tree = ast_util.tree(JAVA_LANGUAGE)
-                return java_get_def(tree.root_node, lineno, ast_util).map(
+                return java_get_def(parsed, lineno).map(
                     lambda node: (
                         ast_util.get_source_from_node(node),
                         None,
@@ -58,10 +52,7 @@ def get_function_code(
                     )
                 )
             case LANGUAGE_IDENTIFIER.JAVASCRIPT:
-                ast_util = ASTUtil(replace_tabs(code))
-                tree = ast_util.tree(JAVASCRIPT_LANGUAGE)
-
-                return js_get_def(tree.root_node, lineno, ast_util).map(
+                return js_get_def(parsed, lineno).map(
                     lambda node: (
                         ast_util.get_source_from_node(node),
                         None,
@@ -70,10 +61,7 @@ def get_function_code(
                     )
                 )
             case LANGUAGE_IDENTIFIER.RUST:
-                ast_util = ASTUtil(replace_tabs(code))
-                tree = ast_util.tree(RUST_LANGUAGE)
-
-                return rust_get_def(tree.root_node, lineno, ast_util).map(
+                return rust_get_def(parsed, lineno).map(
                     lambda node: (
                         ast_util.get_source_from_node(node),
                         None,
@@ -81,10 +69,7 @@ def get_function_code(
                     )
                 )
             case LANGUAGE_IDENTIFIER.GO:
-                ast_util = ASTUtil(replace_tabs(code))
-                tree = ast_util.tree(GO_LANGUAGE)
-
-                return go_get_def(tree.root_node, lineno, ast_util).map(
+                return go_get_def(parsed, lineno).map(
                     lambda node: (
                         ast_util.get_source_from_node(node),
                         None,
@@ -92,10 +77,7 @@ def get_function_code(
                     )
                 )
             case LANGUAGE_IDENTIFIER.C | LANGUAGE_IDENTIFIER.CPP:
-                ast_util = ASTUtil(replace_tabs(code))
-                tree = ast_util.tree(CPP_LANGUAGE)
-
-                return cpp_get_def(tree.root_node, lineno, ast_util).map(
+                return cpp_get_def(parsed, lineno).map(
                     lambda node: (
                         ast_util.get_source_from_node(node),
                         None,
@@ -109,10 +91,12 @@ def get_function_code(
     return uri2path(func_location.uri).bind(_get_function_code)
 
 
-def py_get_def(node: ast.AST, lineno: int) -> Maybe[ast.FunctionDef]:
+def py_get_def(
+    node: ast.AST, lineno: int
+) -> Maybe[ast.FunctionDef | ast.AsyncFunctionDef]:
     for child in ast.iter_child_nodes(node):
         if (
-            isinstance(child, ast.FunctionDef)
+            isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef))
             # AST is 1-indexed, LSP is 0-indexed
             and child.lineno == lineno + 1
             # AST count from def, LSP count from function name
@@ -126,59 +110,38 @@ def py_get_def(node: ast.AST, lineno: int) -> Maybe[ast.FunctionDef]:
     return Nothing
 
 
-def java_get_def(node: Node, lineno: int, ast_util: ASTUtil) -> Maybe[Node]:
-    def in_modifier_range(method_node: Node, lineno: int) -> bool:
+def java_get_def(parsed: ParsedFile, lineno: int) -> Maybe[Node]:
+    ast_util = parsed.ast_util
+    assert ast_util is not None
+
+    def modifier_reach(method_node: Node) -> int:
+        # a method is also found from the lines of its annotations/modifiers
         n_modifier = ast_util.get_method_modifiers(method_node).map(len).value_or(0)
-        defn_lineno: int = method_node.start_point[0]
-        return defn_lineno + n_modifier >= lineno
-
-    for defn in ast_util.get_all_nodes_of_type(node, "method_declaration"):
-        # tree-sitter AST is 0-indexed
-        defn_lineno = defn.start_point[0]
-        if defn_lineno == lineno or in_modifier_range(defn, lineno):
-            return Some(defn)
-    return Nothing
+        return method_node.start_point[0] + n_modifier
 
+    # tree-sitter AST is 0-indexed
+    return parsed.def_index("method_declaration", modifier_reach).first_reaching(lineno)
 
-def js_get_def(node: Node, lineno: int, ast_util: ASTUtil) -> Maybe[Node]:
-    for defn in ast_util.get_all_nodes_of_type(node, None):
-        # tree-sitter AST is 0-indexed
-        defn_lineno = defn.start_point[0]
-        if defn_lineno == lineno:
-            return Some(defn)
-    return Nothing
 
+def js_get_def(parsed: ParsedFile, lineno: int) -> Maybe[Node]:
+    # tree-sitter AST is 0-indexed
+    return parsed.def_index(None).at_line(lineno)
 
-def rust_get_def(node: Node, lineno: int, ast_util: ASTUtil) -> Maybe[Node]:
-    for defn in ast_util.get_all_nodes_of_type(node, "function_item"):
-        # tree-sitter AST is 0-indexed
-        defn_lineno = defn.start_point[0]
-        if defn_lineno == lineno:
-            return Some(defn)
-    return Nothing
+
+def rust_get_def(parsed: ParsedFile, lineno: int) -> Maybe[Node]:
+    # tree-sitter AST is 0-indexed
+    return parsed.def_index("function_item").at_line(lineno)
 
 
-def go_get_def(node: Node, lineno: int, ast_util: ASTUtil) -> Maybe[Node]:
-    def find_in(node_type: str):
-        for defn in ast_util.get_all_nodes_of_type(node, node_type):
-            # tree-sitter AST is 0-indexed
-            defn_lineno = defn.start_point[0]
-            if defn_lineno == lineno:
-                return defn
-        return None
-
-    # NOTE: in python
-    # None or some_value === some_value
-    # None or None === None
-    return Maybe.from_optional(
-        find_in("method_declaration") or find_in("function_declaration")
+def go_get_def(parsed: ParsedFile, lineno: int) -> Maybe[Node]:
+    # tree-sitter AST is 0-indexed
+    return (
+        parsed.def_index("method_declaration")
+        .at_line(lineno)
+        .lash(lambda _: parsed.def_index("function_declaration").at_line(lineno))
     )
 
 
-def cpp_get_def(node: Node, lineno: int, ast_util: ASTUtil) -> Maybe[Node]:
-    for defn in ast_util.get_all_nodes_of_type(node, "function_definition"):
-        # tree-sitter AST is 0-indexed
-        defn_lineno = defn.start_point[0]
-        if defn_lineno == lineno:
-            return Some(defn)
-    return Nothing
+def cpp_get_def(parsed: ParsedFile, lineno: int) -> Maybe[Node]:
+    # tree-sitter AST is 0-indexed
+    return parsed.def_index("function_definition").at_line(lineno)
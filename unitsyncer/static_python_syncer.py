@@ -0,0 +1,310 @@
+"""Synchronizer for Python that resolves focal calls from a repo-wide symbol table"""
+import ast
+import os
+import re
+import logging
+from collections import Counter
+from typing import Optional
+from pylspclient.lsp_structs import LANGUAGE_IDENTIFIER, Location, Position, Range
+from returns.result import Failure, Result
+from unitsyncer.parse_cache import ParsedFile
+from unitsyncer.sync import (
+    FocalCall,
+    LSPSynchronizer,
+    SourceResult,
+    Synchronizer,
+    source_of_definition,
+)
+from unitsyncer.util import path2uri
+
+# directories that never hold the code under test
+PRUNE_DIRS = {".git", ".tox", ".nox", "__pycache__", "node_modules", "venv", ".venv"}
+
+# bound on the number of import aliases followed to resolve one name
+MAX_ALIAS_DEPTH = 16
+
+# (file_path, line, col) of the name of a function definition, 0-indexed
+PyDefinition = tuple[str, int, int]
+
+
+def module_names(rel_path: str, is_package_dir) -> list[str]:
+    """dotted names a python file is importable under
+
+    `src/pkg/mod.py` is `src.pkg.mod`, and also `pkg.mod` if `src` is a source
+    root, i.e. it is not a package itself.
+
+    Args:
+        rel_path (str): path of the file relative to the workspace
+        is_package_dir (Callable[[str], bool]): whether a relative dir has an __init__.py
+    """
+    parts = rel_path.removesuffix(".py").split("/")
+    if parts[-1] == "__init__":
+        parts = parts[:-1]
+    names = [".".join(parts)]
+    # drop leading source roots such as src/ or lib/
+    i = 0
+    while i < len(parts) - 1 and not is_package_dir("/".join(parts[: i + 1])):
+        i += 1
+        names.append(".".join(parts[i:]))
+    return [name for name in names if name]
+
+
+class SymbolTable:
+    """functions, methods and import aliases of all modules of a workspace
+
+    Names are fully qualified, e.g. `pkg.mod.Class.method`. A name defined in
+    several files under the same module name is ambiguous and never resolved.
+    """
+
+    def __init__(self) -> None:
+        self.definitions: dict[str, Optional[PyDefinition]] = {}
+        # name bound by an import -> the name it refers to
+        self.aliases: dict[str, str] = {}
+        # path relative to the workspace -> module names
+        self.modules: dict[str, list[str]] = {}
+
+    def add_module(self, rel_path: str, names: list[str], parsed: ParsedFile):
+        self.modules[rel_path] = names
+        assert parsed.py_tree is not None
+        lines = parsed.code.splitlines()
+        is_package = rel_path.endswith("__init__.py")
+
+        for module in names:
+            package = module if is_package else module.rpartition(".")[0]
+            for node in parsed.py_tree.body:
+                self._add_node(module, package, node, parsed.path, lines)
+
+    def _add_node(
+        self, scope: str, package: str, node: ast.stmt, path: str, lines: list[str]
+    ):
+        match node:
+            case ast.FunctionDef(name=name) | ast.AsyncFunctionDef(name=name):
+                # LSP points at the name, not at `def`
+                col = lines[node.lineno - 1].find(name, node.col_offset)
+                self._define(f"{scope}.{name}", (path, node.lineno - 1, col))
+            case ast.ClassDef(name=name, body=body):
+                for child in body:
+                    self._add_node(f"{scope}.{name}", package, child, path, lines)
+            case ast.Import(names=names):
+                for alias in names:
+                    if alias.asname is not None:
+                        self.aliases[f"{scope}.{alias.asname}"] = alias.name
+                    else:
+                        top = alias.name.split(".")[0]
+                        self.aliases[f"{scope}.{top}"] = top
+            case ast.ImportFrom(module=module, names=names, level=level):
+                base = module or ""
+                if level > 0:
+                    parents = package.split(".") if package else []
+                    parents = parents[: len(parents) - (level - 1)]
+                    base = ".".join(parents + ([module] if module else []))
+                for alias in names:
+                    if alias.name != "*":
+                        target = f"{base}.{alias.name}" if base else alias.name
+                        self.aliases[f"{scope}.{alias.asname or alias.name}"] = target
+
+    def _define(self, name: str, definition: PyDefinition):
+        if name in self.definitions and self.definitions[name] != definition:
+            self.definitions[name] = None
+        else:
+            self.definitions[name] = definition
+
+    def resolve(self, name: str) -> Optional[PyDefinition]:
+        """definition of a qualified name, following import aliases"""
+        for _ in range(MAX_ALIAS_DEPTH):
+            if name in self.definitions:
+                return self.definitions[name]
+            parts = name.split(".")
+            # longest prefix bound by an import, e.g. `m.f` with `import pkg.mod as m`
+            for i in range(len(parts), 0, -1):
+                prefix = ".".join(parts[:i])
+                if prefix in self.aliases and self.aliases[prefix] != prefix:
+                    name = ".".join([self.aliases[prefix]] + parts[i:])
+                    break
+            else:
+                return None
+        return None
+
+
+def called_name(line: str, col: int) -> Optional[str]:
+    """dotted name of the call whose last attribute starts at col,
+    e.g. `mod.func` in `x = mod.func(1)`, None for an attribute of an
+    expression such as `make().func(1)`"""
+    for match in re.finditer(r"[A-Za-z_][\w.]*", line):
+        if match.start() <= col < match.end():
+            if line[: match.start()].endswith("."):
+                return None
+            return match.group().strip(".")
+    return None
+
+
+class StaticPythonSynchronizer(Synchronizer):
+    """resolve Python focal calls with a SymbolTable built from `ast`
+
+    A focal call is resolved from its focal_id, either
+    `owner-repo/owner-repo-sha/path/mod.py::Class::func` or `pkg.mod.Class.func`,
+    then from the dotted name called in the test file. Calls that cannot be
+    resolved, e.g. methods of local variables, are sent to an LSPSynchronizer
+    that is only started on the first miss.
+    """
+
+    def __init__(
+        self, workspace_dir: str, language="python", max_inflight: int = 8
+    ) -> None:
+        super().__init__(workspace_dir, LANGUAGE_IDENTIFIER.PYTHON)
+        self.max_inflight = max_inflight
+        self.timeout = 10
+        self.table = SymbolTable()
+        self.fallback: Optional[LSPSynchronizer] = None
+        self.stats: Counter[str] = Counter()
+
+    def initialize(self, timeout: int = 10):
+        self.timeout = timeout
+        self.table = SymbolTable()
+        for root, dirs, files in os.walk(self.workspace_dir):
+            dirs[:] = [d for d in dirs if d not in PRUNE_DIRS]
+            for file in files:
+                if not file.endswith(".py"):
+                    continue
+                file_path = os.path.join(root, file)
+                rel_path = os.path.relpath(file_path, self.workspace_dir)
+                try:
+                    with open(file_path, "r", errors="replace") as f:
+                        code = f.read()
+                    # not through PARSE_CACHE, the table keeps no tree
+                    parsed = ParsedFile(file_path, code, self.langID)
+                except (OSError, SyntaxError, ValueError):
+                    # e.g. python 2 files, never the definition of a focal call
+                    continue
+                names = module_names(rel_path, self._is_package_dir)
+                self.table.add_module(rel_path, names, parsed)
+
+    def _is_package_dir(self, rel_dir: str) -> bool:
+        return os.path.isfile(os.path.join(self.workspace_dir, rel_dir, "__init__.py"))
+
+    def switch_workspace(self, workspace_dir: str) -> bool:
+        self.report()
+        self.workspace_dir = os.path.abspath(workspace_dir)
+        if self.fallback is not None and not self.fallback.switch_workspace(
+            self.workspace_dir
+        ):
+            self.fallback.stop()
+            self.fallback = None
+        self.initialize(self.timeout)
+        return True
+
+    @property
+    def server_pid(self) -> Optional[int]:
+        return None if self.fallback is None else self.fallback.server_pid
+
+    def resolve(
+        self, focal_name: str, file_path: str, line: int, col: int
+    ) -> Optional[PyDefinition]:
+        """definition of a focal call from the symbol table, None on a miss"""
+        match focal_name.split("::"):
+            case [path, *qualname] if qualname:
+                # focal paths are relative to the root of all repos
+                rel_path = os.path.relpath(
+                    os.path.join(self.workspace_dir, "..", "..", path),
+                    self.workspace_dir,
+                )
+                if rel_path in self.table.modules:
+                    module = self.table.modules[rel_path][0]
+                    focal_name = ".".join([module] + qualname)
+
+        if (definition := self.table.resolve(focal_name)) is not None:
+            return definition
+
+        # the name called in the test, looked up in the scope of the test module
+        test_modules = self.table.modules.get(
+            os.path.relpath(file_path, self.workspace_dir)
+        )
+        if not test_modules:
+            return None
+        try:
+            with open(file_path, errors="replace") as f:
+                call = called_name(f.read().splitlines()[line], col)
+        except (OSError, IndexError):
+            return None
+        if call is None:
+            return None
+        return self.table.resolve(f"{test_modules[0]}.{call}")
+
+    def get_source_of_call(
+        self,
+        focal_name: str,
+        file_path: str,
+        line: int,
+        col: int,
+        verbose: bool = False,
+    ) -> Result[tuple[str, str | None, str | None], str]:
+        return self.get_sources_of_calls(
+            [(focal_name, file_path, line, col)], verbose=verbose
+        )[0]
+
+    def get_sources_of_calls(
+        self, calls: list[FocalCall], verbose: bool = False
+    ) -> list[SourceResult]:
+        """resolve calls from the symbol table, and the misses with one batch
+        to the fallback language server"""
+        results: list[Optional[SourceResult]] = []
+        misses: list[int] = []
+        for i, call in enumerate(calls):
+            match self.resolve(*call):
+                case (path, def_line, def_col):
+                    self.stats["hits"] += 1
+                    loc = Location(
+                        path2uri(path),
+                        Range(Position(def_line, def_col), Position(def_line, def_col)),
+                    )
+                    results.append(
+                        source_of_definition(loc, self.workspace_dir, self.langID)
+                    )
+                case _:
+                    self.stats["misses"] += 1
+                    results.append(None)
+                    misses.append(i)
+
+        if misses:
+            try:
+                sources = self._fallback().get_sources_of_calls(
+                    [calls[i] for i in misses], verbose=verbose
+                )
+            except Exception as e:  # pylint: disable=broad-exception-caught
+                # keep the static results if the language server cannot start
+                sources = [Failure(str(e))] * len(misses)
+            for i, source in zip(misses, sources):
+                results[i] = source
+        return [r for r in results if r is not None]
+
+    def _fallback(self) -> LSPSynchronizer:
+        if self.fallback is None:
+            self.fallback = LSPSynchronizer(
+                self.workspace_dir, self.langID, self.max_inflight
+            )
+            self.fallback.initialize(self.timeout)
+        return self.fallback
+
+    def report(self):
+        """log the share of focal calls resolved without the language server"""
+        total = self.stats["hits"] + self.stats["misses"]
+        if total > 0:
+            logging.info(
+                f"{self.workspace_dir}: {self.stats['hits']}/{total} "
+                f"({self.stats['hits'] / total:.0%}) focal calls resolved statically"
+            )
+        self.stats.clear()
+
+    def release(self, file_paths: list[str]):
+        if self.fallback is not None:
+            self.fallback.release(file_paths)
+
+    def stop(self):
+        self.report()
+        if self.fallback is not None:
+            self.fallback.stop()
+            self.fallback = None
+
+    def kill(self):
+        if self.fallback is not None:
+            self.fallback.kill()
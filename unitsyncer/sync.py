@@ -11,23 +11,39 @@ from pylspclient.lsp_structs import (
     TextDocumentIdentifier,
     LANGUAGE_IDENTIFIER,
 )
-from unitsyncer.util import path2uri, replace_tabs, uri2path, ReadPipe
+from unitsyncer.util import path2uri, uri2path, ReadPipe, kill_proc_tree
+from unitsyncer.documents import OpenDocuments
+from unitsyncer.notifications import NotificationRouter
+from unitsyncer.readiness import IndexingTracker
+from unitsyncer import (
+    metrics,
+    definition_cache,
+    server_cache,
+    compile_db,
+    health,
+    profiles,
+)
 from unitsyncer.source_code import get_function_code
 from unitsyncer.common import (
-    CAPABILITIES,
     UNITSYNCER_HOME,
     RUST_CAPABILITIES,
     RUST_INIT_OPTIONS,
 )
-from typing import Optional, Union
+from typing import Any, Callable, Optional, TypeAlias, TypeVar, Union
+from collections import deque
+import threading
 from returns.maybe import Maybe, Nothing, Some
 from returns.result import Result, Success, Failure
 from returns.converters import maybe_to_result
 import logging
 from unitsyncer.util import silence
 import json
+import time
 from os.path import realpath
 
+# seconds a server gets to answer shutdown before it is killed
+STOP_TIMEOUT = 5
+
 
 def get_lsp_cmd(language: str) -> Optional[list[str]]:
     match language:
@@ -50,6 +66,236 @@ def get_lsp_cmd(language: str) -> Optional[list[str]]:
             return None
 
 
+# servers that resolve files against the folders announced by
+# workspace/didChangeWorkspaceFolders, so one process can serve several repos
+# java-language-server only indexes the rootUri given at initialize, and clangd
+# for C++ only reads the --compile-commands-dir given at start
+WORKSPACE_SWITCH_LANGS = (
+    LANGUAGE_IDENTIFIER.PYTHON,
+    LANGUAGE_IDENTIFIER.C,
+    LANGUAGE_IDENTIFIER.JAVASCRIPT,
+    LANGUAGE_IDENTIFIER.GO,
+)
+
+
+# (focal_name, file_path, line, col) as taken by Synchronizer.get_source_of_call
+FocalCall: TypeAlias = tuple[str, str, int, int]
+SourceResult: TypeAlias = Result[tuple[str, str | None, str | None], str]
+
+T = TypeVar("T")
+R = TypeVar("R")
+K = TypeVar("K")
+
+
+def pipeline(
+    items: list[T],
+    send: Callable[[T], Result[K, str]],
+    receive: Callable[[K], R],
+    on_error: Callable[[str], R],
+    window: int,
+) -> list[R]:
+    """send one request per item while keeping at most `window` of them in flight
+
+    Args:
+        items (list[T]): inputs of the requests
+        send (Callable[[T], Result[K, str]]): sends a request, returns a handle
+            such as its id
+        receive (Callable[[K], R]): waits for the response of a request handle
+        on_error (Callable[[str], R]): result of an item whose request failed to send
+        window (int): maximum number of outstanding requests
+
+    Returns:
+        list[R]: responses in the order of items
+    """
+    results: list[Optional[R]] = [None] * len(items)
+    in_flight: deque[tuple[int, K]] = deque()  # (item index, request handle)
+
+    def receive_oldest():
+        idx, rpc_id = in_flight.popleft()
+        results[idx] = receive(rpc_id)
+
+    for idx, item in enumerate(items):
+        if len(in_flight) >= max(window, 1):
+            receive_oldest()
+        match send(item):
+            case Success(rpc_id):
+                in_flight.append((idx, rpc_id))
+            case Failure(e):
+                results[idx] = on_error(e)
+    while in_flight:
+        receive_oldest()
+
+    return results  # type: ignore
+
+
+class PipelinedLspEndpoint(pylspclient.LspEndpoint):
+    """LspEndpoint that can have several requests in flight at once
+
+    pylspclient's call_method blocks until its response arrives; this splits it
+    into send_request and wait_for_response, responses are matched by id and
+    stamped with the time the reader thread received them.
+    """
+
+    def __init__(
+        self,
+        json_rpc_endpoint,
+        method_callbacks: Optional[dict[str, Callable]] = None,
+        notify_callbacks: Optional[dict[str, Callable]] = None,
+        timeout: int = 2,
+    ):
+        super().__init__(
+            json_rpc_endpoint,
+            method_callbacks={} if method_callbacks is None else method_callbacks,
+            notify_callbacks={} if notify_callbacks is None else notify_callbacks,
+            timeout=timeout,
+        )
+        self._id_lock = threading.Lock()
+
+    def send_request(self, method_name: str, **kwargs) -> int:
+        with self._id_lock:
+            rpc_id: int = self.next_id
+            self.next_id += 1
+            self.event_dict[rpc_id] = threading.Condition()
+        self.send_message(method_name, kwargs, rpc_id)
+        return rpc_id
+
+    def handle_result(self, rpc_id, result, error):
+        cond = self.event_dict.get(rpc_id)
+        if cond is None:  # response to a request that already timed out
+            return
+        with cond:
+            self.response_dict[rpc_id] = (result, error, time.perf_counter())
+            cond.notify()
+
+    def wait_for_reply(
+        self, rpc_id: int, timeout: Optional[float] = None
+    ) -> tuple[Any, Optional[dict], float]:
+        """wait for the response to a request without raising its error
+
+        Returns:
+            tuple[Any, dict | None, float]: result, error and the perf_counter
+                time the response was received
+        """
+        timeout = self._timeout if timeout is None else timeout
+        cond = self.event_dict[rpc_id]
+        with cond:
+            received = cond.wait_for(
+                lambda: rpc_id in self.response_dict or self.shutdown_flag,
+                timeout=timeout,
+            )
+        self.event_dict.pop(rpc_id, None)
+        if not received:
+            raise TimeoutError()
+        if rpc_id not in self.response_dict:
+            raise ConnectionError("language server stopped")
+
+        reply: tuple[Any, Optional[dict], float] = self.response_dict.pop(rpc_id)
+        return reply
+
+    def wait_for_response(self, rpc_id: int, timeout: Optional[float] = None):
+        result, error, _ = self.wait_for_reply(rpc_id, timeout)
+        if error:
+            raise response_error(error)
+        return result
+
+    def send_response(self, id, result, error):  # pylint: disable=redefined-builtin
+        # pylspclient leaves out a null result, which is not a valid response
+        message: dict = {"jsonrpc": "2.0", "id": id}
+        if error:
+            message["error"] = error
+        else:
+            message["result"] = result
+        self.json_rpc_endpoint.send_request(message)
+
+    def call_method(self, method_name, **kwargs):
+        return self.wait_for_response(self.send_request(method_name, **kwargs))
+
+    def abort(self):
+        """wake up every request waiting for a response, e.g. after a kill"""
+        self.shutdown_flag = True
+        for cond in list(self.event_dict.values()):
+            with cond:
+                cond.notify_all()
+
+
+def response_error(error: dict) -> pylspclient.lsp_structs.ResponseError:
+    return pylspclient.lsp_structs.ResponseError(
+        error.get("code"), error.get("message"), error.get("data")
+    )
+
+
+def parse_definition_response(response) -> list[Location]:
+    """convert the json result of textDocument/definition into Locations
+
+    LocationLinks are reduced to the Location of their target
+    """
+    match response:
+        case None:
+            return []
+        case {"uri": _}:
+            return [Location(**response)]
+        case list():
+            return [
+                (
+                    Location(**loc)
+                    if "uri" in loc
+                    else Location(loc["targetUri"], loc["targetSelectionRange"])
+                )
+                for loc in response
+            ]
+        case _:
+            raise ValueError(f"Unexpected response from LSP server: {response}")
+
+
+def prepare_workspace(workspace_dir: str, language: str) -> list[str]:
+    """set up what the language server needs before it is started
+
+    Returns:
+        list[str]: extra command line arguments of the server
+    """
+    if language == LANGUAGE_IDENTIFIER.CPP:
+        db_dir = compile_db.compile_db_dir(workspace_dir)
+        if db_dir is not None:
+            return [f"--compile-commands-dir={db_dir}"]
+    return []
+
+
+def source_of_definition(
+    def_location: Location, workspace_dir: str, language: str
+) -> SourceResult:
+    """extract the source code at a definition location returned by a server
+
+    Args:
+        def_location (Location): location of the definition
+        workspace_dir (str): definitions outside of it are rejected
+        language (str): language of the file as in LANGUAGE_IDENTIFIER
+    """
+    file_path = uri2path(def_location.uri).value_or(str(def_location.uri))
+    logging.debug(file_path)
+
+    # check if file path is relative to workspace root
+    if not (
+        file_path.startswith(workspace_dir)
+        or file_path.startswith(realpath(workspace_dir))
+    ):
+        return Failure(f"Source code not in workspace: {file_path}")
+
+    lineno = def_location.range.start.line
+    col_offset = def_location.range.start.character
+
+    def extract() -> SourceResult:
+        return (
+            maybe_to_result(get_function_code(def_location, language))
+            .alt(lambda _: f"Source code not found: {file_path}:{lineno}:{col_offset}")
+            .bind(lambda t: Failure("Empty Source Code") if t[0] == "" else Success(t))
+        )
+
+    store = definition_cache.cache()
+    if store is None:
+        return extract()
+    return store.definition(file_path, language, lineno, col_offset, extract)
+
+
 class Synchronizer:
     """interface definition for all Synchronizer"""
 
@@ -60,6 +306,22 @@ class Synchronizer:
     def initialize(self, timeout: int):
         raise NotImplementedError
 
+    def switch_workspace(self, workspace_dir: str) -> bool:
+        """point an initialized synchronizer at another workspace
+
+        Args:
+            workspace_dir (str): path to the new workspace
+
+        Returns:
+            bool: False if the synchronizer cannot switch and has to be restarted
+        """
+        return False
+
+    @property
+    def server_pid(self) -> Optional[int]:
+        """pid of the language server process, None if there is no server"""
+        return None
+
     def get_source_of_call(
         self,
         focal_name: str,
@@ -70,73 +332,162 @@ class Synchronizer:
     ) -> Result[tuple[str, str | None, str | None], str]:
         raise NotImplementedError
 
+    def get_sources_of_calls(
+        self, calls: list[FocalCall], verbose: bool = False
+    ) -> list[SourceResult]:
+        """batch version of get_source_of_call
+
+        Args:
+            calls (list[FocalCall]): [(focal_name, file_path, line, col), ...]
+
+        Returns:
+            list[SourceResult]: results in the order of calls
+        """
+        return [self.get_source_of_call(*call, verbose=verbose) for call in calls]
+
+    def release(self, file_paths: list[str]):
+        """close the documents of files no later lookup will come from
+
+        Args:
+            file_paths (list[str]): absolute paths to the files
+        """
+
     def stop(self):
         raise NotImplementedError
 
+    def kill(self):
+        """stop at once, e.g. when the server hangs; pending lookups fail"""
+        self.stop()
+
+    def recycle(self):
+        """kill the server, the lookups it loses are replayed on a new one"""
+        self.kill()
+
 
 class LSPSynchronizer(Synchronizer):
     """Synchronizer implementation based on pylspclient"""
 
-    def __init__(self, workspace_dir: str, language: str) -> None:
+    def __init__(
+        self, workspace_dir: str, language: str, max_inflight: int = 8
+    ) -> None:
         super().__init__(workspace_dir, language)
+        self.max_inflight = max_inflight
+        self.documents = OpenDocuments(self._did_open, self._did_close)
 
         self.root_uri = path2uri(self.workspace_dir)
         workspace_name = os.path.basename(self.workspace_dir)
         self.workspace_folders = [{"name": workspace_name, "uri": self.root_uri}]
         self.lsp_proc: subprocess.Popen
+        self.cache_dir: Optional[str] = None
+        self.lsp_endpoint: PipelinedLspEndpoint
         self.lsp_client: pylspclient.LspClient
+        self.stderr: Optional[ReadPipe] = None
+        self.notifications = NotificationRouter()
+        self.indexing = IndexingTracker(language)
+        self.notifications.on("$/progress", self.indexing.on_progress)
+        self.init_timeout = 10
+        self.stopped = False
+        self.monitor: Optional[health.HealthMonitor] = None
 
     @silence
-    def start_lsp_server(self, timeout: int = 10):
+    def start_lsp_server(self, timeout: int = 10, lsp_args: Optional[list[str]] = None):
         lsp_cmd = get_lsp_cmd(self.langID)
         if lsp_cmd is None:
             sys.stderr.write("Language {language} is not supported\n")
             exit(1)
 
+        self.cache_dir = server_cache.repo_cache_dir(self.workspace_dir, self.langID)
         self.lsp_proc = subprocess.Popen(
-            lsp_cmd,
+            lsp_cmd
+            + server_cache.get_lsp_args(self.langID, self.cache_dir)
+            + profiles.server_args(self.langID)
+            + (lsp_args or []),
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
+            env=server_cache.get_lsp_env(self.langID, self.cache_dir),
+            # own process group, so the server and its children are killed together
+            start_new_session=True,
         )
-        read_pipe = ReadPipe(self.lsp_proc.stderr)
-        read_pipe.start()
+        health.limit_memory(self.lsp_proc.pid, self.langID)
+        self.stderr = ReadPipe(self.lsp_proc.stderr)
+        self.stderr.start()
         json_rpc_endpoint = pylspclient.JsonRpcEndpoint(
             self.lsp_proc.stdin, self.lsp_proc.stdout
         )
-        lsp_endpoint = pylspclient.LspEndpoint(json_rpc_endpoint, timeout=timeout)
-        self.lsp_client = pylspclient.LspClient(lsp_endpoint)
+        self.lsp_endpoint = PipelinedLspEndpoint(
+            json_rpc_endpoint,
+            method_callbacks={
+                "workspace/configuration": self._configuration,
+                "window/workDoneProgress/create": lambda _: None,
+            },
+            notify_callbacks=self.notifications.callbacks(),
+            timeout=timeout,
+        )
+        self.lsp_client = pylspclient.LspClient(self.lsp_endpoint)
+
+    def _configuration(self, params: dict) -> list:
+        sections = [item.get("section") for item in params.get("items", [])]
+        return profiles.configuration(self.langID, sections)
 
     @silence
     def initialize(self, timeout: int = 10):
-        self.start_lsp_server(timeout)
+        self.init_timeout = timeout
+        self.indexing.reset()
+        self.start_lsp_server(
+            timeout, prepare_workspace(self.workspace_dir, self.langID)
+        )
         response = self.lsp_client.initialize(
             self.lsp_proc.pid,
             self.workspace_dir,
             self.root_uri,
-            None,
-            CAPABILITIES,
+            profiles.init_options(self.langID),
+            profiles.capabilities(),
             "off",
             self.workspace_folders,
         )
         logging.debug(json.dumps(response))
         self.lsp_client.initialized()
+        settings = profiles.settings(self.langID)
+        if settings is not None:
+            self.lsp_endpoint.send_notification(
+                "workspace/didChangeConfiguration", settings=settings
+            )
+        if self.monitor is None:
+            self.monitor = health.HealthMonitor(self).start()
+
+    def restart(self):
+        """start a new server for the workspace after the previous one died"""
+        if self.stderr is not None:
+            logging.debug(f"stderr of the {self.langID} server:\n{self.stderr.text()}")
+        health.release_cgroup(self.lsp_proc.pid)
+        self.documents.forget_all()
+        self.initialize(self.init_timeout)
+
+    def switch_workspace(self, workspace_dir: str) -> bool:
+        if self.langID not in WORKSPACE_SWITCH_LANGS:
+            return False
+
+        self.documents.close_all()
+        workspace_dir = os.path.abspath(workspace_dir)
+        root_uri = path2uri(workspace_dir)
+        workspace_folders = [{"name": os.path.basename(workspace_dir), "uri": root_uri}]
+        self.lsp_endpoint.send_notification(
+            "workspace/didChangeWorkspaceFolders",
+            event={"added": workspace_folders, "removed": self.workspace_folders},
+        )
+        self.workspace_dir = workspace_dir
+        self.root_uri = root_uri
+        self.workspace_folders = workspace_folders
+        return True
 
-        if self.langID == LANGUAGE_IDENTIFIER.CPP:
-            # https://gitlab.kitware.com/cmake/cmake/-/issues/16588
-            # produces compile_commands.json in workspace for clangd to run
-            compile_commands = os.path.join(self.workspace_dir, "compile_commands.json")
-            if not os.path.exists(compile_commands):
-                logging.debug(
-                    f"Calling cmake to produce compile_commands.json in {self.workspace_dir}"
-                )
-                subprocess.run(
-                    ["cmake", "-DCMAKE_EXPORT_COMPILE_COMMANDS=ON", "."],
-                    cwd=self.workspace_dir,
-                    stdout=subprocess.DEVNULL,
-                    stderr=subprocess.DEVNULL,
-                    check=False,
-                )
+    @property
+    def server_pid(self) -> Optional[int]:
+        return self.lsp_proc.pid
+
+    def release(self, file_paths: list[str]):
+        for file_path in file_paths:
+            self.documents.close(path2uri(file_path))
 
     def open_file(self, file_path: str) -> str:
         """send a file to LSP server
@@ -147,14 +498,18 @@ class LSPSynchronizer(Synchronizer):
         Returns:
             str: uri of the opened file
         """
-        uri = path2uri(file_path)
-        with open(file_path, "r", errors="replace") as f:
-            text = replace_tabs(f.read())
+        return self.documents.open(file_path)
+
+    def _did_open(self, uri: str, text: str):
         version = 1
         self.lsp_client.didOpen(
             pylspclient.lsp_structs.TextDocumentItem(uri, self.langID, version, text)
         )
-        return uri
+
+    def _did_close(self, uri: str):
+        self.lsp_endpoint.send_notification(
+            "textDocument/didClose", textDocument=TextDocumentIdentifier(uri)
+        )
 
     def get_source_of_call(
         self,
@@ -174,60 +529,109 @@ class LSPSynchronizer(Synchronizer):
         Returns:
             Maybe[tuple[str, str | None]]: the source code and docstring of the called function
         """
+        return self.get_sources_of_calls(
+            [(focal_name, file_path, line, col)], verbose=verbose
+        )[0]
+
+    def get_sources_of_calls(
+        self, calls: list[FocalCall], verbose: bool = False
+    ) -> list[SourceResult]:
+        """get the source code of the functions called at a list of locations,
+        keeping up to self.max_inflight definition requests in flight at once
+
+        Args:
+            calls (list[FocalCall]): [(focal_name, file_path, line, col), ...]
+
+        Returns:
+            list[SourceResult]: results in the order of calls
+        """
+        run = pipeline
+        if not verbose:
+            run = silence(run)
+
+        def lookup(batch: list[FocalCall]) -> list[SourceResult]:
+            self.indexing.wait()
+            return run(
+                batch,
+                self._send_definition,
+                self._receive_definition,
+                Failure,
+                self.max_inflight,
+            )
+
+        return health.replay_lost(
+            calls, lookup(calls), self._crashed, self.restart, lookup
+        )
+
+    def _crashed(self) -> bool:
+        return not self.stopped and self.lsp_proc.poll() is not None
+
+    def _send_definition(self, call: FocalCall) -> Result[tuple[int, float], str]:
+        _, file_path, line, col = call
         try:
             uri = self.open_file(file_path)
+            rpc_id = self.lsp_endpoint.send_request(
+                "textDocument/definition",
+                textDocument=TextDocumentIdentifier(uri),
+                position=Position(line, col),
+            )
+            return Success((rpc_id, time.perf_counter()))
         except Exception as e:  # pylint: disable=broad-exception-caught
             return Failure(str(e))
 
+    def _receive_definition(self, sent: tuple[int, float]) -> SourceResult:
+        rpc_id, sent_at = sent
+        received_at = None
         try:
-            goto_def = self.lsp_client.definition
-            if not verbose:
-                goto_def = silence(goto_def)
-
-            response = goto_def(
-                TextDocumentIdentifier(uri),
-                Position(line, col),
-            )
+            result, error, received_at = self.lsp_endpoint.wait_for_reply(rpc_id)
+            if error:
+                raise response_error(error)
+            response = parse_definition_response(result)
         except Exception as e:  # pylint: disable=broad-exception-caught
             return Failure(str(e))
+        finally:
+            # up to its arrival, not to its turn in the pipeline
+            end = time.perf_counter() if received_at is None else received_at
+            metrics.record("definition", end - sent_at)
 
-        def_location: Location
         match response:
-            case None | []:
+            case []:
                 return Failure(f"No definition found: {response}")
             case [loc, *_]:
-                def_location = loc
-            case loc:
-                if isinstance(loc, Location):
-                    def_location = loc
-                else:
-                    return Failure(f"Unexpected response from LSP server: {loc}")
-
-        file_path = uri2path(def_location.uri).value_or(str(def_location.uri))
-        logging.debug(file_path)
-
-        # check if file path is relative to workspace root
-        if not (
-            file_path.startswith(self.workspace_dir)
-            or file_path.startswith(realpath(self.workspace_dir))
-        ):
-            return Failure(f"Source code not in workspace: {file_path}")
-
-        def not_found_error(_):
-            lineno = def_location.range.start.line
-            col_offset = def_location.range.start.character
-            return f"Source code not found: {file_path}:{lineno}:{col_offset}"
+                return self._source_of_definition(loc)
+            case _:
+                return Failure(f"Unexpected response from LSP server: {response}")
 
-        return (
-            maybe_to_result(get_function_code(def_location, self.langID))
-            .alt(not_found_error)
-            .bind(lambda t: Failure("Empty Source Code") if t[0] == "" else Success(t))
-        )
+    def _source_of_definition(self, def_location: Location) -> SourceResult:
+        return source_of_definition(def_location, self.workspace_dir, self.langID)
 
     def stop(self):
-        self.lsp_client.shutdown()
-        self.lsp_client.exit()
-        self.lsp_proc.kill()
+        if self.monitor is not None:
+            self.monitor.stop()
+        try:
+            rpc_id = self.lsp_endpoint.send_request("shutdown")
+            self.lsp_endpoint.wait_for_response(rpc_id, timeout=STOP_TIMEOUT)
+            self.lsp_endpoint.send_notification("exit")
+        except Exception as e:  # pylint: disable=broad-exception-caught
+            logging.debug(e)
+        self.kill()
+        health.release_cgroup(self.lsp_proc.pid)
+        logging.debug(
+            f"{self.langID} server notifications: {self.notifications.summary()}"
+        )
+
+    def kill(self):
+        self.stopped = True
+        self.recycle()
+
+    def recycle(self):
+        self.indexing.cancel()
+        # a reaped pid may already belong to another process
+        if self.lsp_proc.returncode is None:
+            kill_proc_tree(self.lsp_proc.pid)
+            # reaped before the waiting requests wake up, so _crashed sees it
+            self.lsp_proc.wait()
+        self.lsp_endpoint.abort()
 
 
 def main():
@@ -1,10 +1,14 @@
 """util functions for UniTSyncer backend"""
+
 import threading
 from returns.maybe import Maybe, Nothing, Some
 from pathos.multiprocessing import ProcessPool
 import sys
 import io
+import os
+import signal
 from itertools import chain
+from collections import deque
 from typing import Callable, Iterable, TypeVar, overload
 from functools import reduce
 from operator import add
@@ -14,18 +18,30 @@ from tree_sitter import Node
 
 
 class ReadPipe(threading.Thread):
-    """source:
-    https://github.com/yeger00/pylspclient/blob/master/examples/python-language-server.py#L10
+    """drain a pipe so the process writing it never blocks on a full buffer
+
+    The pipe is read in chunks as they arrive, only the last `tail_chunks` of
+    them are kept, e.g. the stderr of a server that crashed.
     """
 
-    def __init__(self, pipe):
-        threading.Thread.__init__(self)
+    CHUNK_SIZE = 1 << 16
+
+    def __init__(self, pipe, tail_chunks: int = 4):
+        threading.Thread.__init__(self, daemon=True)
         self.pipe = pipe
+        self.tail: deque[bytes] = deque(maxlen=tail_chunks)
 
     def run(self):
-        line = self.pipe.readline().decode("utf-8")
-        while line:
-            line = self.pipe.readline().decode("utf-8")
+        fd = self.pipe.fileno()
+        try:
+            while chunk := os.read(fd, self.CHUNK_SIZE):
+                self.tail.append(chunk)
+        except (OSError, ValueError):
+            pass
+
+    def text(self) -> str:
+        """last output of the pipe"""
+        return b"".join(self.tail).decode("utf-8", errors="replace")
 
 
 def uri2path(uri: str) -> Maybe[str]:
@@ -56,27 +72,128 @@ def replace_tabs(text: str, n_space=4) -> str:
     return text.replace("\t", " " * n_space)
 
 
+_SILENCE_LOCK = threading.Lock()
+_silenced = 0
+_original_stdout = sys.stdout
+
+
 def silence(func):
-    """Execute a function with suppressed stdout."""
+    """Execute a function with suppressed stdout.
+
+    sys.stdout is shared by all threads, so overlapping calls, e.g. from the
+    workdirs of a repo processed in parallel, share one redirection: the first
+    call in swaps stdout, the last one out restores it.
+    """
 
     def wrapper(*args, **kwargs):
-        original_stdout = sys.stdout
+        global _silenced, _original_stdout  # pylint: disable=global-statement
+        with _SILENCE_LOCK:
+            if _silenced == 0:
+                _original_stdout = sys.stdout
+                # Redirect stdout to a dummy file-like object
+                sys.stdout = io.StringIO()
+            _silenced += 1
         try:
-            # Redirect stdout to a dummy file-like object
-            sys.stdout = io.StringIO()
             return func(*args, **kwargs)
         finally:
-            # Restore original stdout
-            sys.stdout = original_stdout
+            with _SILENCE_LOCK:
+                _silenced -= 1
+                if _silenced == 0:
+                    # Restore original stdout
+                    sys.stdout = _original_stdout
 
     return wrapper
 
 
+def dir_size(path: str) -> int:
+    """total size in bytes of the files under path"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                total += os.lstat(os.path.join(root, file)).st_size
+            except OSError:
+                pass
+    return total
+
+
 def convert_to_seconds(s: str) -> int:
     seconds_per_unit = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
     return int(s[:-1]) * seconds_per_unit[s[-1]]
 
 
+def proc_tree_pids(pid: int) -> list[int]:
+    """pids of a process and all of its descendants, [] if the process is gone"""
+    pids = []
+    stack = [pid]
+    while stack:
+        cur = stack.pop()
+        task_dir = f"/proc/{cur}/task"
+        try:
+            tids = os.listdir(task_dir)
+        except OSError:
+            continue
+        pids.append(cur)
+        for tid in tids:
+            try:
+                with open(os.path.join(task_dir, tid, "children")) as f:
+                    stack.extend(int(child) for child in f.read().split())
+            except OSError:
+                continue
+    return pids
+
+
+def proc_tree_rss(pid: int) -> int:
+    """resident set size in bytes of a process and all of its descendants
+
+    language servers are often started through a wrapper script (e.g. java),
+    so the rss of the direct child alone is meaningless
+    """
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    rss = 0
+    for p in proc_tree_pids(pid):
+        try:
+            with open(f"/proc/{p}/statm") as f:
+                rss += int(f.read().split()[1]) * page_size
+        except (OSError, IndexError, ValueError):
+            continue
+    return rss
+
+
+def proc_tree_cpu(pid: int) -> float:
+    """cpu seconds, user and system, used by a process and its descendants"""
+    ticks = os.sysconf("SC_CLK_TCK")
+    total = 0
+    for p in proc_tree_pids(pid):
+        try:
+            with open(f"/proc/{p}/stat") as f:
+                # the command name may contain spaces, fields follow its ")"
+                fields = f.read().rsplit(")", 1)[1].split()
+            total += int(fields[11]) + int(fields[12])
+        except (OSError, IndexError, ValueError):
+            continue
+    return total / ticks
+
+
+def kill_proc_tree(pid: int):
+    """SIGKILL a server started with start_new_session and all of its descendants
+
+    the process group is killed first, descendants that left it, e.g. daemons
+    of a wrapper script, are found through /proc
+    """
+    pids = proc_tree_pids(pid)
+    try:
+        if os.getpgid(pid) == pid:
+            os.killpg(pid, signal.SIGKILL)
+    except OSError:
+        pass
+    for p in pids:
+        try:
+            os.kill(p, signal.SIGKILL)
+        except OSError:
+            continue
+
+
 def get_cpp_func_name(ast_util: ASTUtil, node: Node) -> Maybe[str]:
     """extract function name from function_definition node"""
     for child in node.children:
@@ -0,0 +1,164 @@
+"""per-repo deadline enforced from a timer thread
+
+When the deadline of a repo passes, the synchronizers working on it are
+killed with their whole server process tree, so a hung server no longer
+blocks its worker: pending lookups fail at once and the remaining focal
+objects of the repo are skipped, the results journaled so far are kept.
+
+A repo split into units by the scheduler has one deadline for all of them,
+counted from the start of its first unit, see repo_deadline.
+"""
+import os
+import threading
+import time
+import logging
+from typing import Optional
+import jsonlines
+from unitsyncer.sync import Synchronizer
+
+
+class Deadline:
+    """kill the watched synchronizers once `seconds` have passed
+
+    Args:
+        seconds (float | None): time allowed to the repo, None for no deadline
+        name (str): repo name used in logs
+    """
+
+    def __init__(self, seconds: Optional[float], name: str = "") -> None:
+        self.seconds = seconds
+        self.name = name
+        self.expired = False
+        self.started_at = time.perf_counter()
+        self._syncers: list[Synchronizer] = []
+        self._lock = threading.Lock()
+        self._timer: Optional[threading.Timer] = None
+
+    def __enter__(self) -> "Deadline":
+        self.started_at = time.perf_counter()
+        if self.seconds is not None:
+            self._timer = threading.Timer(self.seconds, self._expire)
+            self._timer.daemon = True
+            self._timer.start()
+        return self
+
+    def __exit__(self, *_):
+        if self._timer is not None:
+            self._timer.cancel()
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started_at
+
+    def watch(self, syncer: Synchronizer):
+        """kill syncer when the deadline passes, at once if it already has"""
+        with self._lock:
+            if not self.expired:
+                self._syncers.append(syncer)
+                return
+        _kill(syncer)
+
+    def unwatch(self, syncer: Synchronizer):
+        """keep a pooled syncer alive after its repo finished in time"""
+        with self._lock:
+            if syncer in self._syncers:
+                self._syncers.remove(syncer)
+
+    def _expire(self):
+        with self._lock:
+            self.expired = True
+            syncers, self._syncers = self._syncers, []
+        logging.warning(f"{self.name} timed out after {self.seconds}s")
+        for syncer in syncers:
+            _kill(syncer)
+
+
+class RepoClock:
+    """start times of the repos of a run, shared by the worker processes
+
+    The first unit of a repo to start stamps it with the wall-clock time, the
+    others, possibly in other workers, read the stamp.
+
+    Args:
+        path (str): directory of the stamps, one run each
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def started_at(self, repo: str) -> float:
+        os.makedirs(self.path, exist_ok=True)
+        stamp = os.path.join(self.path, repo)
+        tmp_path = f"{stamp}.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp_path, "w") as f:
+            f.write(repr(time.time()))
+        try:
+            # a complete stamp appears at once, or not at all if one exists
+            os.link(tmp_path, stamp)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(tmp_path)
+        with open(stamp) as f:
+            return float(f.read())
+
+
+# start times of the repos of the current run, None to time each unit on its own
+CLOCK: Optional[RepoClock] = None
+
+
+def share_deadlines(clock_dir: Optional[str]):
+    """count the deadline of a repo from its first unit, before the workers
+    are forked
+
+    Args:
+        clock_dir (str | None): empty directory of this run, see RepoClock
+    """
+    global CLOCK  # pylint: disable=global-statement
+    CLOCK = None if clock_dir is None else RepoClock(clock_dir)
+
+
+def repo_deadline(repo: str, seconds: Optional[float]) -> Optional[float]:
+    """seconds left to a unit of repo, when the repo is allowed `seconds` in all
+
+    Returns:
+        Optional[float]: None for no deadline, 0 if the repo already ran out
+    """
+    if seconds is None or CLOCK is None:
+        return seconds
+    return max(0.0, CLOCK.started_at(repo) + seconds - time.time())
+
+
+def _kill(syncer: Synchronizer):
+    try:
+        syncer.kill()
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        logging.debug(e)
+
+
+class TimeoutLog:
+    """jsonl log of the repos that ran out of time, with how far they got"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def record(
+        self,
+        repo: str,
+        language: str,
+        workdirs: list[str],
+        elapsed: float,
+        n_done: int,
+        n_focal: int,
+    ):
+        with jsonlines.open(self.path, "a") as f:
+            f.write(
+                {
+                    "repo": repo,
+                    "language": language,
+                    "workdirs": workdirs,
+                    "elapsed": round(elapsed, 3),
+                    "n_done": n_done,
+                    "n_focal": n_focal,
+                }
+            )
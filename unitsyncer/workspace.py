@@ -0,0 +1,40 @@
+"""detection of the build modules that language servers are started in"""
+import functools
+import os
+from returns.maybe import Maybe, Nothing, Some
+
+# a directory with one of these files is a Maven or Gradle (sub)project
+JAVA_BUILD_FILES = (
+    "pom.xml",
+    "build.gradle",
+    "build.gradle.kts",
+    "settings.gradle",
+    "settings.gradle.kts",
+)
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def is_java_module(dir_path: str) -> bool:
+    return any(os.path.isfile(os.path.join(dir_path, f)) for f in JAVA_BUILD_FILES)
+
+
+def java_module_of(repos_root: str, file_path: str) -> Maybe[str]:
+    """innermost Maven/Gradle module containing a file
+
+    The search stops at the repo workdir, i.e. the first two components of
+    file_path, as in `owner-repo/owner-repo-sha/module/src/test/...`.
+
+    Args:
+        repos_root (str): root of all repos
+        file_path (str): path of a file relative to repos_root
+
+    Returns:
+        Maybe[str]: path of the module relative to repos_root
+    """
+    parts = file_path.split("/")
+    # from the directory of the file up to the repo workdir
+    for depth in range(len(parts) - 1, 1, -1):
+        module = "/".join(parts[:depth])
+        if is_java_module(os.path.join(repos_root, module)):
+            return Some(module)
+    return Nothing